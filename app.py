@@ -1,6 +1,15 @@
 # app.py - PROFESSIONAL PHARMACEUTICAL DASHBOARD VERSION
 from login import main_login
-from utils.helpers import DataHelper
+from utils.schema import DataSchema
+from utils.cube import FilterCube
+from utils.filters import BitmapFilterEngine
+from utils.search import PatientSearchIndex
+from utils.sorting import SortPermutationCache
+from utils.export import CsvExportCache
+from utils.jobs import JobQueue, DONE, FAILED
+from utils.reports import ReportBuilder, REPORT_TYPES, REPORT_FORMATS
+from utils.figures import FigureCache
+from utils.cache import ProcessedDataCache
 from calculations import load_and_process_data
 from config import DEFAULT_TRIAL, ACTIVE_TRIALS
 import streamlit as st
@@ -9,7 +18,7 @@ import numpy as np
 from datetime import datetime, timedelta
 import sys
 import os
-import time
+import threading
 import plotly.graph_objects as go
 import plotly.express as px
 
@@ -427,11 +436,150 @@ def load_data(disease=None):
             filtered_queries['query_id'] = [
                 f'QRY-{i:05d}' for i in range(1, len(filtered_queries) + 1)]
 
-        return filtered_patients, filtered_sites, filtered_queries
+        return DataSchema.apply_all(filtered_patients, filtered_sites, filtered_queries)
 
     # For unfiltered data, also ensure it's sequential
     patients = patients.reset_index(drop=True)
-    return patients, sites_df, queries_df
+    return DataSchema.apply_all(patients, sites_df, queries_df)
+
+
+@st.cache_resource
+def load_filter_cube(disease=None):
+    """Build the KPI cube once per dataset"""
+    patients, _, _ = load_data(disease)
+    cube = FilterCube.build(patients)
+    cube.version = load_dataset_version(disease)
+    return cube
+
+
+@st.cache_resource
+def load_filter_engine(disease=None):
+    """Build the sidebar filter indexes once per dataset"""
+    patients, _, _ = load_data(disease)
+    return BitmapFilterEngine(patients)
+
+
+@st.cache_resource
+def load_search_index(disease=None):
+    """Build the patient search index once per dataset"""
+    patients, _, _ = load_data(disease)
+    return PatientSearchIndex(patients)
+
+
+@st.cache_resource
+def load_sort_permutations(disease=None):
+    """Keep per-column sort orders for the patient table, once per dataset"""
+    patients, _, _ = load_data(disease)
+    return SortPermutationCache(patients)
+
+
+@st.cache_resource(max_entries=8)
+def load_date_window_cube(disease, version, date_window):
+    """KPI cube of the patients enrolled in a date window, once per dataset version and window"""
+    patients, _, _ = load_data(disease)
+    positions = load_filter_engine(disease).select(ranges={'enrollment_date': date_window})
+    return FilterCube.build(patients if positions is None else patients.take(positions))
+
+
+@st.cache_resource
+def load_dataset_version(disease=None):
+    """Content hash of the patient and site data, once per dataset"""
+    patients, sites, _ = load_data(disease)
+    return f"{ProcessedDataCache.frame_digest(patients)}-{ProcessedDataCache.frame_digest(sites)}"
+
+
+@st.cache_resource
+def load_export_cache(disease=None):
+    """Keep CSV exports of the patient table, once per dataset"""
+    patients, _, _ = load_data(disease)
+    return CsvExportCache(patients, version=load_dataset_version(disease))
+
+
+@st.cache_resource
+def load_sync_lock(disease=None):
+    """Lock held while the long-lived indexes catch up with reloaded data"""
+    return threading.Lock()
+
+
+def sync_dataset_indexes(disease, patients, cube, search_index):
+    """Bring the cube and search index up to date after a data reload
+
+    Both outlive load_data, so after a reload they are refreshed in place:
+    the cube only re-aggregates patients that were added, changed or removed.
+    The cube's version marks which dataset both reflect.
+    """
+    version = load_dataset_version(disease)
+    if cube.version == version:
+        return
+    with load_sync_lock(disease):
+        if cube.version == version:
+            return
+        if cube.can_refresh(patients):
+            cube.refresh(*cube.changed_rows(patients))
+        else:
+            cube.rebuild(patients)
+        search_index.refresh(patients)
+        cube.version = version
+
+
+def reload_data():
+    """Drop the loaded dataset and everything derived from it, except the indexes that refresh in place"""
+    for loader in (load_data, load_dataset_version, load_filter_engine, load_sort_permutations, load_export_cache):
+        loader.clear()
+
+
+@st.cache_resource
+def load_figure_cache():
+    """One figure cache shared by every session"""
+    return FigureCache()
+
+
+@st.cache_resource
+def load_job_queue():
+    """One background worker pool shared by every session"""
+    return JobQueue()
+
+
+def job_owner(user):
+    """Key of the user's background jobs and result files"""
+    return user.get('username') or st.session_state.get('username') or 'guest'
+
+
+def create_job_panel(user):
+    """Show the user's background jobs with progress and downloads"""
+    jobs = load_job_queue().jobs(job_owner(user))
+    with st.expander(f"📦 Background Jobs ({len(jobs)})", expanded=any(job.active for job in jobs)):
+        if not jobs:
+            st.caption("Reports and Excel exports you start appear here.")
+            return
+        st.button("🔄 Refresh status", key="refresh_jobs")
+        for job in jobs:
+            st.markdown(f"**{job.label}**")
+            if job.active:
+                st.progress(job.progress, text=f"{job.message} ({job.progress:.0%})")
+            elif job.status == DONE:
+                with open(job.path, 'rb') as result_file:
+                    st.download_button(
+                        label=f"📥 {job.file_name}",
+                        data=result_file,
+                        file_name=job.file_name,
+                        mime=job.mime,
+                        key=f"job_{job.job_id}"
+                    )
+            elif job.status == FAILED:
+                st.error(f"❌ {job.error}")
+            else:
+                st.caption(job.message)
+
+
+def submit_job(user, label, file_name, mime, task, *args):
+    """Queue a background job and tell the user where to find it"""
+    job = load_job_queue().submit(job_owner(user), label, file_name, mime, task, *args)
+    if job is None:
+        st.warning("⚠️ You already have several jobs running - wait for one to finish.")
+    else:
+        st.success(f"✅ {label} started - see Background Jobs in the sidebar")
+    return job
 
 
 def create_pharma_header(user):
@@ -734,8 +882,7 @@ def create_sidebar_filters(patients, user, current_disease=None):
         st.markdown("**Date Range**")
         if 'enrollment_date' in patients.columns:
             try:
-                patients['enrollment_date'] = pd.to_datetime(
-                    patients['enrollment_date'])
+                # Already datetime64: dates are converted once at ingest by DataSchema
                 min_date = patients['enrollment_date'].min().date()
                 max_date = patients['enrollment_date'].max().date()
 
@@ -759,24 +906,34 @@ def create_sidebar_filters(patients, user, current_disease=None):
 
             report_type = st.selectbox(
                 "Report Type",
-                ["Executive Summary", "Site Performance",
-                    "Data Quality", "Safety Analysis"],
+                REPORT_TYPES,
                 index=0,  # First item as default
                 key="report_type"
             )
 
             format_type = st.radio(
                 "Format",
-                ["PDF", "Excel", "HTML"],
+                list(REPORT_FORMATS),
                 horizontal=True,
                 index=0,  # First item as default
                 key="format_type"
             )
 
-            if st.button("🔄 Generate Demo Report", type="secondary", key="generate_report"):
-                with st.spinner(f"Creating {report_type} report..."):
-                    time.sleep(2)
-                    st.success(f"✅ {report_type} report generated!")
+            if st.button("🔄 Generate Report", type="secondary", key="generate_report"):
+                # Runs on the worker pool; the result appears under Background Jobs
+                all_patients, all_sites, all_queries = load_data(current_disease)
+                extension, mime = REPORT_FORMATS[format_type]
+                file_name = f"{report_type.lower().replace(' ', '_')}.{extension}"
+                submit_job(user, f"{report_type} ({format_type})", file_name, mime,
+                           ReportBuilder.write_report, report_type, format_type,
+                           all_patients, all_sites, all_queries)
+
+        create_job_panel(user)
+
+        if user.get('role') == 'Admin':
+            if st.button("🔄 Reload data", key="reload_data", help="Pick up new or changed patient records"):
+                reload_data()
+                st.rerun()
 
         # Trial info in sidebar
         st.markdown("---")
@@ -1049,6 +1206,598 @@ def create_sidebar_filters(patients, user, current_disease=None):
     return selected_sites, selected_status, clean_filter, risk_filter, dqi_range, date_range
 
 
+def filtered_frame(view):
+    """The filtered patient rows, materialized the first time a tab needs them"""
+    if view['filtered_patients'] is None:
+        positions = view['filtered_positions']
+        patients = view['patients']
+        view['filtered_patients'] = patients if positions is None else patients.take(positions)
+    return view['filtered_patients']
+
+
+def cached_figure(view, figure_type, build):
+    """Figure(s) for the current dataset and filters, shared across reruns and sessions"""
+    return load_figure_cache().get_or_build(figure_type, view['dataset_version'], view['filter_state'], build)
+
+
+def memoize_tab(view, name, build):
+    """Result of build(), reused across reruns until the filters change"""
+    memo = st.session_state.setdefault('tab_memo', {})
+    if memo.get('filter_key') != view['filter_key']:
+        memo.clear()
+        memo['filter_key'] = view['filter_key']
+    if name not in memo:
+        memo[name] = build()
+    return memo[name]
+
+
+def create_risk_matrix_figure(cube, cube_mask):
+    """Heatmap of filtered patients by risk level and clean status"""
+    risk_matrix = cube.crosstab('risk_level', 'clean_status', mask=cube_mask)
+
+    fig_risk = go.Figure(data=go.Heatmap(
+        z=risk_matrix.values,
+        x=risk_matrix.columns,
+        y=risk_matrix.index,
+        colorscale='Reds',
+        text=risk_matrix.values,
+        texttemplate='%{text}',
+        textfont={"size": 14},
+        hoverinfo='text'
+    ))
+
+    fig_risk.update_layout(
+        height=300,
+        title="Risk Level vs Clean Status Matrix",
+        xaxis_title="Clean Status",
+        yaxis_title="Risk Level"
+    )
+    return fig_risk
+
+
+def create_enrollment_figure(progress):
+    """Gauge of enrollment progress against target"""
+    fig_enroll = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=progress,
+        title={'text': "Enrollment Progress"},
+        gauge={
+            'axis': {'range': [None, 100]},
+            'bar': {'color': "#1f3c88"},
+            'steps': [
+                {'range': [0, 70], 'color': "#f8d7da"},
+                {'range': [70, 90], 'color': "#fff3cd"},
+                {'range': [90, 100], 'color': "#d4edda"}
+            ],
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': 80
+            }
+        }
+    ))
+
+    fig_enroll.update_layout(height=250)
+    return fig_enroll
+
+
+def create_risk_distribution_figure(cube, cube_mask, total):
+    """Bar chart of the share of filtered patients at each risk level"""
+    risk_counts = cube.grouped('risk_level', mask=cube_mask)
+
+    # Calculate percentages
+    risk_data = {
+        'Low': (risk_counts.get('Low', 0) / total * 100),
+        'Medium': (risk_counts.get('Medium', 0) / total * 100),
+        'High': (risk_counts.get('High', 0) / total * 100)
+    }
+
+    fig_risk = go.Figure(data=[go.Bar(
+        x=list(risk_data.keys()),
+        y=list(risk_data.values()),
+        marker_color=['#28a745', '#ffc107',
+                      '#dc3545'],  # Green, Yellow, Red
+        text=[f"{v:.1f}%" for v in risk_data.values()],
+        textposition='auto',
+    )])
+
+    fig_risk.update_layout(
+        height=250,
+        title="Patient Risk Distribution",
+        yaxis_title="Percentage (%)",
+        yaxis_range=[0, 100]
+    )
+    return fig_risk
+
+
+def create_dqi_forecast_figure(cube, cube_mask):
+    """Next month's predicted DQI against the current average"""
+    # Simple trend calculation
+    avg_dqi = cube.measure_mean('dqi_score', mask=cube_mask)
+    # Predict slight improvement
+    predicted = min(avg_dqi + 2.5, 100)
+
+    fig_trend = go.Figure(go.Indicator(
+        mode="number+delta",
+        value=predicted,
+        delta={'reference': avg_dqi, 'position': "top"},
+        title={'text': "Predicted DQI (Next Month)"},
+        domain={'x': [0, 1], 'y': [0, 1]}
+    ))
+
+    fig_trend.update_layout(height=215)
+    return fig_trend
+
+
+def quick_statistics(cube, cube_mask, cube_totals):
+    """Quick statistics of the filtered patients, from the cube"""
+    total_queries = cube_totals.get('total_queries_sum', 0)
+    query_resolution = (cube_totals.get('queries_resolved_sum', 0) / total_queries * 100
+                        ) if total_queries > 0 else 0
+    if 'forms_verified' in cube.measures:
+        # If values are already 0-100%, just take mean; a mean > 100 means wrong values - cap at 100
+        forms_verified = min(cube.measure_mean('forms_verified', mask=cube_mask), 100)
+    else:
+        forms_verified = 0
+    return {
+        'avg_visits': cube.measure_mean('visits_completed', mask=cube_mask),
+        'query_resolution': query_resolution,
+        'forms_verified': forms_verified,
+        'protocol_deviations': int(cube.measure_sum('protocol_deviations', mask=cube_mask)),
+    }
+
+
+def render_performance_tab(view):
+    """Performance charts, quick statistics and the full patient database"""
+    patients, sites, user = view['patients'], view['sites'], view['user']
+    current_disease, search_index = view['current_disease'], view['search_index']
+    cube, cube_mask, cube_totals = view['cube'], view['cube_mask'], view['cube_totals']
+    database_cube, filtered_count = view['database_cube'], view['filtered_count']
+    st.header("Performance Analytics")
+
+    # Show filter status clearly
+    if filtered_count != len(patients):
+        st.success(
+            f"✅ Filters active: Showing {filtered_count} of {len(patients)} patients")
+
+    # Create visualizations (using FILTERED data for charts)
+    fig1, fig2, fig3 = cached_figure(
+        view, 'performance', lambda: create_visualizations(filtered_frame(view), sites))
+
+    # Row 1: Charts
+    col1, col2 = st.columns([3, 2])
+
+    with col1:
+        st.plotly_chart(fig1, width='stretch')
+
+    with col2:
+        st.plotly_chart(fig2, width='stretch')
+
+    # Row 2: Heatmap
+    st.plotly_chart(fig3, width='stretch')
+
+    # Row 3: Quick stats (using FILTERED data)
+    st.subheader("📋 Quick Statistics (Filtered Data)")
+    col1, col2, col3, col4 = st.columns(4)
+
+    quick_stats = memoize_tab(view, 'quick_stats', lambda: quick_statistics(cube, cube_mask, cube_totals))
+
+    with col1:
+        st.metric("Avg Visits Completed", f"{quick_stats['avg_visits']:.1f}")
+
+    with col2:
+        st.metric("Query Resolution", f"{quick_stats['query_resolution']:.1f}%")
+
+    with col3:
+        st.metric("Forms Verified", f"{quick_stats['forms_verified']:.1f}%")
+
+    with col4:
+        st.metric("Protocol Deviations", quick_stats['protocol_deviations'])
+
+    # ========== DATABASE OVERVIEW ==========
+    st.subheader("📋 Complete Database Overview")
+
+    # Show TOTAL database counts
+    database_summary = database_cube.summary()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Patients", len(patients))
+    with col2:
+        st.metric("Active Patients", database_summary['active_patients'])
+    with col3:
+        st.metric("Clean Patients", database_summary['clean_patients'])
+    with col4:
+        total_high_risk = int(database_cube.grouped('risk_level').get('High', 0))
+        st.metric("High Risk Patients", total_high_risk)
+
+    # Show ALL PATIENTS with pagination
+    st.subheader("👥 Complete Patient Database")
+
+    # Add search for ALL patients
+    search_all = st.text_input("🔍 Search all patients...",
+                               placeholder="Search in entire database (e.g. site:Site_A active)",
+                               key="search_all_patients")
+
+    all_matches = search_index.search(search_all)
+    if all_matches is not None:
+        display_all_patients = patients.take(all_matches)
+    else:
+        display_all_patients = patients
+
+    # Select columns to show - CHECK WHICH COLUMNS EXIST
+    # Common patient columns that should exist
+    available_columns = []
+    possible_columns = ['patient_id', 'site_id', 'subject_status',
+                        'clean_status', 'dqi_score', 'risk_level',
+                        'missing_visits', 'open_queries', 'visits_completed',
+                        'total_queries', 'safety_issues']
+
+    # Check which columns actually exist in the data
+    for col in possible_columns:
+        if col in patients.columns:
+            available_columns.append(col)
+
+    # If no columns found, use a basic set
+    if not available_columns:
+        available_columns = list(patients.columns[:5])  # First 5 columns
+
+    # Show ALL patients with responsive container
+    st.markdown(f"**Total records:** {len(display_all_patients)} patients")
+
+    # Add pagination for all patients
+    if len(display_all_patients) > 0:
+        # Rows per page selector
+        rows_per_page_all = st.selectbox("Rows per page:",
+                                         [10, 25, 50, 100, 250, 500],
+                                         key="rows_per_page_all",
+                                         index=3)  # Default to 100
+
+        # Calculate pagination
+        total_pages_all = max(
+            1, (len(display_all_patients) // rows_per_page_all) + 1)
+        page_all = st.number_input("Page:",
+                                   min_value=1,
+                                   max_value=total_pages_all,
+                                   value=1,
+                                   key="page_all")
+
+        start_idx_all = (page_all - 1) * rows_per_page_all
+        end_idx_all = min(start_idx_all + rows_per_page_all,
+                          len(display_all_patients))
+
+        # Display ALL patients table with error handling
+        try:
+            st.markdown("""
+            <div style="overflow-x: auto; margin: 0 -1rem; padding: 0 1rem;">
+            """, unsafe_allow_html=True)
+
+            st.dataframe(
+                display_all_patients.iloc[start_idx_all:
+                                          end_idx_all][available_columns],
+                # width='stretch',
+                height=400
+            )
+
+            st.markdown("</div>", unsafe_allow_html=True)
+
+            st.caption(
+                f"Showing patients {start_idx_all + 1} to {end_idx_all} of {len(display_all_patients)}")
+
+        except Exception as e:
+            st.error(f"Error displaying data: {e}")
+            # Show raw data as fallback
+            st.write("Showing raw data (first 100 rows):")
+            st.dataframe(display_all_patients.head(100))
+
+        # Download all data button
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📥 Download All Patients (CSV)", key="download_all"):
+                csv_path = load_export_cache(current_disease).export(
+                    all_matches, patients.columns)
+                with open(csv_path, 'rb') as csv_file:
+                    st.download_button(
+                        label="Click to Download",
+                        data=csv_file,
+                        file_name="all_patients_database.csv",
+                        mime="text/csv",
+                        key="download_all_btn"
+                    )
+
+        with col2:
+            if st.button("📊 Export All to Excel", key="export_all_excel"):
+                submit_job(user, "All patients (Excel)", "all_patients_database.xlsx",
+                           REPORT_FORMATS['Excel'][1], ReportBuilder.export_patients_excel,
+                           patients, all_matches, patients.columns)
+
+    # Show what percentage is filtered
+    if filtered_count != len(patients):
+        filter_percentage = (filtered_count / len(patients)) * 100
+        st.info(
+            f"📊 **Current filtered view:** {filtered_count} patients ({filter_percentage:.1f}% of total database)")
+
+
+def render_patient_tab(view):
+    """Searchable, sortable patient table"""
+    patients, user, current_disease = view['patients'], view['user'], view['current_disease']
+    filtered_positions, search_index = view['filtered_positions'], view['search_index']
+    st.header("Patient Management")
+
+    # Search and controls
+    col1, col2, col3 = st.columns([3, 2, 1])
+
+    with col1:
+        search_query = st.text_input(
+            "🔍 Search patients...", placeholder="Search by ID, site, status, disease or CRA (e.g. site:Site_A)")
+
+    with col2:
+        items_per_page = st.selectbox("Rows per page", [10, 25, 50, 100])
+
+    with col3:
+        if st.button("📋 Column Toggles"):
+            st.session_state['show_column_toggles'] = not st.session_state.get(
+                'show_column_toggles', False)
+
+    # Apply search, restricted to the rows the sidebar filters kept
+    display_positions = filtered_positions
+    search_matches = search_index.search(search_query)
+    if search_matches is not None:
+        if filtered_positions is not None:
+            search_matches = np.intersect1d(filtered_positions, search_matches, assume_unique=True)
+        display_positions = search_matches
+    total_rows = len(patients) if display_positions is None else len(display_positions)
+
+    # Column selection
+    if st.session_state.get('show_column_toggles', False):
+        st.subheader("Select Columns to Display")
+        all_columns = patients.columns.tolist()
+        default_columns = ['patient_id', 'site_id', 'subject_status',
+                           'clean_status', 'dqi_score', 'risk_level']
+        selected_columns = st.multiselect(
+            "Choose columns",
+            options=all_columns,
+            default=default_columns
+        )
+    else:
+        selected_columns = ['patient_id', 'site_id', 'subject_status',
+                            'clean_status', 'dqi_score', 'risk_level', 'missing_visits', 'open_queries']
+
+    # Display data table
+    if total_rows > 0:
+        display_cols = [
+            col for col in selected_columns if col in patients.columns]
+
+        # Sort options
+        sort_by = st.selectbox("Sort by", options=display_cols, index=display_cols.index(
+            'dqi_score') if 'dqi_score' in display_cols else 0)
+        sort_order = st.radio(
+            "Order", ["Descending", "Ascending"], horizontal=True)
+        ascending = sort_order == "Ascending"
+        sort_permutations = load_sort_permutations(current_disease)
+
+        # Pagination
+        page_number = st.number_input("Page", min_value=1, value=1, max_value=max(
+            1, (total_rows // items_per_page) + 1))
+
+        start_idx = (page_number - 1) * items_per_page
+        end_idx = min(start_idx + items_per_page, total_rows)
+
+        # Only the rows of this page are sorted, from the cached column order
+        page_positions = sort_permutations.page(
+            sort_by, ascending, start_idx, end_idx, display_positions)
+
+        # Display table with responsive container - ONLY ONCE
+        st.markdown("""
+        <div style="overflow-x: auto; margin: 0 -1rem; padding: 0 1rem;">
+        """, unsafe_allow_html=True)
+
+        st.dataframe(
+            patients.take(page_positions)[display_cols],
+            # width='stretch',
+            height=400
+        )
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        st.caption(
+            f"Showing rows {start_idx + 1} to {end_idx} of {total_rows}")
+
+        # Export options
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📊 Export to Excel"):
+                export_positions = sort_permutations.sorted_positions(
+                    sort_by, ascending, display_positions)
+                submit_job(user, "Patient table (Excel)", "patient_data.xlsx",
+                           REPORT_FORMATS['Excel'][1], ReportBuilder.export_patients_excel,
+                           patients, export_positions, display_cols)
+
+        with col2:
+            # Written only when asked for, and reused for the same rows and columns
+            if st.button("📥 Download CSV", key="download_filtered"):
+                export_positions = sort_permutations.sorted_positions(
+                    sort_by, ascending, display_positions)
+                csv_path = load_export_cache(current_disease).export(
+                    export_positions, display_cols)
+                with open(csv_path, 'rb') as csv_file:
+                    st.download_button(
+                        label="Click to Download",
+                        data=csv_file,
+                        file_name="patient_data.csv",
+                        mime="text/csv",
+                        key="download_filtered_btn"
+                    )
+
+
+def site_metrics_grid(sites, columns):
+    """Site comparison grid with formatted percentages and scores"""
+    metrics_grid = sites[columns].copy()
+
+    if 'clean_percentage' in metrics_grid.columns:
+        metrics_grid['clean_percentage'] = metrics_grid['clean_percentage'].apply(
+            lambda x: f"{x:.1f}%" if pd.notna(x) else "N/A"
+        )
+
+    if 'avg_dqi' in metrics_grid.columns:
+        metrics_grid['avg_dqi'] = metrics_grid['avg_dqi'].apply(
+            lambda x: f"{x:.1f}" if pd.notna(x) else "N/A"
+        )
+    return metrics_grid
+
+
+def render_site_tab(view):
+    """Site comparison grid and drill-down"""
+    sites, cube, cube_mask = view['sites'], view['cube'], view['cube_mask']
+    st.header("Site Performance Analytics")
+
+    if not sites.empty and len(sites) > 0:
+        # Site comparison grid
+        st.subheader("Site Comparison")
+
+        available_cols = []
+        for col in ['site_id', 'region', 'total_patients_enrolled',
+                    'clean_percentage', 'avg_dqi', 'total_open_queries',
+                    'performance_status']:
+            if col in sites.columns:
+                available_cols.append(col)
+
+        if available_cols:
+            metrics_grid = memoize_tab(view, 'site_grid', lambda: site_metrics_grid(sites, available_cols))
+
+            st.dataframe(
+                metrics_grid, height=300)
+
+        # Site drill-down
+        st.subheader("Site Drill-down Analysis")
+
+        if 'site_id' in sites.columns:
+            site_options = sorted(sites['site_id'].unique())
+            selected_site = st.selectbox(
+                "Select site for detailed analysis",
+                options=site_options
+            )
+
+            if selected_site:
+                site_info = sites[sites['site_id'] == selected_site]
+                if not site_info.empty:
+                    site_row = site_info.iloc[0]
+                    site_active = memoize_tab(view, 'site_active', lambda: cube.grouped(
+                        'site_id', mask=cube_mask, where=('subject_status', 'Active')))
+
+                    # Site details in columns
+                    col1, col2, col3 = st.columns(3)
+
+                    with col1:
+                        st.metric("Total Patients", site_row.get(
+                            'total_patients_enrolled', 0))
+                        st.metric("Active Patients", int(site_active.get(selected_site, 0)))
+
+                    with col2:
+                        st.metric(
+                            "Clean Percentage", f"{site_row.get('clean_percentage', 0):.1f}%")
+                        st.metric(
+                            "Avg DQI", f"{site_row.get('avg_dqi', 0):.1f}")
+
+                    with col3:
+                        st.metric("Open Issues", site_row.get(
+                            'total_open_queries', 0))
+                        st.metric("Safety Issues", site_row.get(
+                            'total_safety_issues', 0))
+
+
+def render_risk_tab(view):
+    """Risk matrix"""
+    patients, cube, cube_mask = view['patients'], view['cube'], view['cube_mask']
+    st.header("Risk Monitoring & Alerts")
+
+    # Risk Matrix
+    st.subheader("📊 Risk Matrix")
+
+    if 'risk_level' in patients.columns and 'clean_status' in patients.columns:
+        fig_risk = cached_figure(view, 'risk_matrix', lambda: create_risk_matrix_figure(cube, cube_mask))
+
+        st.plotly_chart(fig_risk)
+
+
+def render_insights_tab(view):
+    """Forecasts and predictive alerts"""
+    patients, sites, summary = view['patients'], view['sites'], view['summary']
+    cube, cube_mask = view['cube'], view['cube_mask']
+    st.header("AI-Powered Insights & Reports")
+
+    # Predictive analytics
+    st.subheader("📈 Predictive Analytics")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Enrollment prediction - FIXED
+        st.markdown("#### Enrollment Forecast")
+        current = summary['total_patients']
+        target = DEFAULT_TRIAL['target_patients']
+
+        # Calculate progress, but CAP at 100%
+        # <-- ADDED min() function
+        progress = min((current / target) * 100, 100)
+
+        # Show warning if over-enrolled
+        if current > target:
+            st.warning(f"⚠️ Over-enrolled by {current - target} patients")
+
+        fig_enroll = cached_figure(view, 'enrollment_forecast', lambda: create_enrollment_figure(progress))
+        st.plotly_chart(fig_enroll)  # <-- KEEP THIS, it belongs to col1
+
+    with col2:
+        # Risk prediction
+        st.markdown("#### Risk Prediction")
+
+        if 'risk_level' in patients.columns and summary['total_patients'] > 0:
+            fig_risk = cached_figure(view, 'risk_distribution', lambda: create_risk_distribution_figure(
+                cube, cube_mask, summary['total_patients']))
+
+            st.plotly_chart(fig_risk, width='stretch')
+        else:
+            st.info("Risk level data not available")
+
+    # Add another row for more AI insights
+    st.markdown("---")
+    st.subheader("📊 Predictive Analytics")
+
+    col3, col4 = st.columns(2)
+
+    with col3:
+        # DQI Trend Prediction
+        st.markdown("#### DQI Trend Forecast")
+
+        if 'dqi_score' in patients.columns and summary['total_patients'] > 0:
+            fig_trend = cached_figure(view, 'dqi_forecast', lambda: create_dqi_forecast_figure(cube, cube_mask))
+            st.plotly_chart(fig_trend)
+        else:
+            st.info("DQI data not available")
+
+    with col4:
+        # Site Performance Prediction
+        st.markdown("#### Site Performance Alert")
+
+        if not sites.empty and 'performance_status' in sites.columns:
+            poor_sites = sites[sites['performance_status'].isin(
+                ['Poor', 'Needs Improvement'])]
+
+            if len(poor_sites) > 0:
+                st.error(f"🚨 {len(poor_sites)} sites need attention")
+                for idx, site in poor_sites.iterrows():
+                    st.write(
+                        f"• **{site['site_id']}**: {site.get('performance_status', 'N/A')}")
+            else:
+                st.success("✅ All sites performing well")
+        else:
+            st.info("Site performance data not available")
+
+
+TAB_RENDERERS = [render_performance_tab, render_patient_tab, render_site_tab,
+                 render_risk_tab, render_insights_tab]
+
+
 def main_dashboard():
     """Main dashboard function"""
 
@@ -1108,34 +1857,46 @@ def main_dashboard():
     selected_sites, selected_status, clean_filter, risk_filter, dqi_range, date_range = create_sidebar_filters(
         patients, user, current_disease)
 
-    # Apply filters
-    filtered_patients = patients.copy()
-
-    if selected_sites and len(selected_sites) > 0:
-        filtered_patients = filtered_patients[filtered_patients['site_id'].isin(
-            selected_sites)]
-
-    if selected_status and len(selected_status) > 0:
-        filtered_patients = filtered_patients[filtered_patients['subject_status'].isin(
-            selected_status)]
-
-    if clean_filter == 'Clean Only':
-        filtered_patients = filtered_patients[filtered_patients['clean_status'] == 'Clean']
-    elif clean_filter == 'Issues Only':
-        filtered_patients = filtered_patients[filtered_patients['clean_status'] == 'Not Clean']
-
-    if risk_filter and len(risk_filter) > 0:
-        filtered_patients = filtered_patients[filtered_patients['risk_level'].isin(
-            risk_filter)]
-
-    if 'dqi_score' in filtered_patients.columns:
-        filtered_patients = filtered_patients[
-            (filtered_patients['dqi_score'] >= dqi_range[0]) &
-            (filtered_patients['dqi_score'] <= dqi_range[1])
-        ]
-
-    # Calculate metrics
-    summary = DataHelper.calculate_summary_statistics(filtered_patients)
+    # Apply filters with the bitmap index; only the final selection is materialized
+    sidebar_filters = {
+        'site_id': selected_sites,
+        'subject_status': selected_status,
+        'clean_status': {'Clean Only': ['Clean'], 'Issues Only': ['Not Clean']}.get(clean_filter),
+        'risk_level': risk_filter,
+    }
+    # The date picker returns a single date while a range is still being picked
+    date_window = tuple(date_range) if isinstance(date_range, (list, tuple)) and len(date_range) == 2 else None
+    sidebar_ranges = {'dqi_score': dqi_range, 'enrollment_date': date_window}
+    filter_engine = load_filter_engine(current_disease)
+    filtered_positions = filter_engine.select(sidebar_filters, sidebar_ranges)
+    # Materialized only by the tabs that need rows, not on every rerun
+    filtered_patients = None
+    search_index = load_search_index(current_disease)
+
+    # Calculate metrics from the pre-aggregated cube instead of re-scanning patients
+    database_cube = load_filter_cube(current_disease)
+    sync_dataset_indexes(current_disease, patients, database_cube, search_index)
+    dataset_version = load_dataset_version(current_disease)
+    cube = database_cube
+    if (date_window is not None and 'enrollment_date' in filter_engine.sorted_indexes
+            and not filter_engine.covers_all('enrollment_date', date_window)):
+        # The cube has no date dimension; use a cube of the window's patients,
+        # kept across reruns, and apply the other filters to it as usual
+        cube = load_date_window_cube(current_disease, dataset_version, date_window)
+    cube_mask = cube.mask(sidebar_filters, dqi_range)
+    # Tabs reuse their figures and results until any of these change
+    filter_state = {
+        'disease': current_disease,
+        'sites': selected_sites,
+        'statuses': selected_status,
+        'clean': clean_filter,
+        'risk_levels': risk_filter,
+        'dqi_range': dqi_range,
+        'date_window': date_window,
+    }
+    filter_key = FigureCache.figure_key('filters', dataset_version, filter_state)
+    summary = cube.summary(sidebar_filters, dqi_range)
+    cube_totals = cube.totals(mask=cube_mask)
 
     # Add this RIGHT AFTER calculating summary in main_dashboard():
     # st.write("🔍 DEBUG - Forms Verified values:")
@@ -1161,8 +1922,7 @@ def main_dashboard():
         with metric_cols[0]:
             # Total Patients Card
             total_patients = summary['total_patients']
-            active_patients = len(filtered_patients[filtered_patients['subject_status']
-                                                    == 'Active']) if 'subject_status' in filtered_patients.columns else 0
+            active_patients = summary['active_patients']
             delta = f"+{int(total_patients * 0.1)}" if total_patients > 0 else "0"
             st.markdown(create_metric_card(
                 "Total Patients",
@@ -1193,8 +1953,7 @@ def main_dashboard():
         with metric_cols[0]:
             # Total Patients Card
             total_patients = summary['total_patients']
-            active_patients = len(filtered_patients[filtered_patients['subject_status']
-                                                    == 'Active']) if 'subject_status' in filtered_patients.columns else 0
+            active_patients = summary['active_patients']
             delta = f"+{int(total_patients * 0.1)}" if total_patients > 0 else "0"
             st.markdown(create_metric_card(
                 "Total Patients",
@@ -1254,14 +2013,14 @@ def main_dashboard():
 
     st.markdown("---")
 
-    # Main Tabs - adjust based on device
+    # Main sections - adjust labels based on device. Only the selected
+    # section is built on each rerun, unlike st.tabs which runs every tab.
     mobile = is_mobile()
 
     if mobile:
         # For mobile, use shorter tab names
         tab_labels = ["📈 Perf", "👥 Patients",
                       "🏥 Sites", "🚨 Risk", "🤖 AI"]
-        tab1, tab2, tab3, tab4, tab5 = st.tabs(tab_labels)
     else:
         # For desktop, use full names
         tab_labels = [
@@ -1270,523 +2029,35 @@ def main_dashboard():
             "🏥 Site Analytics",
             "🚨 Risk Monitoring",
             "🤖 AI Insights",
-
         ]
-        tab1, tab2, tab3, tab4, tab5 = st.tabs(tab_labels)
-
-    # ... rest of your tabs code continues ...
-
-        # TAB 1: Performance Dashboard
-    with tab1:
-        st.header("Performance Analytics")
-
-        # Show filter status clearly
-        if len(filtered_patients) != len(patients):
-            st.success(
-                f"✅ Filters active: Showing {len(filtered_patients)} of {len(patients)} patients")
-
-        # Create visualizations (using FILTERED data for charts)
-        fig1, fig2, fig3 = create_visualizations(filtered_patients, sites)
-
-        # Row 1: Charts
-        col1, col2 = st.columns([3, 2])
-
-        with col1:
-            st.plotly_chart(fig1, width='stretch')
-
-        with col2:
-            st.plotly_chart(fig2, width='stretch')
-
-        # Row 2: Heatmap
-        st.plotly_chart(fig3, width='stretch')
-
-        # Row 3: Quick stats (using FILTERED data)
-        st.subheader("📋 Quick Statistics (Filtered Data)")
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            avg_visits = filtered_patients['visits_completed'].mean(
-            ) if 'visits_completed' in filtered_patients.columns else 0
-            st.metric("Avg Visits Completed", f"{avg_visits:.1f}")
-
-        with col2:
-            query_resolution = (filtered_patients['queries_resolved'].sum() / filtered_patients['total_queries'].sum(
-            ) * 100) if 'total_queries' in filtered_patients.columns and filtered_patients['total_queries'].sum() > 0 else 0
-            st.metric("Query Resolution", f"{query_resolution:.1f}%")
-
-        with col3:
-            if 'forms_verified' in filtered_patients.columns:
-                # If values are already 0-100%, just take mean
-                forms_verified = filtered_patients['forms_verified'].mean()
-
-                # If mean is > 100, values are wrong - cap at 100
-                if forms_verified > 100:
-                    forms_verified = 100
-            else:
-                forms_verified = 0
-            st.metric("Forms Verified", f"{forms_verified:.1f}%")
-
-        with col4:
-            protocol_deviations = filtered_patients['protocol_deviations'].sum(
-            ) if 'protocol_deviations' in filtered_patients.columns else 0
-            st.metric("Protocol Deviations", protocol_deviations)
-
-        # ========== DATABASE OVERVIEW ==========
-        st.subheader("📋 Complete Database Overview")
-
-        # Show TOTAL database counts
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("Total Patients", len(patients))
-        with col2:
-            total_active = len(patients[patients['subject_status'] ==
-                               'Active']) if 'subject_status' in patients.columns else 0
-            st.metric("Active Patients", total_active)
-        with col3:
-            total_clean = len(patients[patients['clean_status'] == 'Clean']
-                              ) if 'clean_status' in patients.columns else 0
-            st.metric("Clean Patients", total_clean)
-        with col4:
-            total_high_risk = len(
-                patients[patients['risk_level'] == 'High']) if 'risk_level' in patients.columns else 0
-            st.metric("High Risk Patients", total_high_risk)
-
-        # Show ALL PATIENTS with pagination
-        st.subheader("👥 Complete Patient Database")
-
-        # Add search for ALL patients
-        search_all = st.text_input("🔍 Search all patients...",
-                                   placeholder="Search in entire database",
-                                   key="search_all_patients")
-
-        if search_all and len(search_all) > 0:
-            search_mask = patients.apply(
-                lambda row: search_all.lower() in str(row).lower(), axis=1
-            )
-            display_all_patients = patients[search_mask]
-        else:
-            display_all_patients = patients
-
-        # Select columns to show - CHECK WHICH COLUMNS EXIST
-        # Common patient columns that should exist
-        available_columns = []
-        possible_columns = ['patient_id', 'site_id', 'subject_status',
-                            'clean_status', 'dqi_score', 'risk_level',
-                            'missing_visits', 'open_queries', 'visits_completed',
-                            'total_queries', 'safety_issues']
-
-        # Check which columns actually exist in the data
-        for col in possible_columns:
-            if col in patients.columns:
-                available_columns.append(col)
-
-        # If no columns found, use a basic set
-        if not available_columns:
-            available_columns = list(patients.columns[:5])  # First 5 columns
-
-        # Show ALL patients with responsive container
-        st.markdown(f"**Total records:** {len(display_all_patients)} patients")
-
-        # Add pagination for all patients
-        if len(display_all_patients) > 0:
-            # Rows per page selector
-            rows_per_page_all = st.selectbox("Rows per page:",
-                                             [10, 25, 50, 100, 250, 500],
-                                             key="rows_per_page_all",
-                                             index=3)  # Default to 100
-
-            # Calculate pagination
-            total_pages_all = max(
-                1, (len(display_all_patients) // rows_per_page_all) + 1)
-            page_all = st.number_input("Page:",
-                                       min_value=1,
-                                       max_value=total_pages_all,
-                                       value=1,
-                                       key="page_all")
-
-            start_idx_all = (page_all - 1) * rows_per_page_all
-            end_idx_all = min(start_idx_all + rows_per_page_all,
-                              len(display_all_patients))
-
-            # Display ALL patients table with error handling
-            try:
-                st.markdown("""
-                <div style="overflow-x: auto; margin: 0 -1rem; padding: 0 1rem;">
-                """, unsafe_allow_html=True)
-
-                st.dataframe(
-                    display_all_patients.iloc[start_idx_all:
-                                              end_idx_all][available_columns],
-                    # width='stretch',
-                    height=400
-                )
-
-                st.markdown("</div>", unsafe_allow_html=True)
-
-                st.caption(
-                    f"Showing patients {start_idx_all + 1} to {end_idx_all} of {len(display_all_patients)}")
-
-            except Exception as e:
-                st.error(f"Error displaying data: {e}")
-                # Show raw data as fallback
-                st.write("Showing raw data (first 100 rows):")
-                st.dataframe(display_all_patients.head(100))
-
-            # Download all data button
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("📥 Download All Patients (CSV)", key="download_all"):
-                    csv_all = display_all_patients.to_csv(index=False)
-                    st.download_button(
-                        label="Click to Download",
-                        data=csv_all,
-                        file_name="all_patients_database.csv",
-                        mime="text/csv",
-                        key="download_all_btn"
-                    )
-
-            with col2:
-                if st.button("📊 Export All to Excel", key="export_all_excel"):
-                    display_all_patients.to_excel(
-                        'all_patients_database.xlsx', index=False)
-                    st.success("✅ All patients exported to Excel!")
-
-        # Show what percentage is filtered
-        if len(filtered_patients) != len(patients):
-            filter_percentage = (len(filtered_patients) / len(patients)) * 100
-            st.info(
-                f"📊 **Current filtered view:** {len(filtered_patients)} patients ({filter_percentage:.1f}% of total database)")
-
-    # TAB 2: Patient Management
-    with tab2:
-        st.header("Patient Management")
-
-        # Search and controls
-        col1, col2, col3 = st.columns([3, 2, 1])
-
-        with col1:
-            search_query = st.text_input(
-                "🔍 Search patients...", placeholder="Search by ID, site, or status")
-
-        with col2:
-            items_per_page = st.selectbox("Rows per page", [10, 25, 50, 100])
-
-        with col3:
-            if st.button("📋 Column Toggles"):
-                st.session_state['show_column_toggles'] = not st.session_state.get(
-                    'show_column_toggles', False)
-
-        # Apply search
-        if search_query and len(search_query) > 0:
-            search_mask = filtered_patients.apply(
-                lambda row: search_query.lower() in str(row).lower(), axis=1
-            )
-            display_patients = filtered_patients[search_mask]
-        else:
-            display_patients = filtered_patients
-
-        # Column selection
-        if st.session_state.get('show_column_toggles', False):
-            st.subheader("Select Columns to Display")
-            all_columns = display_patients.columns.tolist()
-            default_columns = ['patient_id', 'site_id', 'subject_status',
-                               'clean_status', 'dqi_score', 'risk_level']
-            selected_columns = st.multiselect(
-                "Choose columns",
-                options=all_columns,
-                default=default_columns
-            )
-        else:
-            selected_columns = ['patient_id', 'site_id', 'subject_status',
-                                'clean_status', 'dqi_score', 'risk_level', 'missing_visits', 'open_queries']
-
-        # Display data table
-        if len(display_patients) > 0:
-            display_cols = [
-                col for col in selected_columns if col in display_patients.columns]
-
-            # Sort options - THIS MUST COME BEFORE USING sorted_df
-            sort_by = st.selectbox("Sort by", options=display_cols, index=display_cols.index(
-                'dqi_score') if 'dqi_score' in display_cols else 0)
-            sort_order = st.radio(
-                "Order", ["Descending", "Ascending"], horizontal=True)
-
-            sorted_df = display_patients.sort_values(
-                sort_by,
-                ascending=(sort_order == "Ascending")
-            )
-
-            # Pagination
-            total_rows = len(sorted_df)
-            page_number = st.number_input("Page", min_value=1, value=1, max_value=max(
-                1, (total_rows // items_per_page) + 1))
-
-            start_idx = (page_number - 1) * items_per_page
-            end_idx = min(start_idx + items_per_page, total_rows)
-
-            # Display table with responsive container - ONLY ONCE
-            st.markdown("""
-            <div style="overflow-x: auto; margin: 0 -1rem; padding: 0 1rem;">
-            """, unsafe_allow_html=True)
-
-            st.dataframe(
-                sorted_df.iloc[start_idx:end_idx][display_cols],
-                # width='stretch',
-                height=400
-            )
-
-            st.markdown("</div>", unsafe_allow_html=True)
-
-            st.caption(
-                f"Showing rows {start_idx + 1} to {end_idx} of {total_rows}")
-
-            # Export options
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("📊 Export to Excel"):
-                    sorted_df[display_cols].to_excel(
-                        'patient_data.xlsx', index=False)
-                    st.success("✅ Exported to patient_data.xlsx")
-
-            with col2:
-                csv = sorted_df[display_cols].to_csv(index=False)
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=csv,
-                    file_name="patient_data.csv",
-                    mime="text/csv"
-                )
-
-    # TAB 3: Site Analytics
-    with tab3:
-        st.header("Site Performance Analytics")
-
-        if not sites.empty and len(sites) > 0:
-            # Site comparison grid
-            st.subheader("Site Comparison")
-
-            available_cols = []
-            for col in ['site_id', 'region', 'total_patients_enrolled',
-                        'clean_percentage', 'avg_dqi', 'total_open_queries',
-                        'performance_status']:
-                if col in sites.columns:
-                    available_cols.append(col)
-
-            if available_cols:
-                metrics_grid = sites[available_cols].copy()
-
-                if 'clean_percentage' in metrics_grid.columns:
-                    metrics_grid['clean_percentage'] = metrics_grid['clean_percentage'].apply(
-                        lambda x: f"{x:.1f}%" if pd.notna(x) else "N/A"
-                    )
-
-                if 'avg_dqi' in metrics_grid.columns:
-                    metrics_grid['avg_dqi'] = metrics_grid['avg_dqi'].apply(
-                        lambda x: f"{x:.1f}" if pd.notna(x) else "N/A"
-                    )
-
-                st.dataframe(
-                    metrics_grid, height=300)
-
-            # Site drill-down
-            st.subheader("Site Drill-down Analysis")
-
-            if 'site_id' in sites.columns:
-                site_options = sorted(sites['site_id'].unique())
-                selected_site = st.selectbox(
-                    "Select site for detailed analysis",
-                    options=site_options
-                )
-
-                if selected_site:
-                    site_info = sites[sites['site_id'] == selected_site]
-                    if not site_info.empty:
-                        site_row = site_info.iloc[0]
-                        site_patients = filtered_patients[filtered_patients['site_id']
-                                                          == selected_site]
-
-                        # Site details in columns
-                        col1, col2, col3 = st.columns(3)
-
-                        with col1:
-                            st.metric("Total Patients", site_row.get(
-                                'total_patients_enrolled', 0))
-                            st.metric("Active Patients", len(
-                                site_patients[site_patients['subject_status'] == 'Active']) if 'subject_status' in site_patients.columns else 0)
-
-                        with col2:
-                            st.metric(
-                                "Clean Percentage", f"{site_row.get('clean_percentage', 0):.1f}%")
-                            st.metric(
-                                "Avg DQI", f"{site_row.get('avg_dqi', 0):.1f}")
-
-                        with col3:
-                            st.metric("Open Issues", site_row.get(
-                                'total_open_queries', 0))
-                            st.metric("Safety Issues", site_row.get(
-                                'total_safety_issues', 0))
-
-    # TAB 4: Risk Monitoring
-    with tab4:
-        st.header("Risk Monitoring & Alerts")
-
-        # Risk Matrix
-        st.subheader("📊 Risk Matrix")
-
-        if 'risk_level' in filtered_patients.columns and 'clean_status' in filtered_patients.columns:
-            risk_matrix = filtered_patients.groupby(
-                ['risk_level', 'clean_status']).size().unstack(fill_value=0)
-
-            fig_risk = go.Figure(data=go.Heatmap(
-                z=risk_matrix.values,
-                x=risk_matrix.columns,
-                y=risk_matrix.index,
-                colorscale='Reds',
-                text=risk_matrix.values,
-                texttemplate='%{text}',
-                textfont={"size": 14},
-                hoverinfo='text'
-            ))
-
-            fig_risk.update_layout(
-                height=300,
-                title="Risk Level vs Clean Status Matrix",
-                xaxis_title="Clean Status",
-                yaxis_title="Risk Level"
-            )
-
-            st.plotly_chart(fig_risk)
-
-    # TAB 5: AI Insights
-    with tab5:
-        st.header("AI-Powered Insights & Reports")
-
-        # Predictive analytics
-        st.subheader("📈 Predictive Analytics")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Enrollment prediction - FIXED
-            st.markdown("#### Enrollment Forecast")
-            current = summary['total_patients']
-            target = DEFAULT_TRIAL['target_patients']
-
-            # Calculate progress, but CAP at 100%
-            # <-- ADDED min() function
-            progress = min((current / target) * 100, 100)
-
-            # Show warning if over-enrolled
-            if current > target:
-                st.warning(f"⚠️ Over-enrolled by {current - target} patients")
-
-            fig_enroll = go.Figure(go.Indicator(
-                mode="gauge+number",
-                value=progress,
-                title={'text': "Enrollment Progress"},
-                gauge={
-                    'axis': {'range': [None, 100]},
-                    'bar': {'color': "#1f3c88"},
-                    'steps': [
-                        {'range': [0, 70], 'color': "#f8d7da"},
-                        {'range': [70, 90], 'color': "#fff3cd"},
-                        {'range': [90, 100], 'color': "#d4edda"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 4},
-                        'thickness': 0.75,
-                        'value': 80
-                    }
-                }
-            ))
-
-            # <-- KEEP THIS, it belongs to fig_enroll
-            fig_enroll.update_layout(height=250)
-            st.plotly_chart(fig_enroll)  # <-- KEEP THIS, it belongs to col1
-
-        with col2:
-            # Risk prediction
-            st.markdown("#### Risk Prediction")
-
-            if 'risk_level' in filtered_patients.columns:
-                risk_counts = filtered_patients['risk_level'].value_counts()
-                total = len(filtered_patients)
-
-                # Calculate percentages
-                risk_data = {
-                    'Low': (risk_counts.get('Low', 0) / total * 100),
-                    'Medium': (risk_counts.get('Medium', 0) / total * 100),
-                    'High': (risk_counts.get('High', 0) / total * 100)
-                }
-
-                fig_risk = go.Figure(data=[go.Bar(
-                    x=list(risk_data.keys()),
-                    y=list(risk_data.values()),
-                    marker_color=['#28a745', '#ffc107',
-                                  '#dc3545'],  # Green, Yellow, Red
-                    text=[f"{v:.1f}%" for v in risk_data.values()],
-                    textposition='auto',
-                )])
-
-                fig_risk.update_layout(
-                    height=250,
-                    title="Patient Risk Distribution",
-                    yaxis_title="Percentage (%)",
-                    yaxis_range=[0, 100]
-                )
-
-                st.plotly_chart(fig_risk, width='stretch')
-            else:
-                st.info("Risk level data not available")
-
-        # Add another row for more AI insights
-        st.markdown("---")
-        st.subheader("📊 Predictive Analytics")
-
-        col3, col4 = st.columns(2)
-
-        with col3:
-            # DQI Trend Prediction
-            st.markdown("#### DQI Trend Forecast")
-
-            if 'dqi_score' in filtered_patients.columns:
-                # Simple trend calculation
-                avg_dqi = filtered_patients['dqi_score'].mean()
-                # Predict slight improvement
-                predicted = min(avg_dqi + 2.5, 100)
-
-                fig_trend = go.Figure(go.Indicator(
-                    mode="number+delta",
-                    value=predicted,
-                    delta={'reference': avg_dqi, 'position': "top"},
-                    title={'text': "Predicted DQI (Next Month)"},
-                    domain={'x': [0, 1], 'y': [0, 1]}
-                ))
-
-                fig_trend.update_layout(height=215)
-                st.plotly_chart(fig_trend)
-            else:
-                st.info("DQI data not available")
-
-        with col4:
-            # Site Performance Prediction
-            st.markdown("#### Site Performance Alert")
-
-            if not sites.empty and 'performance_status' in sites.columns:
-                poor_sites = sites[sites['performance_status'].isin(
-                    ['Poor', 'Needs Improvement'])]
-
-                if len(poor_sites) > 0:
-                    st.error(f"🚨 {len(poor_sites)} sites need attention")
-                    for idx, site in poor_sites.iterrows():
-                        st.write(
-                            f"• **{site['site_id']}**: {site.get('performance_status', 'N/A')}")
-                else:
-                    st.success("✅ All sites performing well")
-            else:
-                st.info("Site performance data not available")
+    active_tab = st.radio(
+        "Section",
+        options=range(len(tab_labels)),
+        format_func=lambda position: tab_labels[position],
+        horizontal=True,
+        label_visibility="collapsed",
+        key="active_tab"
+    )
 
-        # REMOVED THE DUPLICATE LINES - THEY WERE OUTSIDE ANY COLUMN AND REPEATING FIG_ENROLL
+    view = {
+        'patients': patients,
+        'sites': sites,
+        'user': user,
+        'current_disease': current_disease,
+        'filtered_positions': filtered_positions,
+        'filtered_patients': filtered_patients,
+        'filtered_count': summary['total_patients'],
+        'dataset_version': dataset_version,
+        'filter_state': filter_state,
+        'filter_key': filter_key,
+        'search_index': search_index,
+        'database_cube': database_cube,
+        'cube': cube,
+        'cube_mask': cube_mask,
+        'cube_totals': cube_totals,
+        'summary': summary,
+    }
+    TAB_RENDERERS[active_tab](view)
 
     # Footer
     st.markdown("---")
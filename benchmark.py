@@ -0,0 +1,1232 @@
+"""
+Benchmarks for the vectorized calculation paths
+
+Run all benchmarks:      python benchmark.py
+Run a single benchmark:  python benchmark.py dqi
+"""
+import contextlib
+import io
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from calculations import (ClinicalTrialCalculator, IncrementalPatientProcessor, stream_process_data,
+                          load_and_process_data)
+from utils.schema import DataSchema, PATIENT_SCHEMA, SITE_SCHEMA
+from utils.storage import DataStore
+from utils.cache import ProcessedDataCache
+from utils.cube import FilterCube
+from utils.filters import BitmapFilterEngine
+from utils.search import PatientSearchIndex
+from utils.sorting import SortPermutationCache
+from utils.export import CsvExportCache
+from utils.jobs import JobQueue
+from utils.reports import ReportBuilder, REPORT_TYPES
+from utils.figures import FigureCache
+from utils.visualization import DashboardVisualizer
+from utils.helpers import DataHelper
+from config import SITES, REGIONS, CRAS, ACTIVE_TRIALS, DATA_GENERATION, STUDY_CLEAN_PATIENT_RULES
+from data_controller import DataController, CONTROLLED_SITES
+from data_generator_final import (generate_trial_patients, generate_queries_for_trial, generate_trials,
+                                  plan_generation_workers, plan_large_dataset, generate_large_dataset)
+
+
+def make_patient_frame(num_patients, num_sites=8, seed=42):
+    """Build a synthetic patient frame with the columns used by the calculator"""
+    rng = np.random.default_rng(seed)
+    is_clean = rng.random(num_patients) < 0.3
+    open_queries = np.where(is_clean, 0, rng.integers(1, 6, num_patients))
+    total_queries = open_queries + rng.integers(0, 4, num_patients)
+
+    return pd.DataFrame({
+        'patient_id': [f'P{i:07d}' for i in range(1, num_patients + 1)],
+        'trial_id': rng.choice(['NOV-2024-001', 'NOV-2024-002', 'NOV-2024-003'], num_patients),
+        'region': rng.choice(['North', 'South', 'East', 'West'], num_patients),
+        'cra_assigned': rng.choice(['CRA_John_Smith', 'CRA_Priya_Sharma', 'CRA_Maria_Garcia'], num_patients),
+        'site_id': np.array([f'Site_{i:03d}' for i in range(num_sites)])[
+            rng.integers(0, num_sites, num_patients)],
+        'subject_status': rng.choice(['Active', 'Completed', 'Dropped'], num_patients, p=[0.7, 0.2, 0.1]),
+        'missing_visits': np.where(is_clean, 0, rng.integers(1, 4, num_patients)),
+        'open_queries': open_queries,
+        'safety_issues': np.where(is_clean, 0, rng.integers(0, 3, num_patients)),
+        'adverse_events': rng.integers(0, 4, num_patients),
+        'forms_verified': is_clean | (rng.random(num_patients) < 0.5),
+        'forms_signed': is_clean | (rng.random(num_patients) < 0.5),
+        'total_visits_expected': 12,
+        'visits_completed': rng.integers(6, 13, num_patients),
+        'total_queries': total_queries,
+        'queries_resolved': total_queries - open_queries,
+        'non_conformant_data': np.where(is_clean, 0, rng.integers(1, 5, num_patients)),
+    })
+
+
+def time_call(func, *args, **kwargs):
+    """Run func once and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def check_dqi_parity(df):
+    """Compare the vectorized DQI against the scalar reference row by row"""
+    expected = df.apply(ClinicalTrialCalculator.calculate_data_quality_index, axis=1)
+    actual = ClinicalTrialCalculator.calculate_dqi_vectorized(df)
+    mismatches = int((expected.to_numpy() != actual.to_numpy()).sum())
+    assert mismatches == 0, f"{mismatches} DQI values differ from the scalar reference"
+    return mismatches
+
+
+def make_dqi_edge_cases():
+    """Frames exercising the DQI defaults: zero denominators, clipping, absent columns, missing values"""
+    nan = np.nan
+    edge = pd.DataFrame({
+        'total_visits_expected': [0, 12, 12, 10, 12, nan, 12, 12, 12, 12, 12, 12, nan],
+        'visits_completed': [5, 0, 12, 15, 6, 6, nan, 6, 6, 6, 6, 6, nan],
+        'total_queries': [0, 4, 0, 2, 3, 4, 4, nan, 4, 4, 4, 0, nan],
+        'queries_resolved': [0, 1, 0, 2, 0, 1, 1, 1, nan, 1, 1, nan, nan],
+        'non_conformant_data': [0, 3, 7, 5, 1, 2, 2, 2, 2, nan, 2, 2, nan],
+        'forms_verified': [True, False, True, 0, 14, True, True, True, True, True, nan, None, nan],
+        'forms_signed': [True, True, False, 1, False, False, False, False, False, False, nan, nan, None],
+        'safety_issues': [0, 1, 0, 2, 0, 0, 0, 0, 0, 0, 0, nan, nan],
+    })
+    return [edge, edge.drop(columns=['forms_signed', 'total_queries']), edge[['safety_issues']]]
+
+
+def check_clean_status_parity(df, rules=None):
+    """Compare the compiled clean-status mask against the scalar rule evaluation"""
+    expected = df.apply(ClinicalTrialCalculator.calculate_clean_patient_status, axis=1, rules=rules)
+    actual = ClinicalTrialCalculator.calculate_clean_status_vectorized(df, rules=rules)
+    mismatches = int((expected.to_numpy() != actual.to_numpy()).sum())
+    assert mismatches == 0, f"{mismatches} clean statuses differ from the scalar reference"
+    return mismatches
+
+
+def benchmark_dqi(sizes=(10_000, 100_000, 1_000_000)):
+    """Time scalar vs vectorized DQI and check they agree"""
+    print("DQI engine: scalar apply vs vectorized")
+    for edge in make_dqi_edge_cases():
+        check_dqi_parity(edge)
+    for size in sizes:
+        df = make_patient_frame(size)
+        scalar, scalar_time = time_call(
+            df.apply, ClinicalTrialCalculator.calculate_data_quality_index, axis=1)
+        vectorized, vector_time = time_call(ClinicalTrialCalculator.calculate_dqi_vectorized, df)
+        assert (scalar.to_numpy() == vectorized.to_numpy()).all(), "DQI parity check failed"
+        print(f"  {size:>9,} rows: scalar {scalar_time:8.3f}s  vectorized {vector_time:8.4f}s  "
+              f"speedup {scalar_time / max(vector_time, 1e-9):7.1f}x")
+
+
+def benchmark_clean_status(sizes=(10_000, 100_000, 1_000_000)):
+    """Time per-row clean status vs the compiled rule mask and check they agree"""
+    print("Clean status: per-row rules vs compiled mask")
+    custom_rules = [
+        {'column': 'open_queries', 'operator': '<=', 'value': 2, 'default': 0},
+        {'column': 'subject_status', 'operator': 'in', 'value': ['Active', 'Completed'], 'default': 'Active'},
+        {'column': 'lab_issues', 'operator': '==', 'value': 0, 'default': 0},
+    ]
+    check_clean_status_parity(make_patient_frame(1_000), rules=custom_rules)
+    # A per-study override must reach the per-row rules as well as the mask
+    STUDY_CLEAN_PATIENT_RULES['NOV-2024-002'] = custom_rules
+    try:
+        check_clean_status_parity(make_patient_frame(1_000))
+    finally:
+        del STUDY_CLEAN_PATIENT_RULES['NOV-2024-002']
+    for size in sizes:
+        df = make_patient_frame(size)
+        scalar, scalar_time = time_call(
+            df.apply, ClinicalTrialCalculator.calculate_clean_patient_status, axis=1)
+        vectorized, vector_time = time_call(ClinicalTrialCalculator.calculate_clean_status_vectorized, df)
+        assert (scalar.to_numpy() == vectorized.to_numpy()).all(), "Clean status parity check failed"
+        print(f"  {size:>9,} rows: scalar {scalar_time:8.3f}s  vectorized {vector_time:8.4f}s  "
+              f"speedup {scalar_time / max(vector_time, 1e-9):7.1f}x")
+
+
+def assert_site_metrics_match(expected, actual, check_dtype=True):
+    """Assert two site metric frames match
+
+    avg_dqi may differ by one rounding step where a float mean lands a hair
+    under an exact .x5 tie; every other column must match exactly.
+    """
+    pd.testing.assert_frame_equal(expected.drop(columns='avg_dqi'), actual.drop(columns='avg_dqi'),
+                                  check_dtype=check_dtype)
+    pd.testing.assert_series_equal(expected['avg_dqi'], actual['avg_dqi'], check_dtype=check_dtype,
+                                   check_exact=False, rtol=0, atol=0.1 + 1e-9)
+
+
+def legacy_enhance_site_data(sites_df, patients_df):
+    """Reference copy of the per-site loop that enhance_site_data replaced"""
+    enhanced_sites = sites_df.copy()
+    for column, default in [('clean_percentage', 0.0), ('avg_dqi', 0.0),
+                            ('total_open_queries', 0), ('performance_status', 'Unknown')]:
+        if column not in enhanced_sites.columns:
+            enhanced_sites[column] = default
+
+    for idx, site_row in enhanced_sites.iterrows():
+        site_patients = patients_df[patients_df['site_id'] == site_row['site_id']]
+        if len(site_patients) > 0:
+            clean_count = len(site_patients[site_patients['clean_status'] == 'Clean'])
+            avg_dqi = site_patients['dqi_score'].mean()
+            performance_status = 'Critical' if avg_dqi < 60 else ('Warning' if avg_dqi < 75 else 'Good')
+            enhanced_sites.at[idx, 'clean_percentage'] = round(clean_count / len(site_patients) * 100, 1)
+            enhanced_sites.at[idx, 'avg_dqi'] = round(avg_dqi, 1)
+            enhanced_sites.at[idx, 'total_open_queries'] = site_patients['open_queries'].sum()
+            enhanced_sites.at[idx, 'performance_status'] = performance_status
+    return enhanced_sites
+
+
+def make_site_frame(patients_df):
+    """Build a site frame for the patients' sites plus one site with no patients"""
+    site_ids = sorted(patients_df['site_id'].unique()) + ['Site_Empty']
+    return pd.DataFrame({'site_id': site_ids, 'region': 'North'})
+
+
+def benchmark_site_enhancement(site_counts=(10, 100, 400), patient_counts=(10_000, 100_000)):
+    """Time the per-site loop vs the grouped aggregation and check they agree"""
+    print("Site enhancement: per-site loop vs grouped aggregation")
+    for num_patients in patient_counts:
+        for num_sites in site_counts:
+            patients = ClinicalTrialCalculator.process_patient_dataframe(
+                make_patient_frame(num_patients, num_sites=num_sites))
+            sites = make_site_frame(patients)
+            legacy, legacy_time = time_call(legacy_enhance_site_data, sites, patients)
+            grouped, grouped_time = time_call(ClinicalTrialCalculator.enhance_site_data, sites, patients)
+            assert_site_metrics_match(legacy, grouped)
+            print(f"  {num_patients:>9,} patients / {num_sites:>4} sites: loop {legacy_time:8.3f}s  "
+                  f"grouped {grouped_time:8.4f}s  speedup {legacy_time / max(grouped_time, 1e-9):7.1f}x")
+
+
+def benchmark_site_scorecards(patient_counts=(10_000, 100_000), num_sites=400):
+    """Time looping calculate_site_performance vs one grouped scorecard and check they agree"""
+    print("Site scorecards: per-site calculate_site_performance vs grouped scorecard")
+    for num_patients in patient_counts:
+        patients = ClinicalTrialCalculator.process_patient_dataframe(
+            make_patient_frame(num_patients, num_sites=num_sites))
+
+        def loop_scorecards():
+            rows = [ClinicalTrialCalculator.calculate_site_performance(group)
+                    for _, group in patients.groupby(['trial_id', 'site_id'], observed=True)]
+            return pd.DataFrame(rows)
+
+        looped, loop_time = time_call(loop_scorecards)
+        batch, batch_time = time_call(ClinicalTrialCalculator.calculate_site_scorecards, patients)
+        batch_metrics = batch.drop(columns='trial_id')[looped.columns]
+        assert_site_metrics_match(looped, batch_metrics, check_dtype=False)
+        for keys in ['region', 'cra_assigned', ['trial_id', 'region']]:
+            ClinicalTrialCalculator.calculate_site_scorecards(patients, group_by=keys)
+        print(f"  {num_patients:>9,} patients / {num_sites:>4} sites x 3 trials: loop {loop_time:8.3f}s  "
+              f"grouped {batch_time:8.4f}s  speedup {loop_time / max(batch_time, 1e-9):7.1f}x")
+
+
+def make_refreshed_frame(patients, num_changed, reshape=True, seed=7):
+    """Copy a raw patient frame with some rows edited and, if reshape, some added and removed"""
+    rng = np.random.default_rng(seed)
+    refreshed = patients.copy()
+    changed = rng.choice(len(refreshed), num_changed, replace=False)
+    refreshed.loc[refreshed.index[changed], 'open_queries'] = 0
+    refreshed.loc[refreshed.index[changed[:num_changed // 2]], 'site_id'] = refreshed['site_id'].iloc[0]
+    if not reshape:
+        return refreshed
+    added = make_patient_frame(num_changed // 4 + 1, seed=seed)
+    added['patient_id'] = [f'N{i:07d}' for i in range(len(added))]
+    return pd.concat([refreshed.iloc[num_changed // 4:], added], ignore_index=True)
+
+
+def benchmark_incremental_refresh(sizes=(10_000, 100_000, 1_000_000), change_counts=(100, 1_000, 10_000)):
+    """Time a full reprocess vs an incremental refresh and check they agree"""
+    print("Incremental refresh: full reprocess vs changed rows only")
+    for num_patients in sizes:
+        patients = make_patient_frame(num_patients, num_sites=400)
+        sites = make_site_frame(patients)
+        for reshape in (False, True):
+            for num_changed in change_counts:
+                if num_changed > num_patients // 10:
+                    continue
+                processor = IncrementalPatientProcessor()
+                processor.refresh(patients, sites)
+                refreshed = make_refreshed_frame(patients, num_changed, reshape=reshape)
+
+                def full_reprocess():
+                    processed = ClinicalTrialCalculator.process_patient_dataframe(refreshed)
+                    return processed, ClinicalTrialCalculator.enhance_site_data(sites, processed)
+
+                (full_patients, full_sites), full_time = time_call(full_reprocess)
+                (inc_patients, inc_sites), inc_time = time_call(processor.refresh, refreshed, sites)
+                pd.testing.assert_frame_equal(full_patients, inc_patients)
+                pd.testing.assert_frame_equal(full_sites, inc_sites)
+                label = 'edits, adds, removes' if reshape else 'in-place edits'
+                print(f"  {num_patients:>9,} patients, {num_changed:>6,} rows ({label}): full {full_time:7.3f}s  "
+                      f"incremental {inc_time:7.4f}s  speedup {full_time / max(inc_time, 1e-9):6.1f}x")
+
+
+def benchmark_parallel_processing(sizes=(1_000_000, 4_000_000, 8_000_000), workers=4):
+    """Time serial vs process-pool process_patient_dataframe and check they agree"""
+    print(f"process_patient_dataframe: serial vs {workers} workers")
+    for size in sizes:
+        df = make_patient_frame(size)
+        serial, serial_time = time_call(ClinicalTrialCalculator.process_patient_dataframe, df)
+        parallel, parallel_time = time_call(ClinicalTrialCalculator.process_patient_dataframe, df, workers=workers)
+        pd.testing.assert_frame_equal(serial, parallel)
+        chunks = ClinicalTrialCalculator.plan_parallel_chunks(size, workers)
+        print(f"  {size:>9,} rows ({chunks} chunks): serial {serial_time:8.3f}s  parallel {parallel_time:8.3f}s  "
+              f"speedup {serial_time / max(parallel_time, 1e-9):7.1f}x")
+
+
+def benchmark_dqi_scenarios(num_patients=1_000_000, scenario_counts=(1, 10, 50)):
+    """Time scoring N weight scenarios into one matrix, component by component, vs N separate DQI passes"""
+    import calculations
+    print(f"DQI weight scenarios at {num_patients:,} patients: separate passes vs per-component score matrix")
+    patients = make_patient_frame(num_patients, num_sites=400)
+    rng = np.random.default_rng(3)
+    for num_scenarios in scenario_counts:
+        scenarios = {'current': dict(calculations.DQI_WEIGHTS)}
+        for i in range(1, num_scenarios):
+            weights = rng.dirichlet(np.ones(len(calculations.DQI_WEIGHTS)))
+            scenarios[f's{i}'] = dict(zip(calculations.DQI_WEIGHTS, weights))
+
+        def separate_passes():
+            original = calculations.DQI_WEIGHTS
+            try:
+                results = {}
+                for name, weights in scenarios.items():
+                    calculations.DQI_WEIGHTS = weights
+                    dqi = ClinicalTrialCalculator.calculate_dqi_vectorized(patients)
+                    results[name] = dqi
+                    dqi.groupby(patients['site_id'], observed=True).mean().rank(ascending=False, method='min')
+                return results
+            finally:
+                calculations.DQI_WEIGHTS = original
+
+        separate, separate_time = time_call(separate_passes)
+        (scores, rankings), matrix_time = time_call(
+            ClinicalTrialCalculator.evaluate_dqi_scenarios, patients, scenarios)
+        for name in scenarios:
+            np.testing.assert_array_equal(separate[name].to_numpy(), scores[f'dqi_{name}'].to_numpy())
+        print(f"  {num_scenarios:>4} scenarios: separate {separate_time:8.3f}s  matrix {matrix_time:8.3f}s  "
+              f"speedup {separate_time / max(matrix_time, 1e-9):7.1f}x")
+
+
+def peak_memory_call(func, *args, **kwargs):
+    """Run func once and return (result, elapsed seconds, peak traced MB)"""
+    tracemalloc.start()
+    try:
+        result, elapsed = time_call(func, *args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 ** 2
+
+
+def benchmark_streaming(sizes=(100_000, 1_000_000), chunksize=100_000):
+    """Compare peak memory of in-memory vs chunked processing and check site output matches"""
+    print(f"Patient file processing: in-memory vs streaming ({chunksize:,}-row chunks)")
+    with tempfile.TemporaryDirectory() as workdir:
+        patients_path = os.path.join(workdir, 'patients.csv')
+        sites_path = os.path.join(workdir, 'sites.csv')
+        for size in sizes:
+            patients = make_patient_frame(size, num_sites=400)
+            patients.to_csv(patients_path, index=False)
+            make_site_frame(patients).to_csv(sites_path, index=False)
+            del patients
+
+            def in_memory():
+                loaded = ClinicalTrialCalculator.process_patient_dataframe(pd.read_csv(patients_path))
+                sites = ClinicalTrialCalculator.enhance_site_data(pd.read_csv(sites_path), loaded)
+                return DataSchema.apply(sites, SITE_SCHEMA)
+
+            full_sites, full_time, full_peak = peak_memory_call(in_memory)
+            streamed_sites, stream_time, stream_peak = peak_memory_call(
+                stream_process_data, workdir, chunksize=chunksize)
+            pd.testing.assert_frame_equal(full_sites, streamed_sites)
+            print(f"  {size:>9,} rows: in-memory {full_time:6.2f}s peak {full_peak:8.1f} MB  "
+                  f"streaming {stream_time:6.2f}s peak {stream_peak:8.1f} MB")
+
+
+def benchmark_storage(sizes=(100_000, 1_000_000)):
+    """Compare CSV and Parquet file size and read time, full and column-projected"""
+    if not DataStore.parquet_available():
+        print("⚠️ pyarrow not installed - skipping storage benchmark")
+        return
+    projection = ['site_id', 'open_queries']
+    print("Patient table storage: CSV vs Parquet")
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = DataStore.table_path('patients', workdir, 'csv')
+        parquet_path = DataStore.table_path('patients', workdir)
+        for size in sizes:
+            patients = make_patient_frame(size, num_sites=400)
+            patients.to_csv(csv_path, index=False)
+            DataStore.write_table(patients, 'patients', workdir)
+
+            def read_csv():
+                return DataSchema.apply(pd.read_csv(csv_path), PATIENT_SCHEMA)
+
+            csv_frame, csv_time = time_call(read_csv)
+            parquet_frame, parquet_time = time_call(DataStore.read_table, 'patients', data_dir=workdir)
+            pd.testing.assert_frame_equal(csv_frame, parquet_frame, check_categorical=False)
+            _, csv_cols_time = time_call(pd.read_csv, csv_path, usecols=projection)
+            _, parquet_cols_time = time_call(DataStore.read_table, 'patients', projection, workdir)
+            csv_mb = os.path.getsize(csv_path) / 1024 ** 2
+            parquet_mb = os.path.getsize(parquet_path) / 1024 ** 2
+            print(f"  {size:>9,} rows: CSV {csv_mb:7.1f} MB read {csv_time:6.2f}s "
+                  f"({csv_cols_time:5.2f}s 2 cols)  Parquet {parquet_mb:6.1f} MB read "
+                  f"{parquet_time:6.2f}s ({parquet_cols_time:5.2f}s 2 cols)")
+
+
+def benchmark_processed_cache(sizes=(100_000, 1_000_000)):
+    """Compare a cold load (read + process) with a warm load from the processed-data cache"""
+    print("load_and_process_data: cold vs warm cache")
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ProcessedDataCache(directory=os.path.join(workdir, 'cache'))
+        for size in sizes:
+            patients = make_patient_frame(size, num_sites=400)
+            queries = pd.DataFrame({'query_id': np.arange(size // 10),
+                                    'patient_id': patients['patient_id'].to_numpy()[:size // 10]})
+            DataStore.write_all(patients, make_site_frame(patients), queries, workdir)
+            del patients
+
+            cold, cold_time = time_call(load_and_process_data, cache=cache, data_dir=workdir)
+            warm, warm_time = time_call(load_and_process_data, cache=cache, data_dir=workdir)
+            for expected, actual in zip(cold, warm):
+                pd.testing.assert_frame_equal(expected, actual)
+            print(f"  {size:>9,} rows: cold {cold_time:6.2f}s  warm {warm_time:6.2f}s  "
+                  f"({cold_time / warm_time:5.1f}x)")
+
+
+def filter_patients(patients, filters, dqi_range):
+    """Row-by-row sidebar filtering, as main_dashboard does without the cube"""
+    mask = np.ones(len(patients), dtype=bool)
+    for column, values in filters.items():
+        if values:
+            mask &= patients[column].isin(values).to_numpy()
+    # The slider's upper bound covers that whole DQI point
+    mask &= ((patients['dqi_score'] >= dqi_range[0]) & (patients['dqi_score'] < dqi_range[1] + 1)).to_numpy()
+    return patients[mask]
+
+
+def benchmark_filter_cube(sizes=(100_000, 1_000_000), num_sites=50):
+    """Compare KPI summaries from the filter cube with filtering patients, and check they match"""
+    print("Sidebar KPI summary: patient scan vs filter cube")
+    rng = np.random.default_rng(3)
+    for size in sizes:
+        patients = ClinicalTrialCalculator.process_patient_dataframe(make_patient_frame(size, num_sites))
+        patients['subject_status'] = rng.choice(['Active', 'Completed', 'Screening', 'Withdrawn'], size)
+        patients = DataSchema.apply(patients, PATIENT_SCHEMA)
+        cube, build_time = time_call(FilterCube.build, patients)
+
+        sites = list(patients['site_id'].unique()[:5])
+        selections = [
+            ({}, (0, 100)),
+            ({'site_id': sites, 'risk_level': ['High', 'Medium']}, (40, 85)),
+            ({'subject_status': ['Active'], 'clean_status': ['Not Clean']}, (55, 60)),
+        ]
+        scan_time = cube_time = 0.0
+        for filters, dqi_range in selections:
+            expected, elapsed = time_call(
+                lambda: DataHelper.calculate_summary_statistics(filter_patients(patients, filters, dqi_range)))
+            scan_time += elapsed
+            actual, elapsed = time_call(cube.summary, filters, dqi_range)
+            cube_time += elapsed
+            assert all(expected[key] == actual[key] for key in expected), (expected, actual)
+
+        # 1,000 edited patients (some moving site or status), 250 removed and 250 enrolled
+        changed = patients.copy()
+        edited = changed.index[rng.choice(len(changed), 1000, replace=False)]
+        changed.loc[edited, 'open_queries'] += 1
+        changed.loc[edited[:300], 'subject_status'] = 'Withdrawn'
+        changed.loc[edited[:100], 'site_id'] = changed['site_id'].iloc[0]
+        enrolled = changed.iloc[:250].copy()
+        enrolled['patient_id'] = [f'N{i:07d}' for i in range(len(enrolled))]
+        changed = pd.concat([changed.iloc[250:], enrolled], ignore_index=True)
+
+        (changed_rows, removed_keys), diff_time = time_call(cube.changed_rows, changed)
+        _, refresh_time = time_call(cube.refresh, changed_rows, removed_keys)
+        _, rebuild_time = time_call(FilterCube.build, changed)
+        for filters, dqi_range in selections:
+            expected = DataHelper.calculate_summary_statistics(filter_patients(changed, filters, dqi_range))
+            actual = cube.summary(filters, dqi_range)
+            assert all(expected[key] == actual[key] for key in expected), (expected, actual)
+
+        print(f"  {size:>9,} patients ({len(cube.cells):,} cells, build {build_time:5.2f}s): "
+              f"scan {scan_time / len(selections) * 1000:6.1f}ms  cube {cube_time / len(selections) * 1000:6.1f}ms "
+              f"per summary; {len(changed_rows):,}-row diff {diff_time:5.3f}s + refresh {refresh_time:5.3f}s "
+              f"vs rebuild {rebuild_time:5.2f}s")
+
+
+def legacy_filter_chain(patients, filters, dqi_range):
+    """main_dashboard's original filtering: copy, then one boolean mask per filter"""
+    filtered = patients.copy()
+    for column, values in filters.items():
+        if values:
+            filtered = filtered[filtered[column].isin(values)]
+    # Upper bound covers that whole DQI point, matching the slider step
+    return filtered[(filtered['dqi_score'] >= dqi_range[0]) & (filtered['dqi_score'] < dqi_range[1] + 1)]
+
+
+def benchmark_filter_engine(sizes=(100_000, 1_000_000), num_sites=50):
+    """Compare the bitmap filter engine with chained boolean masks and check rows match"""
+    print("Sidebar filtering: chained masks vs bitmap index")
+    rng = np.random.default_rng(5)
+    for size in sizes:
+        patients = ClinicalTrialCalculator.process_patient_dataframe(make_patient_frame(size, num_sites))
+        patients['subject_status'] = rng.choice(['Active', 'Completed', 'Screening', 'Withdrawn'], size)
+        patients = DataSchema.apply(patients, PATIENT_SCHEMA)
+        engine, build_time = time_call(BitmapFilterEngine, patients)
+
+        sites = list(patients['site_id'].unique()[:5])
+        selections = [
+            ({'site_id': sites, 'risk_level': ['High', 'Medium']}, (40, 85)),
+            ({'subject_status': ['Active'], 'clean_status': ['Not Clean']}, (55, 60)),
+            ({'clean_status': ['Clean']}, (0, 100)),
+        ]
+        chain_time = select_time = apply_time = 0.0
+        for filters, dqi_range in selections:
+            expected, elapsed = time_call(legacy_filter_chain, patients, filters, dqi_range)
+            chain_time += elapsed
+            _, elapsed = time_call(engine.select, filters, {'dqi_score': dqi_range})
+            select_time += elapsed
+            actual, elapsed = time_call(engine.apply, filters, {'dqi_score': dqi_range})
+            apply_time += elapsed
+            pd.testing.assert_frame_equal(expected, actual)
+        count = len(selections)
+        print(f"  {size:>9,} patients (index build {build_time:5.2f}s): chain {chain_time / count * 1000:6.1f}ms  "
+              f"bitmap select {select_time / count * 1000:5.1f}ms, with materialize {apply_time / count * 1000:6.1f}ms")
+
+
+def benchmark_date_filter(sizes=(100_000, 1_000_000), window_days=(7, 90, 365)):
+    """Compare enrollment-date windows from the sorted index with column comparisons"""
+    print("Enrollment date window: column comparison vs sorted index")
+    rng = np.random.default_rng(11)
+    for size in sizes:
+        patients = make_patient_frame(size)
+        start = pd.Timestamp('2022-01-01')
+        patients['enrollment_date'] = start + pd.to_timedelta(rng.integers(0, 1000 * 86400, size), unit='s')
+        engine = BitmapFilterEngine(patients)
+        for days in window_days:
+            window = (start.date() + pd.Timedelta(days=200), start.date() + pd.Timedelta(days=200 + days - 1))
+
+            def compare():
+                dates = patients['enrollment_date']
+                return patients[(dates >= pd.Timestamp(window[0]))
+                                & (dates < pd.Timestamp(window[1]) + pd.Timedelta(days=1))]
+
+            expected, compare_time = time_call(compare)
+            _, select_time = time_call(engine.select, None, {'enrollment_date': window})
+            pd.testing.assert_frame_equal(expected, engine.apply(None, {'enrollment_date': window}))
+            print(f"  {size:>9,} patients, {days:>3}-day window ({len(expected):>7,} rows): "
+                  f"compare {compare_time * 1000:6.1f}ms  sorted index {select_time * 1000:5.2f}ms")
+
+
+def benchmark_search(sizes=(20_000, 200_000), apply_limit=20_000):
+    """Compare the inverted search index with row stringification and check results match"""
+    print("Patient search: apply(str(row)) vs inverted index")
+    rng = np.random.default_rng(13)
+    queries = ['P0001234', 'site:Site_012', 'onc active', 'cra:priya status:screen', 'zzz']
+    for size in sizes:
+        patients = make_patient_frame(size, num_sites=50)
+        patients['subject_status'] = rng.choice(['Active', 'Completed', 'Screening', 'Withdrawn'], size)
+        patients['disease'] = rng.choice(['Oncology', 'Cardiology', 'Neurology'], size)
+        index, build_time = time_call(PatientSearchIndex, patients)
+        lowered = {column: patients[column].astype(str).str.lower() for column in index.fields}
+
+        def scan(query):
+            selected = np.ones(size, dtype=bool)
+            for field, term in PatientSearchIndex.parse_query(query):
+                columns = [field] if field is not None else list(lowered)
+                matches = np.zeros(size, dtype=bool)
+                for column in columns:
+                    matches |= lowered[column].str.contains(term.lower(), regex=False).to_numpy()
+                selected &= matches
+            return np.flatnonzero(selected)
+
+        scan_time = index_time = 0.0
+        for query in queries:
+            expected, elapsed = time_call(scan, query)
+            scan_time += elapsed
+            actual, elapsed = time_call(index.search, query)
+            index_time += elapsed
+            assert np.array_equal(expected, actual), query
+        line = (f"  {size:>9,} patients (index build {build_time:5.2f}s): column scan "
+                f"{scan_time / len(queries) * 1000:6.1f}ms  index {index_time / len(queries) * 1000:5.2f}ms per query")
+        if size <= apply_limit:
+            _, apply_time = time_call(
+                lambda: patients.apply(lambda row: 'site_012' in str(row).lower(), axis=1))
+            line += f"  (apply(str(row)) {apply_time:5.2f}s)"
+        print(line)
+
+
+def benchmark_sorting(sizes=(100_000, 1_000_000), page_size=100, pages=(1, 100, 1_000)):
+    """Compare sort_values + iloc paging with cached sort permutations and check pages match"""
+    print("Patient table paging: sort_values + iloc vs cached sort permutations")
+    rng = np.random.default_rng(17)
+    for size in sizes:
+        patients = make_patient_frame(size, num_sites=50)
+        patients = ClinicalTrialCalculator.process_patient_dataframe(patients)
+        patients.loc[rng.choice(size, size // 100, replace=False), 'dqi_score'] = np.nan
+        cache = SortPermutationCache(patients)
+        selections = {'all': None, 'half': np.sort(rng.choice(size, size // 2, replace=False))}
+        for column in ['dqi_score', 'site_id']:
+            _, build_time = time_call(cache.order, column, False)
+            for label, positions in selections.items():
+                subset = patients if positions is None else patients.take(positions)
+                sort_time = page_time = 0.0
+                for page in pages:
+                    start = (page - 1) * page_size
+                    # Stable sort: ties keep frame order, as in the cached permutation
+                    expected, elapsed = time_call(subset.sort_values, column, ascending=False, kind='stable')
+                    sort_time += elapsed
+                    page_positions, elapsed = time_call(
+                        cache.page, column, False, start, start + page_size, positions)
+                    page_time += elapsed
+                    pd.testing.assert_frame_equal(expected.iloc[start:start + page_size],
+                                                  patients.take(page_positions))
+                print(f"  {size:>9,} patients {column:10} {label:4} (order build {build_time * 1000:5.0f}ms): "
+                      f"sort_values {sort_time / len(pages) * 1000:6.1f}ms  "
+                      f"page {page_time / len(pages) * 1000:5.2f}ms per page")
+
+
+def benchmark_export(sizes=(100_000, 1_000_000), chunksize=50_000):
+    """Compare to_csv into one string with the chunked, cached CSV export and check files match"""
+    print(f"Patient CSV export: to_csv string vs chunked export ({chunksize:,}-row chunks)")
+    rng = np.random.default_rng(19)
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            patients = make_patient_frame(size, num_sites=50)
+            patients = ClinicalTrialCalculator.process_patient_dataframe(patients)
+            positions = np.sort(rng.choice(size, size // 2, replace=False))
+            columns = list(patients.columns)
+            exports = CsvExportCache(patients, directory=os.path.join(workdir, str(size)), chunksize=chunksize)
+
+            # The dataset hash is paid once per dataset, not per export
+            _, version_time = time_call(exports.dataset_version)
+            expected, string_time = time_call(
+                lambda: patients.take(positions)[columns].to_csv(index=False))
+            path, cold_time = time_call(exports.export, positions, columns)
+            _, warm_time = time_call(exports.export, positions, columns)
+            with open(path, newline='', encoding='utf-8') as handle:
+                assert handle.read() == expected
+            del expected
+            _, _, string_peak = peak_memory_call(
+                lambda: patients.take(positions)[columns].to_csv(index=False))
+            _, _, chunked_peak = peak_memory_call(exports.write_csv, path, positions, columns)
+            print(f"  {size:>9,} patients ({len(positions):,} exported, dataset hash {version_time:4.2f}s): "
+                  f"to_csv {string_time:5.2f}s peak {string_peak:6.1f} MB  chunked {cold_time:5.2f}s "
+                  f"peak {chunked_peak:6.1f} MB  repeat {warm_time * 1000:5.1f}ms")
+
+
+def benchmark_jobs(sizes=(100_000, 1_000_000), workers=2):
+    """Compare blocking report generation with queueing it on the job pool and check files match"""
+    print(f"Report generation: blocking vs background jobs ({workers} workers)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            patients = ClinicalTrialCalculator.process_patient_dataframe(make_patient_frame(size, num_sites=50))
+            sites = make_site_frame(patients)
+            queries = pd.DataFrame({'query_id': np.arange(size // 10)})
+            tasks = [(report_type, 'HTML') for report_type in REPORT_TYPES]
+
+            def blocking():
+                for number, (report_type, format_name) in enumerate(tasks):
+                    path = os.path.join(workdir, f'blocking-{number}')
+                    ReportBuilder.write_report(path, lambda *_: None, report_type, format_name,
+                                               patients, sites, queries)
+
+            _, blocking_time = time_call(blocking)
+            queue = JobQueue(max_workers=workers, directory=os.path.join(workdir, f'jobs-{size}'),
+                             max_active_per_user=len(tasks))
+            start = time.perf_counter()
+            jobs = [queue.submit('benchmark', report_type, f'{number}.html', 'text/html',
+                                 ReportBuilder.write_report, report_type, format_name, patients, sites, queries)
+                    for number, (report_type, format_name) in enumerate(tasks)]
+            submit_time = time.perf_counter() - start
+            for job in jobs:
+                job.future.result()
+            total_time = time.perf_counter() - start
+            queue.shutdown()
+            for number, job in enumerate(jobs):
+                assert job.status == 'done', job.error
+                with open(job.path, 'rb') as queued, open(os.path.join(workdir, f'blocking-{number}'), 'rb') as direct:
+                    assert queued.read() == direct.read()
+            print(f"  {size:>9,} patients, {len(tasks)} reports: blocking {blocking_time:6.2f}s  "
+                  f"queued in {submit_time * 1000:5.1f}ms, finished after {total_time:6.2f}s")
+
+
+def benchmark_figure_cache(sizes=(100_000, 1_000_000), reruns=20):
+    """Compare rebuilding figures on every rerun with the figure cache and check figures match"""
+    print(f"Figure construction over {reruns} reruns: rebuild vs figure cache")
+    rng = np.random.default_rng(23)
+    for size in sizes:
+        patients = ClinicalTrialCalculator.process_patient_dataframe(make_patient_frame(size, num_sites=50))
+        patients['subject_status'] = rng.choice(['Active', 'Completed', 'Withdrawn'], size)
+        sites = ClinicalTrialCalculator.enhance_site_data(make_site_frame(patients), patients)
+        version = ProcessedDataCache.frame_digest(patients)
+        # Most reruns keep the filters (paging, sorting); every fifth changes the site selection
+        selections = [sorted(rng.choice(sites['site_id'].to_numpy(), 5, replace=False)) if rerun % 5 == 0
+                      else None for rerun in range(reruns)]
+
+        def build_figures(selected_sites):
+            selected = patients if selected_sites is None else patients[patients['site_id'].isin(selected_sites)]
+            return (DashboardVisualizer.create_dqi_heatmap(sites),
+                    DashboardVisualizer.create_patient_status_chart(selected),
+                    DashboardVisualizer.create_risk_matrix(selected))
+
+        def rebuild():
+            current = None
+            for selected_sites in selections:
+                current = selected_sites if selected_sites is not None else current
+                build_figures(current)
+
+        def cached():
+            current = None
+            for selected_sites in selections:
+                current = selected_sites if selected_sites is not None else current
+                cache.get_or_build('overview', version, {'sites': current}, lambda: build_figures(current))
+
+        cache = FigureCache()
+        _, rebuild_time = time_call(rebuild)
+        _, cached_time = time_call(cached)
+        last = selections[-1] if selections[-1] is not None else [s for s in selections if s is not None][-1]
+        for expected, actual in zip(build_figures(last), cache.get_or_build(
+                'overview', version, {'sites': list(reversed(last))}, lambda: None)):
+            assert expected.to_json() == actual.to_json()
+        stats = cache.stats()
+        print(f"  {size:>9,} patients: rebuild {rebuild_time:6.2f}s  cached {cached_time:6.2f}s  "
+              f"({stats['hits']} hits / {stats['misses']} misses, {stats['size_mb']:.2f} MB)")
+
+    # Eviction keeps the cache within its size budget
+    small = FigureCache(max_size_mb=0.05)
+    for number in range(50):
+        small.get_or_build('bar', 'v', {'n': number}, lambda: DashboardVisualizer.create_dqi_heatmap(sites))
+    assert small.size_bytes <= small.max_bytes and small.evictions > 0
+    print(f"  eviction: {small.stats()['entries']} of 50 figures kept in {small.max_bytes / 1024:.0f} KB "
+          f"({small.evictions} evicted)")
+
+
+def legacy_patient_by_disease(patient_id, site, trial_id, disease, therapeutic_area, is_clean):
+    """data_generator_final's original one-dict-per-patient generator"""
+
+    # Base patient data
+    patient = {
+        'patient_id': patient_id,
+        'trial_id': trial_id,
+        'disease': disease,
+        'therapeutic_area': therapeutic_area,
+        'site_id': site,
+        'region': REGIONS[site],
+        'cra_assigned': random.choice(CRAS),
+        'enrollment_date': (datetime.now() - timedelta(days=random.randint(30, 180))).strftime('%Y-%m-%d'),
+    }
+
+    # Disease-specific parameters
+    if therapeutic_area == 'oncology':
+        # Cancer patients have more complex data
+        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[60, 20, 20])[0]
+        if is_clean:
+            patient.update({
+                'missing_visits': 0,
+                'open_queries': 0,
+                'safety_issues': 0,
+                'adverse_events': random.randint(0, 2),  # Cancer patients may have AEs even when clean
+                'lab_issues': 0,
+                'forms_verified': True,
+                'forms_signed': True,
+            })
+        else:
+            patient.update({
+                'missing_visits': random.randint(1, 4),
+                'open_queries': random.randint(1, 6),
+                'safety_issues': random.randint(0, 3),
+                'adverse_events': random.randint(1, 5),
+                'lab_issues': random.randint(0, 3),
+                'forms_verified': random.choice([True, False]),
+                'forms_signed': random.choice([True, False]),
+            })
+
+    elif therapeutic_area == 'cardiology':
+        # Heart disease patients
+        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[70, 25, 5])[0]
+        if is_clean:
+            patient.update({
+                'missing_visits': 0,
+                'open_queries': 0,
+                'safety_issues': 0,
+                'adverse_events': random.randint(0, 1),
+                'lab_issues': 0,
+                'forms_verified': True,
+                'forms_signed': True,
+            })
+        else:
+            patient.update({
+                'missing_visits': random.randint(1, 3),
+                'open_queries': random.randint(1, 4),
+                'safety_issues': random.randint(0, 2),
+                'adverse_events': random.randint(0, 3),
+                'lab_issues': random.randint(0, 2),
+                'forms_verified': random.choices([True, False], weights=[70, 30])[0],
+                'forms_signed': random.choices([True, False], weights=[60, 40])[0],
+            })
+
+    elif therapeutic_area == 'endocrinology':
+        # Diabetes patients
+        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[75, 20, 5])[0]
+        if is_clean:
+            patient.update({
+                'missing_visits': 0,
+                'open_queries': 0,
+                'safety_issues': 0,
+                'adverse_events': 0,
+                'lab_issues': 0,
+                'forms_verified': True,
+                'forms_signed': True,
+            })
+        else:
+            patient.update({
+                'missing_visits': random.randint(1, 2),
+                'open_queries': random.randint(1, 3),
+                'safety_issues': random.randint(0, 1),
+                'adverse_events': random.randint(0, 2),
+                'lab_issues': random.randint(0, 1),
+                'forms_verified': random.choices([True, False], weights=[80, 20])[0],
+                'forms_signed': random.choices([True, False], weights=[75, 25])[0],
+            })
+
+    else:  # Default for other diseases
+        patient['subject_status'] = random.choice(['Active', 'Completed', 'Dropped'])
+        if is_clean:
+            patient.update({
+                'missing_visits': 0,
+                'open_queries': 0,
+                'safety_issues': 0,
+                'adverse_events': 0,
+                'lab_issues': 0,
+                'forms_verified': True,
+                'forms_signed': True,
+            })
+        else:
+            patient.update({
+                'missing_visits': random.randint(1, 3),
+                'open_queries': random.randint(1, 5),
+                'safety_issues': random.randint(0, 2),
+                'adverse_events': random.randint(0, 3),
+                'lab_issues': random.randint(0, 2),
+                'forms_verified': random.choice([True, False]),
+                'forms_signed': random.choice([True, False]),
+            })
+
+    # Common metrics
+    patient['total_visits_expected'] = 12
+    patient['visits_completed'] = random.randint(6, 12) if patient['subject_status'] == 'Active' else 12
+    patient['total_pages_expected'] = 85
+    patient['pages_completed'] = random.randint(70, 85) if is_clean else random.randint(50, 80)
+    patient['missing_pages'] = patient['total_pages_expected'] - patient['pages_completed']
+    patient['total_queries'] = patient['open_queries'] + random.randint(0, 3)
+    patient['queries_resolved'] = patient['total_queries'] - patient['open_queries']
+    patient['non_conformant_data'] = 0 if is_clean else random.randint(1, 4)
+    patient['sdv_completed'] = True if is_clean else random.choice([True, False])
+    patient['frozen_locked'] = True if is_clean else random.choice([True, False])
+    patient['coding_backlog'] = random.randint(0, 2) if is_clean else random.randint(1, 6)
+    patient['overdue_crfs'] = 0 if is_clean else random.randint(0, 3)
+    patient['protocol_deviations'] = 0 if is_clean else random.randint(0, 2)
+
+    # Clean status
+    patient['clean_status'] = 'Clean' if is_clean else 'Not Clean'
+
+    return patient
+
+
+def legacy_generate_trial_patients(trial, trial_sites):
+    """data_generator_final's original per-patient loop for one trial"""
+    clean_chances = {'oncology': 0.20, 'cardiology': 0.35, 'endocrinology': 0.40, 'neurology': 0.25}
+    clean_chance = clean_chances.get(trial['therapeutic_area'], 0.30)
+    trial_patients = []
+    for i in range(1, trial['enrolled_patients'] + 1):
+        trial_patients.append(legacy_patient_by_disease(
+            patient_id=f"{trial['trial_id']}-P{str(i).zfill(3)}",
+            site=random.choice(trial_sites),
+            trial_id=trial['trial_id'],
+            disease=trial['disease'],
+            therapeutic_area=trial['therapeutic_area'],
+            is_clean=random.random() < clean_chance,
+        ))
+    return pd.DataFrame(trial_patients)
+
+
+def assert_means_match(expected, actual, label, z=4):
+    """Check two samples' means differ by at most z standard errors of the difference"""
+    expected, actual = expected.astype(float), actual.astype(float)
+    bound = z * np.sqrt(expected.var() / len(expected) + actual.var() / len(actual))
+    assert abs(expected.mean() - actual.mean()) <= bound + 1e-9, (label, expected.mean(), actual.mean(), bound)
+
+
+def assert_shares_match(expected, actual, label, z=4):
+    """Check each value's share of two samples differs by at most z standard errors"""
+    shares = pd.concat([expected.value_counts(normalize=True), actual.value_counts(normalize=True)], axis=1).fillna(0)
+    pooled = shares.mean(axis=1)
+    bound = z * np.sqrt(pooled * (1 - pooled) * (1 / len(expected) + 1 / len(actual)))
+    assert ((shares.iloc[:, 0] - shares.iloc[:, 1]).abs() <= bound + 1e-9).all(), label
+
+
+def assert_marginals_match(expected, actual, z=4):
+    """Check two generated patient frames have the same columns, value ranges and shares
+
+    Shares and means may differ by sampling noise, up to z standard errors.
+    """
+    assert list(expected.columns) == list(actual.columns)
+    assert (expected.dtypes == actual.dtypes).all()
+    for column in expected.columns:
+        if column in ('patient_id', 'enrollment_date'):
+            continue
+        if not pd.api.types.is_numeric_dtype(expected[column]):
+            assert_shares_match(expected[column], actual[column], column, z)
+        else:
+            assert set(actual[column].unique()) <= set(expected[column].unique()), column
+            assert_means_match(expected[column], actual[column], column, z)
+    assert expected['patient_id'].equals(actual['patient_id'])
+    assert expected['enrollment_date'].min() == actual['enrollment_date'].min()
+    assert expected['enrollment_date'].max() == actual['enrollment_date'].max()
+
+
+def benchmark_patient_generation(sizes=(100_000, 300_000)):
+    """Compare the per-patient generator with the vectorized one and check their distributions match"""
+    print("Trial patient synthesis: per-patient dicts vs vectorized draws")
+    trial_sites = SITES[:5]
+    for size in sizes:
+        legacy_time = vectorized_time = 0.0
+        for area in ['oncology', 'cardiology', 'endocrinology', 'neurology', 'respiratory']:
+            trial = {'trial_id': 'NOV-2024-900', 'disease': area.title(), 'therapeutic_area': area,
+                     'enrolled_patients': size}
+            random.seed(size)
+            expected, elapsed = time_call(legacy_generate_trial_patients, trial, trial_sites)
+            legacy_time += elapsed
+            actual, elapsed = time_call(generate_trial_patients, trial, trial_sites, np.random.default_rng(size))
+            vectorized_time += elapsed
+            assert_marginals_match(expected, actual)
+        print(f"  {size:>9,} patients x 5 areas: per-patient {legacy_time:6.2f}s  vectorized {vectorized_time:6.3f}s  "
+              f"({legacy_time / vectorized_time:5.0f}x)")
+
+
+def legacy_generate_queries_for_trial(patient_df, trial_id):
+    """data_generator_final's original iterrows / sample(1) query generator"""
+    query_types = ['Data Entry Error', 'Missing Value', 'Out of Range',
+                   'Protocol Deviation', 'Lab Value Issue', 'Safety Concern',
+                   'Visit Window Violation', 'Concomitant Medication']
+
+    queries = []
+    query_id = 10000  # Start ID
+
+    for _, patient in patient_df.iterrows():
+        if patient['open_queries'] > 0:
+            for _ in range(patient['open_queries']):
+                query_date = datetime.strptime(patient['enrollment_date'], '%Y-%m-%d') + \
+                            timedelta(days=random.randint(0, 100))
+
+                query = {
+                    'query_id': f'Q{query_id}',
+                    'trial_id': trial_id,
+                    'patient_id': patient['patient_id'],
+                    'site_id': patient['site_id'],
+                    'disease': patient['disease'],
+                    'query_type': random.choice(query_types),
+                    'query_description': f'Query regarding {random.choice(["visit data", "lab results", "safety event", "medication"])} for {patient["disease"]} patient',
+                    'query_priority': random.choice(['Low', 'Medium', 'High']),
+                    'query_status': 'Open',
+                    'query_created_date': query_date.strftime('%Y-%m-%d'),
+                    'query_age_days': (datetime.now() - query_date).days,
+                    'assigned_to': patient['cra_assigned'],
+                }
+                queries.append(query)
+                query_id += 1
+
+    # Add some resolved queries
+    for _ in range(min(50, len(patient_df))):
+        patient = patient_df.sample(1).iloc[0]
+        query_date = datetime.strptime(patient['enrollment_date'], '%Y-%m-%d') + \
+                    timedelta(days=random.randint(0, 100))
+
+        query = {
+            'query_id': f'Q{query_id}',
+            'trial_id': trial_id,
+            'patient_id': patient['patient_id'],
+            'site_id': patient['site_id'],
+            'disease': patient['disease'],
+            'query_type': random.choice(query_types),
+            'query_description': f'Resolved query about {random.choice(["medication", "vital signs", "patient history"])}',
+            'query_priority': random.choice(['Low', 'Medium']),
+            'query_status': 'Resolved',
+            'query_created_date': query_date.strftime('%Y-%m-%d'),
+            'query_resolved_date': (query_date + timedelta(days=random.randint(1, 14))).strftime('%Y-%m-%d'),
+            'query_age_days': (datetime.now() - query_date).days,
+            'assigned_to': patient['cra_assigned'],
+        }
+        queries.append(query)
+        query_id += 1
+
+    return queries
+
+
+def benchmark_query_generation(patient_counts=(20_000, 100_000), resolved_volumes=(1_000_000, 10_000_000)):
+    """Compare the iterrows query generator with the vectorized one, then time large resolved volumes"""
+    print("Trial query synthesis: iterrows vs vectorized")
+    trial = {'trial_id': 'NOV-2024-900', 'disease': 'Breast Cancer', 'therapeutic_area': 'oncology'}
+    for size in patient_counts:
+        patients = generate_trial_patients(dict(trial, enrolled_patients=size), SITES[:5], np.random.default_rng(size))
+        random.seed(size)
+        expected, legacy_time = time_call(lambda: pd.DataFrame(legacy_generate_queries_for_trial(patients, trial['trial_id'])))
+        actual, vectorized_time = time_call(generate_queries_for_trial, patients, trial['trial_id'],
+                                            np.random.default_rng(size))
+        assert list(expected.columns) == list(actual.columns)
+        assert expected['query_id'].equals(actual['query_id'])
+        # Open queries are deterministic per patient; resolved ones are random draws
+        is_open = expected['query_status'] == 'Open'
+        assert expected.loc[is_open, 'patient_id'].equals(actual.loc[is_open, 'patient_id'])
+        for column in ['query_type', 'query_description', 'query_priority', 'query_status']:
+            assert_shares_match(expected.loc[is_open, column], actual.loc[is_open, column], column)
+        # Queries are raised 0-100 days after enrollment, so each age lies within that window
+        enrolled = pd.to_datetime(patients.set_index('patient_id')['enrollment_date'])
+        enrollment_age = (pd.Timestamp(date.today()) - actual['patient_id'].map(enrolled)).dt.days
+        assert (enrollment_age - actual['query_age_days']).between(0, 100).all()
+        assert_means_match(expected['query_age_days'], actual['query_age_days'], 'query_age_days')
+        resolved = actual[~is_open]
+        turnaround = (pd.to_datetime(resolved['query_resolved_date']) - pd.to_datetime(resolved['query_created_date'])).dt.days
+        assert turnaround.between(1, 14).all() and set(resolved['query_priority']) <= {'Low', 'Medium'}
+        print(f"  {size:>9,} patients ({len(actual):,} queries): iterrows {legacy_time:6.2f}s  "
+              f"vectorized {vectorized_time * 1000:6.1f}ms")
+
+    patients = generate_trial_patients(dict(trial, enrolled_patients=100_000), SITES[:5], np.random.default_rng(1))
+    for volume in resolved_volumes:
+        queries, elapsed = time_call(generate_queries_for_trial, patients, trial['trial_id'],
+                                     np.random.default_rng(volume), resolved_queries=volume)
+        assert (queries['query_status'] == 'Resolved').sum() == volume
+        print(f"  {volume:>10,} resolved queries: vectorized {elapsed:5.2f}s")
+        del queries
+
+
+def benchmark_trial_generation(scales=(100, 400), workers=4, seed=2024):
+    """Time serial vs process-pool trial generation and check the output is bit-identical"""
+    print(f"Multi-trial generation: serial vs {workers} workers")
+    for scale in scales:
+        trials = [dict(trial, enrolled_patients=trial['enrolled_patients'] * scale) for trial in ACTIVE_TRIALS]
+        serial, serial_time = time_call(generate_trials, trials, seed)
+        parallel, parallel_time = time_call(generate_trials, trials, seed, workers=workers)
+        for expected, actual in zip(serial, parallel):
+            pd.testing.assert_frame_equal(expected, actual)
+            assert ProcessedDataCache.frame_digest(expected) == ProcessedDataCache.frame_digest(actual)
+        used = plan_generation_workers(trials, workers)
+        print(f"  {len(serial[0]):>10,} patients, {len(serial[2]):>10,} queries: serial {serial_time:6.2f}s  "
+              f"parallel ({used} processes) {parallel_time:6.2f}s  speedup {serial_time / max(parallel_time, 1e-9):4.1f}x")
+
+
+def _peak_rss_run(func, args, kwargs):
+    """Child process body for peak_rss_call"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, elapsed = time_call(func, *args, **kwargs)
+    return result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_call(func, *args, **kwargs):
+    """Run func in a fresh process and return (result, elapsed seconds, peak resident MB)
+
+    Unlike tracemalloc this counts Arrow and NumPy buffers, and it does not
+    slow down code that allocates millions of small objects.
+    """
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_peak_rss_run, func, args, kwargs).result()
+
+
+def write_dataset_in_memory(trials, output_dir):
+    """Generate every trial into combined frames, then write them out"""
+    for table, frame in zip(['patients', 'sites', 'queries'], generate_trials(trials, seed=1)):
+        frame.to_csv(os.path.join(output_dir, f'{table}.csv'), index=False)
+
+
+def benchmark_large_dataset(sizes=(500_000, 2_000_000), chunk_rows=250_000):
+    """Compare peak memory of building a dataset in memory vs streaming it to disk in chunks"""
+    print(f"Synthetic dataset generation: in-memory vs streamed ({chunk_rows:,}-patient chunks)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            trials, _ = plan_large_dataset(size, size // 1000, max(1, size // 100_000))
+            _, memory_time, memory_peak = peak_rss_call(write_dataset_in_memory, trials, workdir)
+            rows, stream_time, stream_peak = peak_rss_call(
+                generate_large_dataset, size, output_dir=workdir, chunk_rows=chunk_rows, seed=1)
+            sites = pd.read_csv(os.path.join(workdir, 'sites.csv'))
+            assert rows['patients'] == size == sites['total_patients_enrolled'].sum()
+            # queries_per_patient is a floor: open queries are never dropped
+            assert rows['queries'] >= round(DATA_GENERATION['queries_per_patient'] * size)
+            print(f"  {size:>10,} patients, {rows['queries']:>10,} queries: in-memory {memory_time:6.2f}s "
+                  f"peak {memory_peak:7.1f} MB  streamed {stream_time:6.2f}s peak {stream_peak:7.1f} MB")
+
+
+def legacy_create_custom_patient(site, is_clean=True, patient_number=1):
+    """DataController's original one-dict-per-patient builder"""
+
+    if is_clean:
+        # CLEAN PATIENT
+        patient = {
+            'patient_id': f'P{str(patient_number).zfill(3)}',
+            'subject_id': f'SUB{patient_number:04d}',
+            'site_id': site,
+            'subject_status': 'Active',
+            'enrollment_date': datetime.now().strftime('%Y-%m-%d'),
+            'last_visit_date': (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d'),
+
+            # Perfect metrics (Clean)
+            'total_visits_expected': 12,
+            'visits_completed': 12,
+            'missing_visits': 0,
+            'total_pages_expected': 85,
+            'pages_completed': 85,
+            'missing_pages': 0,
+            'total_queries': 0,
+            'open_queries': 0,
+            'queries_resolved': 0,
+            'non_conformant_data': 0,
+            'data_entry_errors': 0,
+            'lab_issues': 0,
+            'safety_issues': 0,
+            'adverse_events': 0,
+            'serious_adverse_events': 0,
+            'forms_verified': True,
+            'forms_signed': True,
+            'sdv_completed': True,
+            'frozen_locked': True,
+            'coding_backlog': 0,
+            'overdue_crfs': 0,
+            'protocol_deviations': 0,
+            'screen_failure': False,
+            'early_termination': False,
+
+            # Calculated fields
+            'clean_status': 'Clean',
+            'dqi_score': 95.0,
+            'risk_level': 'Low',
+            'visit_compliance_percentage': 100.0,
+            'page_completion_percentage': 100.0,
+            'query_resolution_percentage': 100.0,
+            'data_quality_percentage': 100.0
+        }
+    else:
+        # NON-CLEAN PATIENT (with issues)
+        patient = {
+            'patient_id': f'P{str(patient_number).zfill(3)}',
+            'subject_id': f'SUB{patient_number:04d}',
+            'site_id': site,
+            'subject_status': np.random.choice(['Active', 'Completed', 'Dropped'], p=[0.7, 0.2, 0.1]),
+            'enrollment_date': (datetime.now() - timedelta(days=np.random.randint(30, 180))).strftime('%Y-%m-%d'),
+            'last_visit_date': (datetime.now() - timedelta(days=np.random.randint(1, 29))).strftime('%Y-%m-%d'),
+
+            # Issues (Not Clean)
+            'total_visits_expected': 12,
+            'visits_completed': np.random.randint(6, 10),
+            'missing_visits': np.random.randint(1, 4),
+            'total_pages_expected': 85,
+            'pages_completed': np.random.randint(60, 80),
+            'missing_pages': np.random.randint(5, 25),
+            'total_queries': np.random.randint(3, 8),
+            'open_queries': np.random.randint(1, 4),
+            'queries_resolved': lambda x: x['total_queries'] - x['open_queries'],
+            'non_conformant_data': np.random.randint(1, 3),
+            'data_entry_errors': np.random.randint(0, 2),
+            'lab_issues': np.random.randint(0, 2),
+            'safety_issues': np.random.randint(0, 1),
+            'adverse_events': np.random.randint(0, 2),
+            'serious_adverse_events': 0,
+            'forms_verified': np.random.choice([True, False], p=[0.3, 0.7]),
+            'forms_signed': np.random.choice([True, False], p=[0.2, 0.8]),
+            'sdv_completed': np.random.choice([True, False], p=[0.4, 0.6]),
+            'frozen_locked': np.random.choice([True, False], p=[0.5, 0.5]),
+            'coding_backlog': np.random.randint(1, 4),
+            'overdue_crfs': np.random.randint(0, 2),
+            'protocol_deviations': np.random.randint(0, 1),
+            'screen_failure': False,
+            'early_termination': False,
+
+            # Calculated fields
+            'clean_status': 'Not Clean',
+            'dqi_score': np.random.randint(40, 65),
+            'risk_level': np.random.choice(['Medium', 'High'], p=[0.7, 0.3]),
+            'visit_compliance_percentage': round((np.random.randint(6, 10) / 12) * 100, 1),
+            'page_completion_percentage': round((np.random.randint(60, 80) / 85) * 100, 1),
+            'query_resolution_percentage': round(((np.random.randint(3, 8) - np.random.randint(1, 4)) / np.random.randint(3, 8)) * 100, 1),
+            'data_quality_percentage': round(100 - (np.random.randint(1, 3) * 20), 1)
+        }
+        patient['queries_resolved'] = patient['total_queries'] - patient['open_queries']
+
+    return patient
+
+
+def legacy_controlled_dataset(num_patients, clean_ratio, site_distribution):
+    """DataController.generate_controlled_dataset's original per-patient loop"""
+    patients = []
+    patient_number = 1
+    for site, count in site_distribution.items():
+        site_clean_count = int(count * clean_ratio)
+        for is_clean in [True] * site_clean_count + [False] * (count - site_clean_count):
+            if patient_number > num_patients:
+                break
+            patients.append(legacy_create_custom_patient(site, is_clean=is_clean, patient_number=patient_number))
+            patient_number += 1
+    return pd.DataFrame(patients)
+
+
+def benchmark_controlled_dataset(sizes=(10_000, 100_000), clean_ratio=0.3):
+    """Compare the per-patient controlled dataset with the vectorized builder and check they agree"""
+    print("DataController dataset: per-patient dicts vs vectorized builder")
+    for size in sizes:
+        # Uneven sites, more patients than requested so the cut-off is exercised
+        shares = np.array([0.3, 0.25, 0.2, 0.15, 0.2])
+        site_distribution = dict(zip(CONTROLLED_SITES, (shares * size).astype(int).tolist()))
+        np.random.seed(size)
+        expected, legacy_time = time_call(legacy_controlled_dataset, size, clean_ratio, site_distribution)
+        actual, vectorized_time = time_call(DataController.build_controlled_dataset, size, clean_ratio,
+                                            site_distribution, seed=size)
+        assert list(expected.columns) == list(actual.columns) and len(expected) == len(actual) == size
+        for column in ['patient_id', 'subject_id', 'site_id', 'clean_status']:
+            assert expected[column].equals(actual[column]), column
+        # Clean patients are fully determined; patients with issues match in distribution
+        is_clean = expected['clean_status'] == 'Clean'
+        pd.testing.assert_frame_equal(expected[is_clean], actual[is_clean], check_dtype=False)
+        issues_expected, issues_actual = expected[~is_clean], actual[~is_clean]
+        for column in expected.columns:
+            if pd.api.types.is_numeric_dtype(expected[column]):
+                assert set(issues_actual[column].unique()) <= set(issues_expected[column].unique()), column
+                assert_means_match(issues_expected[column], issues_actual[column], column)
+            elif column not in ('patient_id', 'subject_id', 'enrollment_date', 'last_visit_date'):
+                assert_shares_match(issues_expected[column], issues_actual[column], column)
+        print(f"  {size:>9,} patients: per-patient {legacy_time:6.2f}s  vectorized {vectorized_time * 1000:6.1f}ms")
+
+
+BENCHMARKS = {
+    'dqi': benchmark_dqi,
+    'clean': benchmark_clean_status,
+    'sites': benchmark_site_enhancement,
+    'scorecards': benchmark_site_scorecards,
+    'incremental': benchmark_incremental_refresh,
+    'parallel': benchmark_parallel_processing,
+    'scenarios': benchmark_dqi_scenarios,
+    'streaming': benchmark_streaming,
+    'storage': benchmark_storage,
+    'cache': benchmark_processed_cache,
+    'cube': benchmark_filter_cube,
+    'filters': benchmark_filter_engine,
+    'dates': benchmark_date_filter,
+    'search': benchmark_search,
+    'sorting': benchmark_sorting,
+    'export': benchmark_export,
+    'jobs': benchmark_jobs,
+    'figures': benchmark_figure_cache,
+    'generator': benchmark_patient_generation,
+    'queries': benchmark_query_generation,
+    'trials': benchmark_trial_generation,
+    'large': benchmark_large_dataset,
+    'controller': benchmark_controlled_dataset,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
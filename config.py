@@ -11,6 +11,16 @@ DQI_WEIGHTS = {
     'safety': 0.10
 }
 
+# ========== DQI WEIGHT SCENARIOS ==========
+# Alternative weightings evaluated side by side by
+# ClinicalTrialCalculator.evaluate_dqi_scenarios; components left out of a
+# scenario keep their DQI_WEIGHTS value
+DQI_WEIGHT_SCENARIOS = {
+    'current': DQI_WEIGHTS,
+    'query_focus': {'visit_completion': 0.25, 'query_resolution': 0.35, 'data_quality': 0.15},
+    'safety_focus': {'visit_completion': 0.25, 'query_resolution': 0.20, 'safety': 0.20},
+}
+
 # ========== THRESHOLDS FOR ALERTS ==========
 THRESHOLDS = {
     'dqi_critical': 60,
@@ -20,6 +30,78 @@ THRESHOLDS = {
     'max_missing_visits': 3
 }
 
+# ========== CLEAN PATIENT CRITERIA ==========
+# A patient is 'Clean' when every rule passes. Each rule compares a patient
+# column against a value; 'default' is used when the column is missing.
+# Supported operators: ==, !=, <, <=, >, >=, in, not in
+CLEAN_PATIENT_RULES = [
+    {'column': 'missing_visits', 'operator': '==', 'value': 0, 'default': 1},
+    {'column': 'open_queries', 'operator': '==', 'value': 0, 'default': 1},
+    {'column': 'safety_issues', 'operator': '==', 'value': 0, 'default': 1},
+    {'column': 'forms_verified', 'operator': '==', 'value': True, 'default': False},
+]
+
+# Per-study overrides of CLEAN_PATIENT_RULES, keyed by trial_id
+STUDY_CLEAN_PATIENT_RULES = {}
+
+# ========== PARALLEL PROCESSING ==========
+# process_patient_dataframe(df, workers=...) splits large frames across a
+# process pool. Frames smaller than min_rows_per_worker * 2 stay serial.
+# This is a fixed row threshold, not a cost model. Per 1M rows, scoring
+# takes ~0.07s, pickling the inputs and results ~0.14s, and starting a worker
+# that imports pandas ~0.4s. 1M rows per worker keeps the start-up a small
+# share of each chunk. With the default rules, pickling costs about as much
+# as the scoring it offloads, so the pool only pays off for heavier rule sets.
+PARALLEL_PROCESSING = {
+    'workers': None,                # None = one per CPU core
+    'min_rows_per_worker': 1000000  # fixed threshold, see above
+}
+
+# On-disk cache of processed frames, keyed by source files and scoring config
+PROCESSED_CACHE = {
+    'enabled': True,
+    'directory': '.cache/processed',
+    'max_entries': 3,               # versions kept; oldest are evicted first
+    'max_size_mb': 1024
+}
+
+# Patient CSV exports kept on disk for repeat downloads
+EXPORT_CACHE = {
+    'directory': '.cache/exports',
+    'max_entries': 10,
+    'max_size_mb': 512,
+    'chunksize': 50000              # rows written per chunk
+}
+
+# Reports and Excel exports run on a worker pool instead of blocking the page
+BACKGROUND_JOBS = {
+    'max_workers': 2,
+    'max_active_per_user': 3,       # queued or running jobs per user
+    'directory': '.cache/jobs',
+    'artifact_ttl_minutes': 60      # finished files are deleted after this
+}
+
+# Built Plotly figures shared across reruns and sessions
+FIGURE_CACHE = {
+    'max_size_mb': 64               # serialized figure size; least recently used are evicted
+}
+
+# Synthetic data generation (data_generator_final.py)
+DATA_GENERATION = {
+    'resolved_queries_per_trial': 50,   # capped at the trial's patient count unless set explicitly
+    'workers': None,                    # trials generated in parallel; None = one per CPU core
+    # Fewer patients than this per worker stay serial: a worker saves ~2us per
+    # patient after pickling its frames back, against ~0.5s to start and import
+    # pandas. 2 workers ran at 0.7x for the three demo trials.
+    'min_patients_per_worker': 250000,
+    # Large synthetic datasets (generate_large_dataset)
+    'chunk_rows': 250000,               # patients generated and written per chunk
+    'write_queue_chunks': 2,            # generated chunks waiting for the writer thread
+    'patients_per_site': 1000,          # default site count = patients / this
+    'patients_per_trial': 100000,       # default trial count = patients / this
+    'queries_per_patient': 2.0
+}
+
 # ========== AVAILABLE THERAPEUTIC AREAS ==========
 THERAPEUTIC_AREAS = {
     'oncology': {
@@ -2,118 +2,102 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import streamlit as st
+
+try:
+    import streamlit as st
+except ImportError:  # Only the sidebar panel needs Streamlit; the dataset builder is headless
+    st = None
+
+CONTROLLED_SITES = ['Site_A_Delhi', 'Site_B_Mumbai', 'Site_C_Chennai',
+                    'Site_D_Kolkata', 'Site_E_Bangalore']
 
 class DataController:
     """Allows manual control over data generation"""
     
     @staticmethod
-    def create_custom_patient(site, is_clean=True, patient_number=1):
-        """Create a patient with specific characteristics"""
+    def build_controlled_dataset(num_patients, clean_ratio, site_distribution, seed=None):
+        """Build the controlled patient dataset with array operations, without Streamlit
+
+        site_distribution maps each site to its number of patients. Every site
+        gets int(count * clean_ratio) clean patients followed by its patients
+        with issues, in site order, and the dataset stops at num_patients.
+        """
+        rng = np.random.default_rng(seed)
+        counts = np.asarray(list(site_distribution.values()), dtype=np.int64)
+        clean_counts = (counts * clean_ratio).astype(np.int64)
+        site_codes = np.repeat(np.arange(len(counts)), counts)[:num_patients]
+        n = len(site_codes)
+        # Clean patients come first within each site
+        position_in_site = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        is_clean = (position_in_site < np.repeat(clean_counts, counts))[:n]
+        numbers = range(1, n + 1)
         
-        if is_clean:
-            # CLEAN PATIENT
-            patient = {
-                'patient_id': f'P{str(patient_number).zfill(3)}',
-                'subject_id': f'SUB{patient_number:04d}',
-                'site_id': site,
-                'subject_status': 'Active',
-                'enrollment_date': datetime.now().strftime('%Y-%m-%d'),
-                'last_visit_date': (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d'),
-                
-                # Perfect metrics (Clean)
-                'total_visits_expected': 12,
-                'visits_completed': 12,
-                'missing_visits': 0,
-                'total_pages_expected': 85,
-                'pages_completed': 85,
-                'missing_pages': 0,
-                'total_queries': 0,
-                'open_queries': 0,
-                'queries_resolved': 0,
-                'non_conformant_data': 0,
-                'data_entry_errors': 0,
-                'lab_issues': 0,
-                'safety_issues': 0,
-                'adverse_events': 0,
-                'serious_adverse_events': 0,
-                'forms_verified': True,
-                'forms_signed': True,
-                'sdv_completed': True,
-                'frozen_locked': True,
-                'coding_backlog': 0,
-                'overdue_crfs': 0,
-                'protocol_deviations': 0,
-                'screen_failure': False,
-                'early_termination': False,
-                
-                # Calculated fields
-                'clean_status': 'Clean',
-                'dqi_score': 95.0,
-                'risk_level': 'Low',
-                'visit_compliance_percentage': 100.0,
-                'page_completion_percentage': 100.0,
-                'query_resolution_percentage': 100.0,
-                'data_quality_percentage': 100.0
-            }
-        else:
-            # NON-CLEAN PATIENT (with issues)
-            patient = {
-                'patient_id': f'P{str(patient_number).zfill(3)}',
-                'subject_id': f'SUB{patient_number:04d}',
-                'site_id': site,
-                'subject_status': np.random.choice(['Active', 'Completed', 'Dropped'], p=[0.7, 0.2, 0.1]),
-                'enrollment_date': (datetime.now() - timedelta(days=np.random.randint(30, 180))).strftime('%Y-%m-%d'),
-                'last_visit_date': (datetime.now() - timedelta(days=np.random.randint(1, 29))).strftime('%Y-%m-%d'),
-                
-                # Issues (Not Clean)
-                'total_visits_expected': 12,
-                'visits_completed': np.random.randint(6, 10),
-                'missing_visits': np.random.randint(1, 4),
-                'total_pages_expected': 85,
-                'pages_completed': np.random.randint(60, 80),
-                'missing_pages': np.random.randint(5, 25),
-                'total_queries': np.random.randint(3, 8),
-                'open_queries': np.random.randint(1, 4),
-                'queries_resolved': lambda x: x['total_queries'] - x['open_queries'],
-                'non_conformant_data': np.random.randint(1, 3),
-                'data_entry_errors': np.random.randint(0, 2),
-                'lab_issues': np.random.randint(0, 2),
-                'safety_issues': np.random.randint(0, 1),
-                'adverse_events': np.random.randint(0, 2),
-                'serious_adverse_events': 0,
-                'forms_verified': np.random.choice([True, False], p=[0.3, 0.7]),
-                'forms_signed': np.random.choice([True, False], p=[0.2, 0.8]),
-                'sdv_completed': np.random.choice([True, False], p=[0.4, 0.6]),
-                'frozen_locked': np.random.choice([True, False], p=[0.5, 0.5]),
-                'coding_backlog': np.random.randint(1, 4),
-                'overdue_crfs': np.random.randint(0, 2),
-                'protocol_deviations': np.random.randint(0, 1),
-                'screen_failure': False,
-                'early_termination': False,
-                
-                # Calculated fields
-                'clean_status': 'Not Clean',
-                'dqi_score': np.random.randint(40, 65),
-                'risk_level': np.random.choice(['Medium', 'High'], p=[0.7, 0.3]),
-                'visit_compliance_percentage': round((np.random.randint(6, 10) / 12) * 100, 1),
-                'page_completion_percentage': round((np.random.randint(60, 80) / 85) * 100, 1),
-                'query_resolution_percentage': round(((np.random.randint(3, 8) - np.random.randint(1, 4)) / np.random.randint(3, 8)) * 100, 1),
-                'data_quality_percentage': round(100 - (np.random.randint(1, 3) * 20), 1)
-            }
-            patient['queries_resolved'] = patient['total_queries'] - patient['open_queries']
+        def with_issues(clean_value, values):
+            """Clean patients get clean_value, patients with issues get values"""
+            return np.where(is_clean, clean_value, values)
         
-        return patient
+        # Dates are lookups into one formatted string per day, 179 days back to 30 ahead
+        today = datetime.now()
+        calendar = np.array([(today + timedelta(days=days)).strftime('%Y-%m-%d') for days in range(-179, 31)],
+                            dtype=object)
+        enrollment_days = with_issues(0, -rng.integers(30, 180, n))
+        last_visit_days = with_issues(30, -rng.integers(1, 29, n))
+        
+        total_queries = with_issues(0, rng.integers(3, 8, n))
+        open_queries = with_issues(0, rng.integers(1, 4, n))
+        
+        return pd.DataFrame({
+            'patient_id': [f'P{str(number).zfill(3)}' for number in numbers],
+            'subject_id': [f'SUB{number:04d}' for number in numbers],
+            'site_id': np.asarray(list(site_distribution), dtype=object)[site_codes],
+            'subject_status': with_issues('Active', np.array(['Active', 'Completed', 'Dropped'], dtype=object)[
+                rng.choice(3, n, p=[0.7, 0.2, 0.1])]).astype(object),
+            'enrollment_date': calendar[enrollment_days + 179],
+            'last_visit_date': calendar[last_visit_days + 179],
+            
+            # Clean patients have perfect metrics
+            'total_visits_expected': 12,
+            'visits_completed': with_issues(12, rng.integers(6, 10, n)),
+            'missing_visits': with_issues(0, rng.integers(1, 4, n)),
+            'total_pages_expected': 85,
+            'pages_completed': with_issues(85, rng.integers(60, 80, n)),
+            'missing_pages': with_issues(0, rng.integers(5, 25, n)),
+            'total_queries': total_queries,
+            'open_queries': open_queries,
+            'queries_resolved': total_queries - open_queries,
+            'non_conformant_data': with_issues(0, rng.integers(1, 3, n)),
+            'data_entry_errors': with_issues(0, rng.integers(0, 2, n)),
+            'lab_issues': with_issues(0, rng.integers(0, 2, n)),
+            'safety_issues': 0,
+            'adverse_events': with_issues(0, rng.integers(0, 2, n)),
+            'serious_adverse_events': 0,
+            'forms_verified': with_issues(True, rng.random(n) < 0.3),
+            'forms_signed': with_issues(True, rng.random(n) < 0.2),
+            'sdv_completed': with_issues(True, rng.random(n) < 0.4),
+            'frozen_locked': with_issues(True, rng.random(n) < 0.5),
+            'coding_backlog': with_issues(0, rng.integers(1, 4, n)),
+            'overdue_crfs': with_issues(0, rng.integers(0, 2, n)),
+            'protocol_deviations': 0,
+            'screen_failure': False,
+            'early_termination': False,
+            
+            # Calculated fields
+            'clean_status': np.array(['Not Clean', 'Clean'], dtype=object)[is_clean.astype(int)],
+            'dqi_score': with_issues(95.0, rng.integers(40, 65, n)),
+            'risk_level': with_issues('Low', np.array(['Medium', 'High'], dtype=object)[
+                rng.choice(2, n, p=[0.7, 0.3])]).astype(object),
+            'visit_compliance_percentage': with_issues(100.0, (rng.integers(6, 10, n) / 12 * 100).round(1)),
+            'page_completion_percentage': with_issues(100.0, (rng.integers(60, 80, n) / 85 * 100).round(1)),
+            'query_resolution_percentage': with_issues(100.0, (
+                (rng.integers(3, 8, n) - rng.integers(1, 4, n)) / rng.integers(3, 8, n) * 100).round(1)),
+            'data_quality_percentage': with_issues(100.0, 100.0 - rng.integers(1, 3, n) * 20),
+        })
     
     @staticmethod
     def generate_controlled_dataset():
         """Generate data with user control"""
         
-        sites = ['Site_A_Delhi', 'Site_B_Mumbai', 'Site_C_Chennai', 
-                 'Site_D_Kolkata', 'Site_E_Bangalore']
-        
-        patients = []
-        patient_number = 1
+        sites = CONTROLLED_SITES
         
         # Create sidebar controls
         st.sidebar.markdown("### 🎛️ Data Configuration")
@@ -150,25 +134,4 @@ class DataController:
             )
         
         # Generate patients based on settings
-        for site, count in site_distribution.items():
-            site_clean_count = int(count * clean_ratio)
-            site_not_clean_count = count - site_clean_count
-            
-            # Add clean patients
-            for i in range(site_clean_count):
-                if patient_number > num_patients:
-                    break
-                patient = DataController.create_custom_patient(site, is_clean=True, patient_number=patient_number)
-                patients.append(patient)
-                patient_number += 1
-            
-            # Add not-clean patients
-            for i in range(site_not_clean_count):
-                if patient_number > num_patients:
-                    break
-                patient = DataController.create_custom_patient(site, is_clean=False, patient_number=patient_number)
-                patients.append(patient)
-                patient_number += 1
-        
-        df = pd.DataFrame(patients)
-        return df
\ No newline at end of file
+        return DataController.build_controlled_dataset(num_patients, clean_ratio, site_distribution)
@@ -1,108 +1,123 @@
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
-from config import SITES, REGIONS, CRAS, ACTIVE_TRIALS, THERAPEUTIC_AREAS
+import argparse
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from config import SITES, REGIONS, CRAS, ACTIVE_TRIALS, THERAPEUTIC_AREAS, DATA_GENERATION
+from utils.storage import DataStore
 
-def generate_multi_disease_data():
-    """Generate clinical trial data for multiple diseases"""
+SUBJECT_STATUSES = ['Active', 'Completed', 'Dropped']
+ISSUE_COLUMNS = ['missing_visits', 'open_queries', 'safety_issues', 'adverse_events', 'lab_issues']
+QUERY_TYPES = ['Data Entry Error', 'Missing Value', 'Out of Range',
+               'Protocol Deviation', 'Lab Value Issue', 'Safety Concern',
+               'Visit Window Violation', 'Concomitant Medication']
+
+# Per therapeutic area: chance a patient is clean, subject status weights
+# (Active, Completed, Dropped), inclusive (low, high) issue ranges for clean
+# patients (columns not listed are 0) and for patients with issues, and the
+# chance a patient with issues has verified / signed forms.
+PATIENT_PARAMETERS = {
+    'oncology': {
+        'clean_chance': 0.20,  # Cancer trials have more issues
+        'status_weights': [60, 20, 20],
+        'clean': {'adverse_events': (0, 2)},  # Cancer patients may have AEs even when clean
+        'issues': {'missing_visits': (1, 4), 'open_queries': (1, 6), 'safety_issues': (0, 3),
+                   'adverse_events': (1, 5), 'lab_issues': (0, 3)},
+        'forms_verified_chance': 0.5,
+        'forms_signed_chance': 0.5,
+    },
+    'cardiology': {
+        'clean_chance': 0.35,  # Heart disease trials
+        'status_weights': [70, 25, 5],
+        'clean': {'adverse_events': (0, 1)},
+        'issues': {'missing_visits': (1, 3), 'open_queries': (1, 4), 'safety_issues': (0, 2),
+                   'adverse_events': (0, 3), 'lab_issues': (0, 2)},
+        'forms_verified_chance': 0.70,
+        'forms_signed_chance': 0.60,
+    },
+    'endocrinology': {
+        'clean_chance': 0.40,  # Diabetes trials
+        'status_weights': [75, 20, 5],
+        'clean': {},
+        'issues': {'missing_visits': (1, 2), 'open_queries': (1, 3), 'safety_issues': (0, 1),
+                   'adverse_events': (0, 2), 'lab_issues': (0, 1)},
+        'forms_verified_chance': 0.80,
+        'forms_signed_chance': 0.75,
+    },
+    'default': {
+        'clean_chance': 0.30,
+        'status_weights': [1, 1, 1],
+        'clean': {},
+        'issues': {'missing_visits': (1, 3), 'open_queries': (1, 5), 'safety_issues': (0, 2),
+                   'adverse_events': (0, 3), 'lab_issues': (0, 2)},
+        'forms_verified_chance': 0.5,
+        'forms_signed_chance': 0.5,
+    },
+}
+# Neurology trials are complex: fewer clean patients, otherwise the default distributions
+PATIENT_PARAMETERS['neurology'] = dict(PATIENT_PARAMETERS['default'], clean_chance=0.25)
+
+def plan_generation_workers(trials, workers=None):
+    """Decide how many processes generate the trials; 1 means run serially"""
+    if workers is None:
+        workers = DATA_GENERATION['workers'] or os.cpu_count() or 1
+    num_patients = sum(trial['enrolled_patients'] for trial in trials)
+    return max(1, min(workers, len(trials), num_patients // DATA_GENERATION['min_patients_per_worker']))
+
+def generate_trials(trials, seed=None, resolved_queries=None, workers=1):
+    """Generate the patients, sites and queries of several trials, combined
+
+    seed makes the generated data reproducible (None = fresh data).
+    resolved_queries sets the resolved queries per trial (None = config default).
+    workers > 1 (or None for DATA_GENERATION['workers']) generates trials in a
+    process pool once there are DATA_GENERATION['min_patients_per_worker']
+    patients per worker; the output is identical to the serial path.
+    """
+    # Every trial gets its own RNG stream from the master seed, so the output
+    # does not depend on how many workers generate it
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(trials))
+    today = date.today()
+    workers = plan_generation_workers(trials, workers)
+    arguments = (trials, seed_sequences, [resolved_queries] * len(trials), [today] * len(trials))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields results in submission order, so trials stay in order
+            results = list(pool.map(generate_trial, *arguments))
+    else:
+        results = list(map(generate_trial, *arguments))
+
+    patients_df, sites_df, queries_df = (pd.concat(frames, ignore_index=True) for frames in zip(*results))
+    return patients_df, sites_df, queries_df
+
+def generate_multi_disease_data(seed=None, resolved_queries=None, workers=None):
+    """Generate clinical trial data for multiple diseases
+
+    Arguments are passed to generate_trials; workers defaults to
+    DATA_GENERATION['workers'].
+    """
     
     print("🏥 Generating Multi-Disease Clinical Trial Dataset...")
     print("=" * 60)
     
     # Create data directory if needed
-    import os
     os.makedirs('data', exist_ok=True)
     
-    all_patients = []
-    all_sites = []
-    all_queries = []
-    
     # Generate data for EACH trial
+    patients_df, sites_df, queries_df = generate_trials(ACTIVE_TRIALS, seed, resolved_queries, workers)
+    trial_sizes = patients_df['trial_id'].value_counts()
     for trial in ACTIVE_TRIALS:
-        print(f"\n📊 Generating data for: {trial['name']}")
+        print(f"\n📊 Generated data for: {trial['name']}")
         print(f"   Disease: {trial['disease']}")
-        
-        # 1. PATIENT DATA FOR THIS TRIAL
-        trial_patients = []
-        patients_per_trial = trial['enrolled_patients']
-        
-        # Assign sites to this trial
-        trial_sites = random.sample(SITES, min(trial['total_sites'], len(SITES)))
-        
-        for i in range(1, patients_per_trial + 1):
-            site = random.choice(trial_sites)
-            
-            # Disease-specific parameters
-            disease_type = trial['disease']
-            therapeutic_area = trial['therapeutic_area']
-            
-            # Decide if patient is clean (varies by disease type)
-            if therapeutic_area == 'oncology':
-                clean_chance = 0.20  # Cancer trials have more issues
-            elif therapeutic_area == 'cardiology':
-                clean_chance = 0.35  # Heart disease trials
-            elif therapeutic_area == 'endocrinology':
-                clean_chance = 0.40  # Diabetes trials
-            elif therapeutic_area == 'neurology':
-                clean_chance = 0.25  # Neurology trials complex
-            else:
-                clean_chance = 0.30  # Default
-            
-            is_clean = random.random() < clean_chance
-            
-            # Generate patient based on disease type
-            patient = generate_patient_by_disease(
-                patient_id=f"{trial['trial_id']}-P{str(i).zfill(3)}",
-                site=site,
-                trial_id=trial['trial_id'],
-                disease=disease_type,
-                therapeutic_area=therapeutic_area,
-                is_clean=is_clean
-            )
-            trial_patients.append(patient)
-        
-        trial_patient_df = pd.DataFrame(trial_patients)
-        all_patients.append(trial_patient_df)
-        
-        # 2. SITE DATA FOR THIS TRIAL
-        for site in trial_sites:
-            site_patients = trial_patient_df[trial_patient_df['site_id'] == site]
-            
-            site_info = {
-                'trial_id': trial['trial_id'],
-                'trial_name': trial['name'],
-                'disease': trial['disease'],
-                'therapeutic_area': trial['therapeutic_area'],
-                'site_id': site,
-                'site_name': site.replace('_', ' '),
-                'region': REGIONS[site],
-                'cra_in_charge': random.choice(CRAS),
-                'total_patients_enrolled': len(site_patients),
-                'patients_active': len(site_patients[site_patients['subject_status'] == 'Active']),
-                'total_open_queries': site_patients['open_queries'].sum(),
-                'total_safety_issues': site_patients['safety_issues'].sum(),
-                'total_adverse_events': site_patients['adverse_events'].sum(),
-                'monitoring_visits_completed': random.randint(5, 20),
-                'site_initiation_date': trial['start_date'],
-            }
-            all_sites.append(site_info)
-        
-        # 3. QUERY DATA FOR THIS TRIAL
-        trial_queries = generate_queries_for_trial(trial_patient_df, trial['trial_id'])
-        all_queries.extend(trial_queries)
-        
-        print(f"   ✅ Generated {len(trial_patient_df)} patients")
-    
-    # Combine all data
-    patients_df = pd.concat(all_patients, ignore_index=True)
-    sites_df = pd.DataFrame(all_sites)
-    queries_df = pd.DataFrame(all_queries)
+        print(f"   ✅ Generated {trial_sizes.get(trial['trial_id'], 0)} patients")
     
     # Save data
     patients_df.to_csv('data/patients.csv', index=False)
     sites_df.to_csv('data/sites.csv', index=False)
     queries_df.to_csv('data/queries.csv', index=False)
+    DataStore.write_all(patients_df, sites_df, queries_df)
     
     # Summary
     print("\n" + "=" * 60)
@@ -123,199 +138,361 @@ def generate_multi_disease_data():
         print(f"  {trial['icon']} {trial['disease']}: {len(trial_patients)} patients ({clean_percentage:.1f}% clean)")
     
     print("=" * 60)
-    print("✅ All data files saved in 'data/' folder")
+    print("✅ All data files saved in 'data/' folder (CSV + Parquet)")
     print("🎯 Ready to run the Multi-Disease Dashboard!")
     
     return patients_df, sites_df, queries_df
 
-def generate_patient_by_disease(patient_id, site, trial_id, disease, therapeutic_area, is_clean):
-    """Generate patient data specific to disease type"""
-    
-    # Base patient data
-    patient = {
-        'patient_id': patient_id,
-        'trial_id': trial_id,
-        'disease': disease,
+def generate_trial(trial, seed_sequence, resolved_queries=None, today=None):
+    """Generate the patients, site rows and queries of one trial from its own RNG stream"""
+    rng = np.random.default_rng(seed_sequence)
+    today = today or date.today()
+
+    # 1. PATIENT DATA FOR THIS TRIAL
+    # Assign sites to this trial
+    trial_sites = [SITES[i] for i in rng.choice(len(SITES), min(trial['total_sites'], len(SITES)), replace=False)]
+    trial_patient_df = generate_trial_patients(trial, trial_sites, rng, today)
+
+    # 2. SITE DATA FOR THIS TRIAL
+    site_rows = []
+    for site in trial_sites:
+        site_patients = trial_patient_df[trial_patient_df['site_id'] == site]
+        
+        site_info = {
+            'trial_id': trial['trial_id'],
+            'trial_name': trial['name'],
+            'disease': trial['disease'],
+            'therapeutic_area': trial['therapeutic_area'],
+            'site_id': site,
+            'site_name': site.replace('_', ' '),
+            'region': REGIONS[site],
+            'cra_in_charge': CRAS[rng.integers(len(CRAS))],
+            'total_patients_enrolled': len(site_patients),
+            'patients_active': len(site_patients[site_patients['subject_status'] == 'Active']),
+            'total_open_queries': site_patients['open_queries'].sum(),
+            'total_safety_issues': site_patients['safety_issues'].sum(),
+            'total_adverse_events': site_patients['adverse_events'].sum(),
+            'monitoring_visits_completed': int(rng.integers(5, 21)),
+            'site_initiation_date': trial['start_date'],
+        }
+        site_rows.append(site_info)
+
+    # 3. QUERY DATA FOR THIS TRIAL
+    trial_queries = generate_queries_for_trial(trial_patient_df, trial['trial_id'], rng, resolved_queries, today)
+
+    return trial_patient_df, pd.DataFrame(site_rows), trial_queries
+
+def draw_ranges(rng, ranges, size):
+    """One integer per row from an inclusive (low, high) range per row"""
+    low, high = ranges[:, 0], ranges[:, 1]
+    return rng.integers(low, high + 1, size=size)
+
+
+def generate_trial_patients(trial, trial_sites, rng, today=None, regions=None, first_number=1):
+    """Generate every patient of one trial with array draws from PATIENT_PARAMETERS
+
+    regions maps trial_sites to regions (None = REGIONS); patients are numbered
+    from first_number.
+    """
+    n = trial['enrolled_patients']
+    regions = regions or REGIONS
+    therapeutic_area = trial['therapeutic_area']
+    params = PATIENT_PARAMETERS.get(therapeutic_area, PATIENT_PARAMETERS['default'])
+
+    # Decide which patients are clean (varies by disease type)
+    is_clean = rng.random(n) < params['clean_chance']
+
+    # String columns are lookups into small tables of their distinct values
+    site_codes = rng.integers(0, len(trial_sites), n)
+    days_ago = rng.integers(30, 181, n)
+    today = today or date.today()
+    enrollment_dates = np.array([(today - timedelta(days=int(days))).strftime('%Y-%m-%d')
+                                 for days in range(181)], dtype=object)
+    weights = np.asarray(params['status_weights'], dtype=float)
+    status_codes = rng.choice(len(SUBJECT_STATUSES), n, p=weights / weights.sum())
+    subject_status = np.asarray(SUBJECT_STATUSES, dtype=object)[status_codes]
+
+    patients = pd.DataFrame({
+        'patient_id': [f"{trial['trial_id']}-P{i:03}" for i in range(first_number, first_number + n)],
+        'trial_id': trial['trial_id'],
+        'disease': trial['disease'],
         'therapeutic_area': therapeutic_area,
-        'site_id': site,
-        'region': REGIONS[site],
-        'cra_assigned': random.choice(CRAS),
-        'enrollment_date': (datetime.now() - timedelta(days=random.randint(30, 180))).strftime('%Y-%m-%d'),
-    }
-    
-    # Disease-specific parameters
-    if therapeutic_area == 'oncology':
-        # Cancer patients have more complex data
-        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[60, 20, 20])[0]
-        if is_clean:
-            patient.update({
-                'missing_visits': 0,
-                'open_queries': 0,
-                'safety_issues': 0,
-                'adverse_events': random.randint(0, 2),  # Cancer patients may have AEs even when clean
-                'lab_issues': 0,
-                'forms_verified': True,
-                'forms_signed': True,
-            })
-        else:
-            patient.update({
-                'missing_visits': random.randint(1, 4),
-                'open_queries': random.randint(1, 6),
-                'safety_issues': random.randint(0, 3),
-                'adverse_events': random.randint(1, 5),
-                'lab_issues': random.randint(0, 3),
-                'forms_verified': random.choice([True, False]),
-                'forms_signed': random.choice([True, False]),
-            })
-    
-    elif therapeutic_area == 'cardiology':
-        # Heart disease patients
-        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[70, 25, 5])[0]
-        if is_clean:
-            patient.update({
-                'missing_visits': 0,
-                'open_queries': 0,
-                'safety_issues': 0,
-                'adverse_events': random.randint(0, 1),
-                'lab_issues': 0,
-                'forms_verified': True,
-                'forms_signed': True,
-            })
-        else:
-            patient.update({
-                'missing_visits': random.randint(1, 3),
-                'open_queries': random.randint(1, 4),
-                'safety_issues': random.randint(0, 2),
-                'adverse_events': random.randint(0, 3),
-                'lab_issues': random.randint(0, 2),
-                'forms_verified': random.choices([True, False], weights=[70, 30])[0],
-                'forms_signed': random.choices([True, False], weights=[60, 40])[0],
-            })
-    
-    elif therapeutic_area == 'endocrinology':
-        # Diabetes patients
-        patient['subject_status'] = random.choices(['Active', 'Completed', 'Dropped'], weights=[75, 20, 5])[0]
-        if is_clean:
-            patient.update({
-                'missing_visits': 0,
-                'open_queries': 0,
-                'safety_issues': 0,
-                'adverse_events': 0,
-                'lab_issues': 0,
-                'forms_verified': True,
-                'forms_signed': True,
-            })
-        else:
-            patient.update({
-                'missing_visits': random.randint(1, 2),
-                'open_queries': random.randint(1, 3),
-                'safety_issues': random.randint(0, 1),
-                'adverse_events': random.randint(0, 2),
-                'lab_issues': random.randint(0, 1),
-                'forms_verified': random.choices([True, False], weights=[80, 20])[0],
-                'forms_signed': random.choices([True, False], weights=[75, 25])[0],
-            })
-    
-    else:  # Default for other diseases
-        patient['subject_status'] = random.choice(['Active', 'Completed', 'Dropped'])
-        if is_clean:
-            patient.update({
-                'missing_visits': 0,
-                'open_queries': 0,
-                'safety_issues': 0,
-                'adverse_events': 0,
-                'lab_issues': 0,
-                'forms_verified': True,
-                'forms_signed': True,
-            })
-        else:
-            patient.update({
-                'missing_visits': random.randint(1, 3),
-                'open_queries': random.randint(1, 5),
-                'safety_issues': random.randint(0, 2),
-                'adverse_events': random.randint(0, 3),
-                'lab_issues': random.randint(0, 2),
-                'forms_verified': random.choice([True, False]),
-                'forms_signed': random.choice([True, False]),
-            })
-    
+        'site_id': np.asarray(trial_sites, dtype=object)[site_codes],
+        'region': np.asarray([regions[site] for site in trial_sites], dtype=object)[site_codes],
+        'cra_assigned': np.asarray(CRAS, dtype=object)[rng.integers(0, len(CRAS), n)],
+        'enrollment_date': enrollment_dates[days_ago],
+        'subject_status': subject_status,
+    })
+
+    # Issue counts: clean and not-clean patients draw from their own ranges
+    for column in ISSUE_COLUMNS:
+        ranges = np.where(is_clean[:, None],
+                          np.asarray(params['clean'].get(column, (0, 0))),
+                          np.asarray(params['issues'][column]))
+        patients[column] = draw_ranges(rng, ranges, n)
+    patients['forms_verified'] = is_clean | (rng.random(n) < params['forms_verified_chance'])
+    patients['forms_signed'] = is_clean | (rng.random(n) < params['forms_signed_chance'])
+
     # Common metrics
-    patient['total_visits_expected'] = 12
-    patient['visits_completed'] = random.randint(6, 12) if patient['subject_status'] == 'Active' else 12
-    patient['total_pages_expected'] = 85
-    patient['pages_completed'] = random.randint(70, 85) if is_clean else random.randint(50, 80)
-    patient['missing_pages'] = patient['total_pages_expected'] - patient['pages_completed']
-    patient['total_queries'] = patient['open_queries'] + random.randint(0, 3)
-    patient['queries_resolved'] = patient['total_queries'] - patient['open_queries']
-    patient['non_conformant_data'] = 0 if is_clean else random.randint(1, 4)
-    patient['sdv_completed'] = True if is_clean else random.choice([True, False])
-    patient['frozen_locked'] = True if is_clean else random.choice([True, False])
-    patient['coding_backlog'] = random.randint(0, 2) if is_clean else random.randint(1, 6)
-    patient['overdue_crfs'] = 0 if is_clean else random.randint(0, 3)
-    patient['protocol_deviations'] = 0 if is_clean else random.randint(0, 2)
-    
+    patients['total_visits_expected'] = 12
+    patients['visits_completed'] = np.where(status_codes == 0, rng.integers(6, 13, n), 12)
+    patients['total_pages_expected'] = 85
+    patients['pages_completed'] = np.where(is_clean, rng.integers(70, 86, n), rng.integers(50, 81, n))
+    patients['missing_pages'] = patients['total_pages_expected'] - patients['pages_completed']
+    patients['total_queries'] = patients['open_queries'] + rng.integers(0, 4, n)
+    patients['queries_resolved'] = patients['total_queries'] - patients['open_queries']
+    patients['non_conformant_data'] = np.where(is_clean, 0, rng.integers(1, 5, n))
+    patients['sdv_completed'] = is_clean | (rng.random(n) < 0.5)
+    patients['frozen_locked'] = is_clean | (rng.random(n) < 0.5)
+    patients['coding_backlog'] = np.where(is_clean, rng.integers(0, 3, n), rng.integers(1, 7, n))
+    patients['overdue_crfs'] = np.where(is_clean, 0, rng.integers(0, 4, n))
+    patients['protocol_deviations'] = np.where(is_clean, 0, rng.integers(0, 3, n))
+
     # Clean status
-    patient['clean_status'] = 'Clean' if is_clean else 'Not Clean'
-    
-    return patient
+    patients['clean_status'] = np.array(['Not Clean', 'Clean'], dtype=object)[is_clean.astype(int)]
 
-def generate_queries_for_trial(patient_df, trial_id):
-    """Generate queries for a specific trial"""
-    query_types = ['Data Entry Error', 'Missing Value', 'Out of Range', 
-                   'Protocol Deviation', 'Lab Value Issue', 'Safety Concern',
-                   'Visit Window Violation', 'Concomitant Medication']
-    
-    queries = []
-    query_id = 10000  # Start ID
-    
-    for _, patient in patient_df.iterrows():
-        if patient['open_queries'] > 0:
-            for _ in range(patient['open_queries']):
-                query_date = datetime.strptime(patient['enrollment_date'], '%Y-%m-%d') + \
-                            timedelta(days=random.randint(0, 100))
-                
-                query = {
-                    'query_id': f'Q{query_id}',
-                    'trial_id': trial_id,
-                    'patient_id': patient['patient_id'],
-                    'site_id': patient['site_id'],
-                    'disease': patient['disease'],
-                    'query_type': random.choice(query_types),
-                    'query_description': f'Query regarding {random.choice(["visit data", "lab results", "safety event", "medication"])} for {patient["disease"]} patient',
-                    'query_priority': random.choice(['Low', 'Medium', 'High']),
-                    'query_status': 'Open',
-                    'query_created_date': query_date.strftime('%Y-%m-%d'),
-                    'query_age_days': (datetime.now() - query_date).days,
-                    'assigned_to': patient['cra_assigned'],
-                }
-                queries.append(query)
-                query_id += 1
-    
-    # Add some resolved queries
-    for _ in range(min(50, len(patient_df))):
-        patient = patient_df.sample(1).iloc[0]
-        query_date = datetime.strptime(patient['enrollment_date'], '%Y-%m-%d') + \
-                    timedelta(days=random.randint(0, 100))
-        
-        query = {
-            'query_id': f'Q{query_id}',
-            'trial_id': trial_id,
-            'patient_id': patient['patient_id'],
-            'site_id': patient['site_id'],
-            'disease': patient['disease'],
-            'query_type': random.choice(query_types),
-            'query_description': f'Resolved query about {random.choice(["medication", "vital signs", "patient history"])}',
-            'query_priority': random.choice(['Low', 'Medium']),
-            'query_status': 'Resolved',
-            'query_created_date': query_date.strftime('%Y-%m-%d'),
-            'query_resolved_date': (query_date + timedelta(days=random.randint(1, 14))).strftime('%Y-%m-%d'),
-            'query_age_days': (datetime.now() - query_date).days,
-            'assigned_to': patient['cra_assigned'],
-        }
-        queries.append(query)
-        query_id += 1
-    
-    return queries
+    return patients
+
+def date_strings(days):
+    """'%Y-%m-%d' strings of datetime64[D] values, formatted once per distinct day"""
+    if len(days) == 0:
+        return np.array([], dtype=object)
+    first = days.min()
+    calendar = np.arange(first, days.max() + 1).astype(str).astype(object)
+    return calendar[(days - first).astype(np.int64)]
+
+
+def generate_queries_for_trial(patient_df, trial_id, rng, resolved_queries=None, today=None, first_query_id=10000):
+    """Generate queries for a specific trial
+
+    Each patient gets one open query per open_queries; resolved queries go to
+    randomly drawn patients. resolved_queries defaults to
+    DATA_GENERATION['resolved_queries_per_trial'], capped at the patient count.
+    Query ids are numbered from first_query_id.
+    """
+    if resolved_queries is None:
+        resolved_queries = min(DATA_GENERATION['resolved_queries_per_trial'], len(patient_df))
+
+    # Row positions of the patient behind each query: open queries first, then resolved
+    open_positions = np.repeat(np.arange(len(patient_df)), patient_df['open_queries'].to_numpy())
+    resolved_positions = rng.integers(0, len(patient_df), resolved_queries)
+    positions = np.concatenate([open_positions, resolved_positions])
+    num_open = len(open_positions)
+    total = len(positions)
+    is_resolved = np.arange(total) >= num_open
+
+    enrollment = pd.to_datetime(patient_df['enrollment_date'], format='%Y-%m-%d').to_numpy().astype('datetime64[D]')
+    query_date = enrollment[positions] + rng.integers(0, 101, total).astype('timedelta64[D]')
+    today = np.datetime64(today or date.today())
+
+    # Low-cardinality columns are categoricals built from codes, as in QUERY_SCHEMA
+    site_codes, site_values = pd.factorize(patient_df['site_id'])
+    cra_codes, cra_values = pd.factorize(patient_df['cra_assigned'])
+    disease_codes, diseases = pd.factorize(patient_df['disease'])
+    disease_codes = disease_codes[positions]
+
+    # Descriptions come from a table of every (topic, disease) combination, then the resolved ones
+    open_topics = ["visit data", "lab results", "safety event", "medication"]
+    resolved_topics = ["medication", "vital signs", "patient history"]
+    descriptions = [f'Query regarding {topic} for {disease} patient' for topic in open_topics for disease in diseases]
+    descriptions += [f'Resolved query about {topic}' for topic in resolved_topics]
+    description_codes = np.where(
+        is_resolved,
+        len(open_topics) * len(diseases) + rng.integers(0, len(resolved_topics), total),
+        rng.integers(0, len(open_topics), total) * len(diseases) + disease_codes)
+
+    # Resolved queries are only Low or Medium priority
+    priority_codes = np.where(is_resolved, rng.integers(0, 2, total), rng.integers(0, 3, total))
+
+    resolved_dates = np.full(total, np.nan, dtype=object)
+    resolved_dates[num_open:] = date_strings(query_date[num_open:] + rng.integers(1, 15, resolved_queries)
+                                             .astype('timedelta64[D]'))
+
+    return pd.DataFrame({
+        'query_id': [f'Q{query_id}' for query_id in range(first_query_id, first_query_id + total)],
+        'trial_id': trial_id,
+        'patient_id': patient_df['patient_id'].to_numpy()[positions],
+        'site_id': pd.Categorical.from_codes(site_codes[positions], site_values),
+        'disease': pd.Categorical.from_codes(disease_codes, diseases),
+        'query_type': pd.Categorical.from_codes(rng.integers(0, len(QUERY_TYPES), total), QUERY_TYPES),
+        'query_description': pd.Categorical.from_codes(description_codes, descriptions),
+        'query_priority': pd.Categorical.from_codes(priority_codes, ['Low', 'Medium', 'High']),
+        'query_status': pd.Categorical.from_codes(is_resolved.astype(np.int8), ['Open', 'Resolved']),
+        'query_created_date': date_strings(query_date),
+        'query_age_days': (today - query_date).astype(np.int64),
+        'assigned_to': pd.Categorical.from_codes(cra_codes[positions], cra_values),
+        'query_resolved_date': resolved_dates,
+    })
+
+def plan_large_dataset(num_patients, num_sites, num_trials):
+    """Synthetic trials and sites for a dataset of the requested scale
+
+    Trials reuse the ACTIVE_TRIALS designs in turn and split the patients
+    evenly; sites are dealt out to trials round-robin.
+    """
+    site_ids = [f'Site_{number:05d}' for number in range(1, num_sites + 1)]
+    region_names = list(dict.fromkeys(REGIONS.values()))
+    regions = {site: region_names[number % len(region_names)] for number, site in enumerate(site_ids)}
+    sizes = np.full(num_trials, num_patients // num_trials)
+    sizes[:num_patients % num_trials] += 1
+
+    trials = []
+    for number in range(num_trials):
+        design = ACTIVE_TRIALS[number % len(ACTIVE_TRIALS)]
+        trial_sites = site_ids[number::num_trials] or [site_ids[number % num_sites]]
+        trials.append(dict(design, trial_id=f'SYN-{number + 1:05d}', name=f"{design['name']} {number + 1}",
+                           enrolled_patients=int(sizes[number]), total_sites=len(trial_sites), sites=trial_sites))
+    return trials, regions
+
+def write_chunks(chunk_queue, output_dir, failures):
+    """Writer thread: append queued (table, frame) chunks to their CSV files until None arrives"""
+    written = set()
+    while True:
+        item = chunk_queue.get()
+        if item is None:
+            return
+        if failures:
+            # Keep draining so the generating thread never blocks on a full queue
+            continue
+        table, frame = item
+        try:
+            frame.to_csv(os.path.join(output_dir, f'{table}.csv'), mode='a' if table in written else 'w',
+                         header=table not in written, index=False)
+            written.add(table)
+        except Exception as e:
+            failures.append(e)
+
+def site_rows_for_trial(trial, site_totals, regions, rng):
+    """Site table rows of one trial from its per-site patient totals"""
+    site_totals = site_totals.reindex(trial['sites'], fill_value=0)
+    return pd.DataFrame({
+        'trial_id': trial['trial_id'],
+        'trial_name': trial['name'],
+        'disease': trial['disease'],
+        'therapeutic_area': trial['therapeutic_area'],
+        'site_id': trial['sites'],
+        'site_name': [site.replace('_', ' ') for site in trial['sites']],
+        'region': [regions[site] for site in trial['sites']],
+        'cra_in_charge': np.asarray(CRAS, dtype=object)[rng.integers(0, len(CRAS), len(trial['sites']))],
+        'total_patients_enrolled': site_totals['total_patients_enrolled'].to_numpy(),
+        'patients_active': site_totals['patients_active'].to_numpy(),
+        'total_open_queries': site_totals['total_open_queries'].to_numpy(),
+        'total_safety_issues': site_totals['total_safety_issues'].to_numpy(),
+        'total_adverse_events': site_totals['total_adverse_events'].to_numpy(),
+        'monitoring_visits_completed': rng.integers(5, 21, len(trial['sites'])),
+        'site_initiation_date': trial['start_date'],
+    })
+
+def generate_large_dataset(num_patients, num_sites=None, num_trials=None, queries_per_patient=None,
+                           output_dir='data/large', chunk_rows=None, seed=None):
+    """Write a synthetic dataset of any size to CSV in fixed-size chunks
+
+    Chunks are generated on this thread while a writer thread appends earlier
+    ones to disk. At most DATA_GENERATION['write_queue_chunks'] chunks wait in
+    between, so peak memory depends on chunk_rows, not on the dataset size.
+    queries_per_patient is the target average number of queries per patient:
+    open ones follow each patient's open_queries, resolved ones make up the
+    rest, budgeted across chunks so the overall average hits the target.
+    Open queries are never dropped to keep the tables consistent, so when
+    they exceed what is left of the budget the average comes out higher:
+    the value is a floor, not an exact rate.
+    Sites, trials and queries default to the DATA_GENERATION proportions.
+    Every trial needs at least one patient.
+    Returns the number of rows written per table.
+    """
+    num_sites = num_sites or max(1, num_patients // DATA_GENERATION['patients_per_site'])
+    num_trials = num_trials or max(1, num_patients // DATA_GENERATION['patients_per_trial'])
+    if num_trials > num_patients:
+        raise ValueError(f"Cannot spread {num_patients:,} patients over {num_trials:,} trials; "
+                         f"every trial needs at least one patient")
+    if queries_per_patient is None:
+        queries_per_patient = DATA_GENERATION['queries_per_patient']
+    chunk_rows = chunk_rows or DATA_GENERATION['chunk_rows']
+
+    print(f"🏭 Generating {num_patients:,} patients across {num_trials:,} trials and {num_sites:,} sites...")
+    os.makedirs(output_dir, exist_ok=True)
+    trials, regions = plan_large_dataset(num_patients, num_sites, num_trials)
+    trial_seeds = np.random.SeedSequence(seed).spawn(num_trials)
+    today = date.today()
+
+    chunk_queue = queue.Queue(maxsize=DATA_GENERATION['write_queue_chunks'])
+    failures = []
+    writer = threading.Thread(target=write_chunks, args=(chunk_queue, output_dir, failures), daemon=True)
+    writer.start()
+    rows = {'patients': 0, 'sites': 0, 'queries': 0}
+    open_queries = 0
+    next_query_id = 10000
+    try:
+        for trial, trial_seed in zip(trials, trial_seeds):
+            starts = range(0, trial['enrolled_patients'], chunk_rows)
+            # One stream per chunk plus one for the site rows
+            chunk_seeds = trial_seed.spawn(len(starts) + 1)
+            site_totals = None
+            for start, chunk_seed in zip(starts, chunk_seeds):
+                rng = np.random.default_rng(chunk_seed)
+                size = min(chunk_rows, trial['enrolled_patients'] - start)
+                patients = generate_trial_patients(dict(trial, enrolled_patients=size), trial['sites'], rng,
+                                                   today, regions, first_number=start + 1)
+                open_queries += int(patients['open_queries'].sum())
+                # Budgeted on the running totals so chunks under the target make up for ones over it
+                target = round(queries_per_patient * (rows['patients'] + size))
+                resolved = max(0, target - rows['queries'] - int(patients['open_queries'].sum()))
+                queries = generate_queries_for_trial(patients, trial['trial_id'], rng, resolved, today, next_query_id)
+                next_query_id += len(queries)
+
+                chunk_totals = pd.DataFrame({
+                    'site_id': patients['site_id'],
+                    'total_patients_enrolled': 1,
+                    'patients_active': (patients['subject_status'] == 'Active').astype(int),
+                    'total_open_queries': patients['open_queries'],
+                    'total_safety_issues': patients['safety_issues'],
+                    'total_adverse_events': patients['adverse_events'],
+                }).groupby('site_id', sort=False).sum()
+                # Totals are exact integers, so summing per chunk matches one big groupby
+                site_totals = chunk_totals if site_totals is None else \
+                    pd.concat([site_totals, chunk_totals]).groupby(level=0, sort=False).sum()
+
+                for table, frame in [('patients', patients), ('queries', queries)]:
+                    chunk_queue.put((table, frame))
+                    rows[table] += len(frame)
+                del patients, queries
+                if failures:
+                    raise failures[0]
+                print(f"   ✅ {rows['patients']:,} / {num_patients:,} patients, {rows['queries']:,} queries")
+
+            sites = site_rows_for_trial(trial, site_totals, regions, np.random.default_rng(chunk_seeds[-1]))
+            chunk_queue.put(('sites', sites))
+            rows['sites'] += len(sites)
+    finally:
+        chunk_queue.put(None)
+        writer.join()
+    if failures:
+        raise failures[0]
+
+    print(f"✅ Wrote {rows['patients']:,} patients, {rows['sites']:,} site rows and "
+          f"{rows['queries']:,} queries to '{output_dir}/'")
+    if rows['queries'] > round(queries_per_patient * num_patients):
+        print(f"⚠️ {rows['queries'] / num_patients:.2f} queries per patient instead of {queries_per_patient:g}: "
+              f"open queries ({open_queries / num_patients:.2f} per patient) are always kept")
+    return rows
 
 if __name__ == "__main__":
-   generate_multi_disease_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate the demo clinical trial dataset, or a large "
+                                                 "synthetic one streamed to CSV with --patients")
+    parser.add_argument('--patients', type=int, help="number of patients in a large synthetic dataset")
+    parser.add_argument('--sites', type=int, help="number of sites (default: proportional to patients)")
+    parser.add_argument('--trials', type=int, help="number of trials (default: proportional to patients)")
+    parser.add_argument('--queries-per-patient', type=float,
+                        help="target average queries per patient (open queries can push it higher)")
+    parser.add_argument('--output', default='data/large', help="folder for the large dataset's CSV files")
+    parser.add_argument('--chunk-rows', type=int, help="patients generated and written per chunk")
+    parser.add_argument('--seed', type=int, help="master seed for reproducible output")
+    parser.add_argument('--workers', type=int,
+                        help="processes generating the demo trials (default: DATA_GENERATION['workers'])")
+    args = parser.parse_args()
+
+    if args.patients:
+        generate_large_dataset(args.patients, args.sites, args.trials, args.queries_per_patient,
+                               args.output, args.chunk_rows, args.seed)
+    else:
+        generate_multi_disease_data(seed=args.seed, workers=args.workers)
\ No newline at end of file
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import random
 from datetime import datetime, timedelta
+from utils.storage import DataStore
 
 def generate_simple_data():
     """Generate simple but complete dataset"""
@@ -92,6 +93,8 @@ def generate_simple_data():
     query_df.to_csv('data/queries.csv', index=False)
     print(f"✅ Queries: {len(query_df)}")
     
+    DataStore.write_all(patient_df, site_df, query_df)
+    
     print("=" * 50)
     print("🎯 Dataset generation complete!")
     print("   • Patients: 200")
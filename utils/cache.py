@@ -0,0 +1,177 @@
+"""
+Persistent cache of processed patient, site and query frames
+
+An entry is keyed by the content hash and mtime of every source table plus
+a hash of the scoring configuration, so editing a data file or changing
+DQI_WEIGHTS / THRESHOLDS / clean rules automatically misses the cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+from config import (DQI_WEIGHTS, THRESHOLDS, CLEAN_PATIENT_RULES,
+                    STUDY_CLEAN_PATIENT_RULES, PROCESSED_CACHE)
+from utils.storage import DataStore, TABLE_SCHEMAS
+
+# Bump when the cached frame layout changes so old entries are ignored
+CACHE_FORMAT_VERSION = 1
+FINGERPRINT_FILE = 'fingerprints.json'
+CACHED_FRAMES = ['patients', 'sites', 'queries']
+
+
+class ProcessedDataCache:
+    """Store processed frames on disk and evict old versions"""
+
+    def __init__(self, directory=None, max_entries=None, max_size_mb=None):
+        self.directory = directory or PROCESSED_CACHE['directory']
+        self.max_entries = max_entries if max_entries is not None else PROCESSED_CACHE['max_entries']
+        self.max_size_mb = max_size_mb if max_size_mb is not None else PROCESSED_CACHE['max_size_mb']
+
+    @staticmethod
+    def config_hash():
+        """Hash of every setting that changes the processed output"""
+        scoring = {
+            'dqi_weights': DQI_WEIGHTS,
+            'thresholds': THRESHOLDS,
+            'clean_rules': CLEAN_PATIENT_RULES,
+            'study_clean_rules': STUDY_CLEAN_PATIENT_RULES,
+            'version': CACHE_FORMAT_VERSION,
+        }
+        encoded = json.dumps(scoring, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def frame_digest(df):
+        """Content hash of a DataFrame's values and column names"""
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=16)
+        digest.update(json.dumps(list(map(str, df.columns))).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_digest(path, block_size=1 << 20):
+        """Content hash of a file"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _load_fingerprints(self):
+        """Remembered content hashes of the source files"""
+        path = os.path.join(self.directory, FINGERPRINT_FILE)
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_fingerprints(self, fingerprints):
+        """Persist the remembered content hashes"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, FINGERPRINT_FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump(fingerprints, handle)
+        os.replace(temp_path, path)
+
+    def source_fingerprints(self, data_dir='data'):
+        """(path, mtime, size, content hash) of each source table
+
+        Each table is fingerprinted through DataStore.source_path, i.e. the
+        file read_table actually loads (the CSV when it is newer than the
+        Parquet copy). Content hashes are remembered per (mtime, size), so
+        unchanged files are not re-read on every start.
+        """
+        known = self._load_fingerprints()
+        fingerprints = []
+        changed = False
+        for name in TABLE_SCHEMAS:
+            path = os.path.abspath(DataStore.source_path(name, data_dir))
+            stat = os.stat(path)
+            entry = known.get(path)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                digest = entry['digest']
+            else:
+                digest = self.file_digest(path)
+                known[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'digest': digest}
+                changed = True
+            fingerprints.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size, digest))
+        if changed:
+            self._save_fingerprints(known)
+        return fingerprints
+
+    def cache_key(self, data_dir='data'):
+        """Key for the current source files and scoring configuration"""
+        payload = json.dumps([self.source_fingerprints(data_dir), self.config_hash()])
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def entry_path(self, key):
+        """Directory holding one cache entry"""
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """Return the cached (patients, sites, queries) for a key, or None"""
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            frames = tuple(pd.read_pickle(os.path.join(path, f'{name}.pkl')) for name in CACHED_FRAMES)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache entry {key}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # Mark as recently used for eviction
+        os.utime(path)
+        return frames
+
+    def store(self, key, frames):
+        """Write (patients, sites, queries) under a key, then evict old entries"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entry_path(key)
+        temp_path = path + '.tmp'
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for name, df in zip(CACHED_FRAMES, frames):
+            df.to_pickle(os.path.join(temp_path, f'{name}.pkl'))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+        self.evict(keep=key)
+
+    @staticmethod
+    def _directory_size(path):
+        """Total size of the files in a cache entry"""
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def entries(self):
+        """Cache entries as (key, size in bytes, last used), newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                found.append((entry.name, self._directory_size(entry.path), entry.stat().st_mtime))
+        return sorted(found, key=lambda item: item[2], reverse=True)
+
+    def evict(self, keep=None):
+        """Drop least recently used entries beyond max_entries or max_size_mb"""
+        max_bytes = self.max_size_mb * 1024 ** 2
+        total = 0
+        kept = 0
+        removed = []
+        entries = self.entries()
+        # The entry just written is always kept
+        entries.sort(key=lambda item: item[0] != keep)
+        for key, size, _ in entries:
+            if key == keep or (kept < self.max_entries and total + size <= max_bytes):
+                total += size
+                kept += 1
+            else:
+                shutil.rmtree(self.entry_path(key), ignore_errors=True)
+                removed.append(key)
+        return removed
+
+    def clear(self):
+        """Remove every cached entry"""
+        shutil.rmtree(self.directory, ignore_errors=True)
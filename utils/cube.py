@@ -0,0 +1,356 @@
+"""
+Pre-aggregated filter cube for the dashboard KPIs
+
+Patients are rolled up once into cells over the sidebar dimensions. Each cell
+holds a patient count plus the sum and sum of squares of every measure, so
+KPIs for any filter combination come from summing the matching cells instead
+of re-scanning the patient frame. The cell count is bounded by the number of
+dimension combinations, not by the number of patients.
+"""
+import numpy as np
+import pandas as pd
+from calculations import IncrementalPatientProcessor
+
+CUBE_DIMENSIONS = ['trial_id', 'disease', 'site_id', 'region', 'subject_status',
+                   'clean_status', 'risk_level', 'dqi_bucket']
+CUBE_MEASURES = ['dqi_score', 'open_queries', 'safety_issues', 'visits_completed',
+                 'queries_resolved', 'total_queries', 'forms_verified', 'protocol_deviations']
+
+EMPTY_SUMMARY = {
+    'total_patients': 0,
+    'clean_patients': 0,
+    'clean_percentage': 0,
+    'avg_dqi': 0,
+    'total_open_queries': 0,
+    'total_safety_issues': 0,
+    'dqi_status': 'N/A',
+    'clean_status': 'N/A',
+    'active_patients': 0,
+}
+
+
+class FilterCube:
+    """Counts, sums and sums of squares per combination of filter dimensions"""
+
+    def __init__(self, cells, dimensions, measures, key='patient_id'):
+        self.dimensions = dimensions
+        self.measures = measures
+        self.key = key
+        # Dataset version the cells reflect, for callers that track one
+        self.version = None
+        self._rows = None
+        self._set_cells(cells)
+
+    @staticmethod
+    def input_columns(df):
+        """Dimensions and measures available in a patient frame"""
+        dimensions = [col for col in CUBE_DIMENSIONS if col in df.columns and col != 'dqi_bucket']
+        if 'dqi_score' in df.columns:
+            dimensions.append('dqi_bucket')
+        measures = [col for col in CUBE_MEASURES
+                    if col in df.columns and pd.api.types.is_numeric_dtype(df[col])]
+        return dimensions, measures
+
+    @staticmethod
+    def dqi_buckets(scores):
+        """Whole-point DQI buckets, one per step of the sidebar slider
+
+        A slider range low..high keeps scores from low up to the end of point
+        high (see BitmapFilterEngine), i.e. exactly the buckets low..high.
+        """
+        return np.floor(np.asarray(scores, dtype=float))
+
+    @staticmethod
+    def aggregate(df, dimensions, measures):
+        """Roll patient rows up into cube cells"""
+        frame = pd.DataFrame(index=df.index)
+        for column in dimensions:
+            if column == 'dqi_bucket':
+                frame[column] = FilterCube.dqi_buckets(df['dqi_score'])
+            else:
+                frame[column] = df[column]
+        frame['patient_count'] = 1
+        for column in measures:
+            values = df[column].to_numpy(dtype=float)
+            frame[f'{column}_sum'] = values
+            frame[f'{column}_sq'] = values * values
+
+        if not dimensions:
+            return frame.sum().to_frame().T
+        return frame.groupby(dimensions, observed=True, sort=False, dropna=False).sum().reset_index()
+
+    def _set_cells(self, cells):
+        """Store cells as dimension codes and one value matrix for fast queries"""
+        self.cells = cells
+        self.value_columns = [col for col in cells.columns if col not in self.dimensions]
+        self._values = cells[self.value_columns].to_numpy(dtype=float)
+        self._counts = cells['patient_count'].to_numpy(dtype=float)
+        self._codes = {}
+        for column in self.dimensions:
+            if column == 'dqi_bucket':
+                continue
+            codes, categories = pd.factorize(cells[column], use_na_sentinel=True)
+            self._codes[column] = (codes, pd.Index(categories))
+        self._buckets = cells['dqi_bucket'].to_numpy(dtype=float) if 'dqi_bucket' in self.dimensions else None
+        # Built on the first refresh
+        self._cell_index = None
+
+    @classmethod
+    def build(cls, patients, key='patient_id'):
+        """Build a cube from a processed patient frame"""
+        dimensions, measures = cls.input_columns(patients)
+        cube = cls(cls.aggregate(patients, dimensions, measures), dimensions, measures, key)
+        cube._keep_rows(patients)
+        return cube
+
+    def row_columns(self):
+        """Patient columns the cells are computed from"""
+        columns = [col for col in self.dimensions if col != 'dqi_bucket'] + self.measures
+        if 'dqi_bucket' in self.dimensions and 'dqi_score' not in columns:
+            columns.append('dqi_score')
+        return columns
+
+    def _keep_rows(self, patients):
+        """Remember each patient's cube inputs so refresh can take old versions out"""
+        self._rows = None
+        if self.key in patients.columns:
+            self._rows = patients[[self.key] + self.row_columns()].reset_index(drop=True)
+
+    def rebuild(self, patients):
+        """Re-aggregate every patient, e.g. after the columns changed"""
+        self.dimensions, self.measures = self.input_columns(patients)
+        self._set_cells(self.aggregate(patients, self.dimensions, self.measures))
+        self._keep_rows(patients)
+        return self
+
+    def can_refresh(self, patients):
+        """Whether refresh can update the cube for a new version of the patient frame"""
+        return (self._rows is not None and self.key in patients.columns
+                and self.input_columns(patients) == (self.dimensions, self.measures)
+                and self._rows[self.key].is_unique)
+
+    def changed_rows(self, patients):
+        """Rows of a new patient frame that are new or differ from the cube's version, and removed keys"""
+        columns = self.row_columns()
+        current = patients[[self.key] + columns].reset_index(drop=True)
+        previous = self._rows
+        if len(current) == len(previous) and current[self.key].equals(previous[self.key]):
+            aligned = previous
+            is_changed = np.zeros(len(current), dtype=bool)
+            removed = previous[self.key].iloc[:0]
+        else:
+            position = IncrementalPatientProcessor.align_rows(previous[self.key], current[self.key])
+            aligned = previous.take(np.maximum(position, 0)).reset_index(drop=True)
+            is_changed = position < 0
+            is_kept = np.zeros(len(previous), dtype=bool)
+            is_kept[position[position >= 0]] = True
+            removed = previous[self.key][~is_kept]
+        for column in columns:
+            new, old = current[column], aligned[column]
+            if new.dtype != old.dtype:
+                new, old = new.astype(object), old.astype(object)
+            is_changed |= (new.ne(old) & ~(new.isna() & old.isna())).to_numpy(dtype=bool)
+        return patients[is_changed], removed
+
+    def refresh(self, changed_rows, removed_keys=None):
+        """Update the cells for patients that were added, changed or removed
+
+        changed_rows holds the new versions of added or changed patients and
+        removed_keys the keys of patients that are gone (see changed_rows()).
+        Old versions come out of their cells and new versions go in, so only
+        the affected cells change.
+        """
+        outgoing_keys = list(changed_rows[self.key])
+        if removed_keys is not None:
+            outgoing_keys += list(removed_keys)
+        is_outgoing = self._rows[self.key].isin(outgoing_keys).to_numpy()
+
+        incoming = self.aggregate(changed_rows, self.dimensions, self.measures)
+        outgoing = self.aggregate(self._rows[is_outgoing], self.dimensions, self.measures)
+        outgoing[self.value_columns] = -outgoing[self.value_columns]
+        delta = pd.concat([incoming, outgoing], ignore_index=True)
+        if self.dimensions:
+            delta = delta.groupby(self.dimensions, observed=True, sort=False, dropna=False).sum().reset_index()
+        self._apply_delta(delta)
+
+        self._rows = pd.concat([self._rows[~is_outgoing], changed_rows[self._rows.columns]], ignore_index=True)
+        return self
+
+    def _cell_codes(self, column):
+        """Codes and distinct values of a dimension over the cells (missing values get -1)"""
+        if column in self._codes:
+            return self._codes[column]
+        codes, values = pd.factorize(self._buckets, use_na_sentinel=True)
+        return codes, pd.Index(values)
+
+    def _locate_cells(self, delta):
+        """Position of each delta cell among the current cells, -1 for cells not seen yet"""
+        if not self.dimensions:
+            return np.zeros(len(delta), dtype=np.int64)
+        if self._cell_index is None:
+            self._cell_index = pd.MultiIndex.from_arrays([self._cell_codes(col)[0] for col in self.dimensions])
+        delta_codes = []
+        unseen = np.zeros(len(delta), dtype=bool)
+        for column in self.dimensions:
+            codes = self._cell_codes(column)[1].get_indexer(delta[column])
+            # -1 from get_indexer is either a missing value (as in the cells) or a new value
+            unseen |= (codes < 0) & delta[column].notna().to_numpy()
+            delta_codes.append(codes)
+        position = self._cell_index.get_indexer(pd.MultiIndex.from_arrays(delta_codes))
+        position[unseen] = -1
+        return position
+
+    def _apply_delta(self, delta):
+        """Add delta cells to the matching cells, appending combinations seen for the first time"""
+        position = self._locate_cells(delta)
+        found = position >= 0
+        values = self._values.copy()
+        values[position[found]] += delta.loc[found, self.value_columns].to_numpy(dtype=float)
+        # Emptied cells are zeroed exactly so float residue can't leak into sums
+        values[values[:, self.value_columns.index('patient_count')] == 0] = 0
+
+        cells = self.cells.copy()
+        cells[self.value_columns] = values
+        if found.all():
+            self.cells, self._values = cells, values
+            self._counts = values[:, self.value_columns.index('patient_count')]
+        else:
+            self._set_cells(pd.concat([cells, delta[~found]], ignore_index=True))
+
+    def mask(self, filters=None, dqi_range=None):
+        """Boolean mask of the cells matching the filters
+
+        filters maps a dimension to the values to keep; empty selections and
+        dimensions the cube doesn't have are ignored, as in the sidebar.
+        dqi_range bounds are whole numbers, as on the sidebar slider; the
+        upper bound covers that whole point.
+        """
+        selected = np.ones(len(self.cells), dtype=bool)
+        for column, values in (filters or {}).items():
+            if values is None or len(values) == 0 or column not in self._codes:
+                continue
+            codes, categories = self._codes[column]
+            # Last slot catches missing values (code -1)
+            allowed = np.append(categories.isin(list(values)), False)
+            selected &= allowed[codes]
+        if dqi_range is not None and self._buckets is not None:
+            selected &= (self._buckets >= dqi_range[0]) & (self._buckets <= dqi_range[1])
+        return selected
+
+    def totals(self, filters=None, dqi_range=None, mask=None):
+        """Summed cell values for the filters
+
+        Pass a mask from mask() to reuse one filter pass for several queries.
+        """
+        if mask is None:
+            mask = self.mask(filters, dqi_range)
+        return pd.Series(self._values[mask].sum(axis=0), index=self.value_columns)
+
+    def count(self, filters=None, dqi_range=None):
+        """Number of patients matching the filters"""
+        return int(self._counts[self.mask(filters, dqi_range)].sum())
+
+    def grouped(self, column, filters=None, dqi_range=None, mask=None, value_column='patient_count', where=None):
+        """Sum of one value column per value of a dimension
+
+        where optionally restricts to cells whose dimension equals a value,
+        given as (dimension, value).
+        """
+        if column not in self._codes:
+            return pd.Series(dtype=float)
+        if mask is None:
+            mask = self.mask(filters, dqi_range)
+        if where is not None:
+            where_codes, where_categories = self._codes[where[0]]
+            position = where_categories.get_indexer([where[1]])[0]
+            mask = mask & (where_codes == position) if position >= 0 else np.zeros_like(mask)
+        codes, categories = self._codes[column]
+        selected = mask & (codes >= 0)
+        weights = self._values[selected, self.value_columns.index(value_column)]
+        sums = np.bincount(codes[selected], weights=weights, minlength=len(categories))
+        return pd.Series(sums, index=categories)
+
+    def value_counts(self, column, filters=None, dqi_range=None, mask=None):
+        """Patients per value of one dimension, largest first, dropping empty values"""
+        counts = self.grouped(column, filters, dqi_range, mask).astype('int64')
+        return counts[counts > 0].sort_values(ascending=False)
+
+    def summary(self, filters=None, dqi_range=None):
+        """KPI summary for the filters, in the format of DataHelper.calculate_summary_statistics"""
+        mask = self.mask(filters, dqi_range)
+        totals = self.totals(mask=mask)
+        count = int(totals['patient_count'])
+        if count == 0:
+            return dict(EMPTY_SUMMARY)
+
+        clean_patients = int(self.grouped('clean_status', mask=mask).get('Clean', 0))
+        summary = {
+            'total_patients': count,
+            'clean_patients': clean_patients,
+            'clean_percentage': round(clean_patients / count * 100, 1),
+            'avg_dqi': round(totals.get('dqi_score_sum', 0) / count, 1),
+            'total_open_queries': int(totals.get('open_queries_sum', 0)),
+            'total_safety_issues': int(totals.get('safety_issues_sum', 0)),
+            'active_patients': int(self.grouped('subject_status', mask=mask).get('Active', 0)),
+        }
+        if 'dqi_score' in self.measures:
+            variance = totals['dqi_score_sq'] / count - (totals['dqi_score_sum'] / count) ** 2
+            summary['dqi_std'] = round(float(np.sqrt(max(variance, 0))), 1)
+
+        summary['dqi_status'] = 'Good' if summary['avg_dqi'] >= 75 else \
+                               ('Warning' if summary['avg_dqi'] >= 60 else 'Critical')
+        summary['clean_status'] = 'Good' if summary['clean_percentage'] >= 70 else \
+                                 ('Warning' if summary['clean_percentage'] >= 50 else 'Critical')
+        return summary
+
+    def measure_mean(self, column, filters=None, dqi_range=None, mask=None):
+        """Mean of a measure over the matching patients"""
+        totals = self.totals(filters, dqi_range, mask)
+        count = totals['patient_count']
+        return float(totals.get(f'{column}_sum', 0) / count) if count > 0 else 0.0
+
+    def measure_sum(self, column, filters=None, dqi_range=None, mask=None):
+        """Sum of a measure over the matching patients"""
+        return self.totals(filters, dqi_range, mask).get(f'{column}_sum', 0)
+
+    def crosstab(self, rows, columns, filters=None, dqi_range=None, mask=None):
+        """Patient counts for every pair of values of two dimensions"""
+        if rows not in self._codes or columns not in self._codes:
+            return pd.DataFrame()
+        if mask is None:
+            mask = self.mask(filters, dqi_range)
+        row_codes, row_categories = self._codes[rows]
+        column_codes, column_categories = self._codes[columns]
+        selected = mask & (row_codes >= 0) & (column_codes >= 0)
+        flat = row_codes[selected] * len(column_categories) + column_codes[selected]
+        counts = np.bincount(flat, weights=self._counts[selected],
+                             minlength=len(row_categories) * len(column_categories))
+        table = pd.DataFrame(counts.reshape(len(row_categories), len(column_categories)).astype('int64'),
+                             index=row_categories, columns=column_categories)
+        return table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+
+    def site_summary(self, filters=None, dqi_range=None):
+        """Per-site patient, clean and active counts, clean percentage, average DQI and open queries"""
+        if 'site_id' not in self._codes:
+            return pd.DataFrame()
+        mask = self.mask(filters, dqi_range)
+        summary = pd.DataFrame({'patient_count': self.grouped('site_id', mask=mask)})
+        for column, value, name in [('clean_status', 'Clean', 'clean_count'),
+                                    ('subject_status', 'Active', 'active_count')]:
+            if column in self._codes:
+                summary[name] = self.grouped('site_id', mask=mask, where=(column, value))
+        if 'dqi_score' in self.measures:
+            summary['dqi_sum'] = self.grouped('site_id', mask=mask, value_column='dqi_score_sum')
+        if 'open_queries' in self.measures:
+            summary['total_open_queries'] = self.grouped('site_id', mask=mask, value_column='open_queries_sum')
+
+        summary = summary[summary['patient_count'] > 0].copy()
+        if 'clean_count' in summary.columns:
+            summary['clean_percentage'] = (summary['clean_count'] / summary['patient_count'] * 100).round(1)
+        if 'dqi_sum' in summary.columns:
+            summary['avg_dqi'] = (summary.pop('dqi_sum') / summary['patient_count']).round(1)
+        count_columns = [col for col in ['patient_count', 'clean_count', 'active_count', 'total_open_queries']
+                         if col in summary.columns]
+        summary[count_columns] = summary[count_columns].astype('int64')
+        summary.index.name = 'site_id'
+        return summary
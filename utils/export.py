@@ -0,0 +1,104 @@
+"""
+Cached CSV exports of the patient table
+
+An export is written to disk in row chunks, so the whole CSV never exists as
+one string. Files are keyed by the dataset version, the exported rows (in
+export order) and the columns, so downloading the same view again reuses the
+file.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from config import EXPORT_CACHE
+from utils.cache import ProcessedDataCache
+
+
+class CsvExportCache:
+    """Write patient CSV exports on demand and keep recent ones on disk"""
+
+    def __init__(self, patients, directory=None, max_entries=None, max_size_mb=None, chunksize=None,
+                 version=None):
+        self.patients = patients
+        self.directory = directory or EXPORT_CACHE['directory']
+        self.max_entries = max_entries if max_entries is not None else EXPORT_CACHE['max_entries']
+        self.max_size_mb = max_size_mb if max_size_mb is not None else EXPORT_CACHE['max_size_mb']
+        self.chunksize = chunksize or EXPORT_CACHE['chunksize']
+        self._version = version
+
+    def dataset_version(self):
+        """Content hash of the patient frame, unless given; computed on the first export"""
+        if self._version is None:
+            self._version = ProcessedDataCache.frame_digest(self.patients)
+        return self._version
+
+    def export_key(self, positions, columns):
+        """Key for exporting the rows at positions (None = every row) with columns"""
+        if positions is None:
+            rows = 'all'
+        else:
+            rows = hashlib.blake2b(np.ascontiguousarray(positions, dtype=np.int64).tobytes(),
+                                   digest_size=16).hexdigest()
+        payload = json.dumps([self.dataset_version(), rows, list(columns)])
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def entry_path(self, key):
+        """File holding one export"""
+        return os.path.join(self.directory, f'{key}.csv')
+
+    def write_csv(self, path, positions, columns):
+        """Write the rows to path chunk by chunk"""
+        num_rows = len(self.patients) if positions is None else len(positions)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', newline='', encoding='utf-8') as handle:
+            if num_rows == 0:
+                self.patients.iloc[:0][columns].to_csv(handle, index=False)
+            for start in range(0, num_rows, self.chunksize):
+                stop = min(start + self.chunksize, num_rows)
+                if positions is None:
+                    chunk = self.patients.iloc[start:stop][columns]
+                else:
+                    chunk = self.patients.take(positions[start:stop])[columns]
+                chunk.to_csv(handle, index=False, header=(start == 0))
+        os.replace(temp_path, path)
+
+    def export(self, positions, columns):
+        """Path of the CSV for these rows and columns, written only if not cached"""
+        columns = list(columns)
+        key = self.export_key(positions, columns)
+        path = self.entry_path(key)
+        if os.path.exists(path):
+            # Mark as recently used for eviction
+            os.utime(path)
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_csv(path, positions, columns)
+        self.evict(keep=path)
+        return path
+
+    def entries(self):
+        """Cached exports as (path, size in bytes, last used), newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = [(entry.path, entry.stat().st_size, entry.stat().st_mtime)
+                 for entry in os.scandir(self.directory)
+                 if entry.is_file() and entry.name.endswith('.csv')]
+        return sorted(found, key=lambda item: item[2], reverse=True)
+
+    def evict(self, keep=None):
+        """Drop least recently used exports beyond max_entries or max_size_mb"""
+        max_bytes = self.max_size_mb * 1024 ** 2
+        total = 0
+        kept = 0
+        removed = []
+        entries = self.entries()
+        # The export just written is always kept
+        entries.sort(key=lambda item: item[0] != keep)
+        for path, size, _ in entries:
+            if path == keep or (kept < self.max_entries and total + size <= max_bytes):
+                total += size
+                kept += 1
+            else:
+                os.remove(path)
+                removed.append(path)
+        return removed
@@ -0,0 +1,104 @@
+"""
+Shared cache of built Plotly figures
+
+Figures are keyed by a canonical hash of (figure type, dataset version,
+applied filters), so every rerun and every session looking at the same view
+reuses the same figure objects. The cache is bounded by the serialized size
+of the figures it holds and evicts the least recently used first. Cached
+figures are shared, so callers must not modify them.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+import numpy as np
+from config import FIGURE_CACHE
+
+
+class FigureCache:
+    """LRU cache of figures bounded by their serialized size"""
+
+    def __init__(self, max_size_mb=None):
+        max_size_mb = max_size_mb if max_size_mb is not None else FIGURE_CACHE['max_size_mb']
+        self.max_bytes = int(max_size_mb * 1024 ** 2)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def canonical(value):
+        """JSON-ready form of a filter value, equal for equal selections
+
+        Lists, tuples and sets are treated as selections, so their order
+        does not matter.
+        """
+        if isinstance(value, dict):
+            return {str(key): FigureCache.canonical(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+            return sorted((FigureCache.canonical(item) for item in value), key=repr)
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def figure_key(figure_type, dataset_version, filters=None):
+        """Canonical hash of a figure's inputs"""
+        payload = json.dumps([figure_type, dataset_version, FigureCache.canonical(filters)],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def figure_size(figures):
+        """Serialized size of a figure or a tuple of figures, in bytes"""
+        if isinstance(figures, (list, tuple)):
+            return sum(FigureCache.figure_size(figure) for figure in figures)
+        return len(figures.to_json())
+
+    def get_or_build(self, figure_type, dataset_version, filters, build):
+        """The cached figure(s) for these inputs, calling build() on a miss"""
+        key = self.figure_key(figure_type, dataset_version, filters)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Build outside the lock so other sessions are not held up
+        figures = build()
+        size = self.figure_size(figures)
+        if size > self.max_bytes:
+            return figures
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (figures, size)
+                self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+        return figures
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size_mb': round(self.size_bytes / 1024 ** 2, 2),
+        }
+
+    def clear(self):
+        """Drop every cached figure"""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
@@ -0,0 +1,171 @@
+"""
+Bitmap index filter engine for the patient table
+
+Every value of a categorical column gets a precomputed bitmap (packed, one
+bit per patient). Sidebar selections OR the bitmaps of the chosen values and
+AND the columns together; numeric ranges come from a sorted index. Only the
+final row selection is materialized, once.
+"""
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+BITMAP_COLUMNS = ['site_id', 'subject_status', 'clean_status', 'risk_level',
+                  'disease', 'trial_id', 'region']
+RANGE_COLUMNS = ['dqi_score', 'enrollment_date']
+# Columns filtered with a whole-number slider: the upper bound covers that whole point
+WHOLE_POINT_COLUMNS = ['dqi_score']
+
+
+class BitmapFilterEngine:
+    """Filter a patient frame with bitmap and sorted indexes"""
+
+    def __init__(self, patients, bitmap_columns=None, range_columns=None):
+        self.patients = patients
+        self.num_rows = len(patients)
+        self.bitmaps = {}
+        self.sorted_indexes = {}
+        for column in bitmap_columns or BITMAP_COLUMNS:
+            if column in patients.columns:
+                self.bitmaps[column] = self.build_bitmaps(patients[column])
+        for column in range_columns or RANGE_COLUMNS:
+            if column in patients.columns:
+                self.sorted_indexes[column] = self.build_sorted_index(patients[column])
+
+    @staticmethod
+    def build_bitmaps(series):
+        """Packed bitmap of the rows holding each value of a column"""
+        codes, values = pd.factorize(series, use_na_sentinel=True)
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        bitmaps = {}
+        rows = np.zeros(len(series), dtype=bool)
+        for position, value in enumerate(values):
+            members = order[boundaries[position]:boundaries[position + 1]]
+            rows[members] = True
+            bitmaps[value] = np.packbits(rows)
+            rows[members] = False
+        return bitmaps
+
+    @staticmethod
+    def build_sorted_index(series):
+        """Sorted values, the row each came from, and each row's rank in that order
+
+        Numbers sort as float64 and dates as datetime64. Missing values are
+        left out of the order and get a rank past the end.
+        """
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.to_numpy(dtype='datetime64[ns]')
+            missing = np.isnat(values)
+        else:
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+            missing = np.isnan(values)
+        order = np.argsort(values, kind='stable')
+        order = order[~missing[order]]
+        ranks = np.full(len(values), len(values), dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        return values[order], order, ranks
+
+    def range_bitmap(self, column, low=None, high=None):
+        """Packed bitmap of the rows in a value range"""
+        sorted_values, order, ranks = self.sorted_indexes[column]
+        start, stop = self.range_bounds(column, low, high)
+        if (stop - start) * 16 < self.num_rows:
+            # Narrow range: set the few matching rows directly
+            rows = np.zeros(self.num_rows, dtype=bool)
+            rows[order[start:stop]] = True
+        else:
+            # Wide range: a sequential pass over the ranks beats scattered writes
+            rows = (ranks >= start) & (ranks < stop)
+        return np.packbits(rows)
+
+    def value_bitmap(self, column, values):
+        """Rows whose column holds any of the values (bitwise OR of their bitmaps)"""
+        column_bitmaps = self.bitmaps[column]
+        selected = [column_bitmaps[value] for value in values if value in column_bitmaps]
+        if not selected:
+            return np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(selected) if len(selected) > 1 else selected[0]
+
+    def _bound(self, column, value, upper):
+        """Convert a range bound to the index's type
+
+        For a date column a plain date as the upper bound covers that whole day;
+        likewise a whole-number upper bound covers that whole point for the
+        slider-filtered columns in WHOLE_POINT_COLUMNS.
+        """
+        sorted_values = self.sorted_indexes[column][0]
+        if value is None:
+            return value
+        if sorted_values.dtype.kind != 'M':
+            if upper and column in WHOLE_POINT_COLUMNS and float(value).is_integer():
+                return np.nextafter(float(value) + 1, -np.inf)
+            return value
+        timestamp = pd.Timestamp(value)
+        if upper and not isinstance(value, datetime):
+            timestamp += pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+        return np.datetime64(timestamp, 'ns')
+
+    def range_bounds(self, column, low=None, high=None):
+        """Slice of the sorted index with low <= value <= high, by binary search"""
+        sorted_values = self.sorted_indexes[column][0]
+        low = self._bound(column, low, upper=False)
+        high = self._bound(column, high, upper=True)
+        start = 0 if low is None else int(np.searchsorted(sorted_values, low, side='left'))
+        stop = len(sorted_values) if high is None else int(np.searchsorted(sorted_values, high, side='right'))
+        return start, stop
+
+    def covers_all(self, column, bounds):
+        """Whether a range keeps every row, so it needn't be applied"""
+        sorted_values = self.sorted_indexes[column][0]
+        if len(sorted_values) != self.num_rows:
+            # Missing values are dropped by any range
+            return False
+        start, stop = self.range_bounds(column, *bounds)
+        return start == 0 and stop == self.num_rows
+
+    def range_positions(self, column, low=None, high=None):
+        """Rows with low <= value <= high, in sorted order"""
+        start, stop = self.range_bounds(column, low, high)
+        return self.sorted_indexes[column][1][start:stop]
+
+    def select(self, filters=None, ranges=None):
+        """Row positions matching the filters, in frame order, or None if nothing is filtered
+
+        filters maps a categorical column to the values to keep, ranges maps
+        a range column to (low, high). Empty selections and columns without
+        an index are ignored, as in the sidebar.
+        """
+        active_ranges = {column: bounds for column, bounds in (ranges or {}).items()
+                         if bounds is not None and column in self.sorted_indexes
+                         and not self.covers_all(column, bounds)}
+        active_filters = {column: values for column, values in (filters or {}).items()
+                          if values is not None and len(values) > 0 and column in self.bitmaps}
+
+        if not active_filters and len(active_ranges) == 1:
+            # A lone narrow range is a slice of its sorted index: two binary searches plus the k rows
+            column, bounds = next(iter(active_ranges.items()))
+            start, stop = self.range_bounds(column, *bounds)
+            if (stop - start) * 16 < self.num_rows:
+                return np.sort(self.sorted_indexes[column][1][start:stop])
+
+        combined = None
+        for column, values in active_filters.items():
+            bitmap = self.value_bitmap(column, values)
+            combined = bitmap if combined is None else combined & bitmap
+
+        for column, bounds in active_ranges.items():
+            bitmap = self.range_bitmap(column, *bounds)
+            combined = bitmap if combined is None else combined & bitmap
+
+        if combined is None:
+            return None
+        # flatnonzero is much faster on a bool view than on the unpacked uint8 bits
+        return np.flatnonzero(np.unpackbits(combined, count=self.num_rows).view(bool))
+
+    def apply(self, filters=None, ranges=None):
+        """The filtered patient frame, materialized once from the final selection"""
+        positions = self.select(filters, ranges)
+        if positions is None:
+            return self.patients
+        return self.patients.take(positions)
@@ -0,0 +1,159 @@
+"""
+Background jobs for reports and exports
+
+Long-running work is handed to a small thread pool so the Streamlit script
+returns immediately. Each job reports its status and progress, and writes its
+result file into a per-user folder, which is removed once it expires.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import BACKGROUND_JOBS
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class Job:
+    """One background task and the file it produces"""
+
+    def __init__(self, job_id, user, label, file_name, mime, path):
+        self.job_id = job_id
+        self.user = user
+        self.label = label
+        self.file_name = file_name
+        self.mime = mime
+        self.path = path
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = 'Waiting for a worker'
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+
+    @property
+    def active(self):
+        """Whether the job is still queued or running"""
+        return self.status in (QUEUED, RUNNING)
+
+    def update(self, fraction, message=None):
+        """Progress callback handed to the task"""
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message:
+            self.message = message
+
+
+class JobQueue:
+    """Run report and export tasks on a bounded worker pool"""
+
+    def __init__(self, max_workers=None, directory=None, ttl_minutes=None, max_active_per_user=None):
+        self.max_workers = max_workers or BACKGROUND_JOBS['max_workers']
+        self.directory = directory or BACKGROUND_JOBS['directory']
+        self.ttl_seconds = (ttl_minutes if ttl_minutes is not None
+                            else BACKGROUND_JOBS['artifact_ttl_minutes']) * 60
+        self.max_active_per_user = max_active_per_user or BACKGROUND_JOBS['max_active_per_user']
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dashboard-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def user_directory(self, user):
+        """Folder holding one user's result files"""
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_-]', '_', str(user)))
+
+    def submit(self, user, label, file_name, mime, task, *args):
+        """Queue task(path, progress, *args) for a user; None if they have too many jobs running
+
+        The task writes its result to path and may call progress(fraction, message).
+        """
+        self.expire()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.user == user and job.active)
+            if active >= self.max_active_per_user:
+                return None
+            job_id = uuid.uuid4().hex[:12]
+            path = os.path.join(self.user_directory(user), f'{job_id}-{file_name}')
+            job = Job(job_id, user, label, file_name, mime, path)
+            self._jobs[job_id] = job
+        job.future = self._executor.submit(self._run, job, task, args)
+        return job
+
+    @staticmethod
+    def _run(job, task, args):
+        """Run one task on a worker thread and record how it ended"""
+        if job.status == CANCELLED:
+            return
+        job.status = RUNNING
+        job.message = 'Running'
+        os.makedirs(os.path.dirname(job.path), exist_ok=True)
+        temp_path = job.path + '.tmp'
+        try:
+            task(temp_path, job.update, *args)
+            os.replace(temp_path, job.path)
+            job.progress = 1.0
+            job.message = 'Ready to download'
+            job.status = DONE
+        except Exception as e:
+            print(f"❌ Background job '{job.label}' failed: {e}")
+            job.error = str(e)
+            job.message = 'Failed'
+            job.status = FAILED
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        finally:
+            job.finished = time.time()
+
+    def jobs(self, user):
+        """A user's jobs, newest first"""
+        self.expire()
+        with self._lock:
+            found = [job for job in self._jobs.values() if job.user == user]
+        return sorted(found, key=lambda job: job.created, reverse=True)
+
+    def get(self, user, job_id):
+        """One of a user's jobs, or None"""
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.user == user else None
+
+    def cancel(self, user, job_id):
+        """Cancel a job that has not started yet"""
+        job = self.get(user, job_id)
+        if job is None or job.status != QUEUED or not job.future.cancel():
+            return False
+        job.status = CANCELLED
+        job.message = 'Cancelled'
+        job.finished = time.time()
+        return True
+
+    def expire(self, now=None):
+        """Forget finished jobs past their expiry and delete their files"""
+        now = now or time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if not job.active and now - job.finished > self.ttl_seconds]
+            for job in expired:
+                del self._jobs[job.job_id]
+                if os.path.exists(job.path):
+                    os.remove(job.path)
+            known = {job.path for job in self._jobs.values()}
+            # Pending and running jobs may be writing their result to a temp file
+            known.update(job.path + '.tmp' for job in self._jobs.values() if job.active)
+        # Result files left behind by an earlier run of the app
+        if os.path.isdir(self.directory):
+            for user_dir in os.scandir(self.directory):
+                if not user_dir.is_dir():
+                    continue
+                for entry in os.scandir(user_dir.path):
+                    if entry.path not in known and now - entry.stat().st_mtime > self.ttl_seconds:
+                        os.remove(entry.path)
+        return expired
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
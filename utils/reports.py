@@ -0,0 +1,197 @@
+"""
+Report tables for the sidebar report generator
+
+Each report is a list of (sheet name, DataFrame) built with vectorized
+groupbys, written to Excel (one sheet per table) or a single HTML page.
+"""
+import html
+import pandas as pd
+
+REPORT_TYPES = ['Executive Summary', 'Site Performance', 'Data Quality', 'Safety Analysis']
+REPORT_FORMATS = {
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'HTML': ('html', 'text/html'),
+}
+# Excel sheets hold at most 1,048,576 rows including the header
+EXCEL_MAX_ROWS = 1048575
+# HTML reports show the first rows of long tables; Excel has them all
+HTML_MAX_ROWS = 1000
+
+
+class ReportBuilder:
+    """Build and write the dashboard's reports"""
+
+    @staticmethod
+    def value_table(series, label):
+        """Counts and percentages of each value of a column"""
+        counts = series.value_counts(dropna=False)
+        return pd.DataFrame({label: counts.index.astype(str), 'patients': counts.to_numpy(),
+                             'percentage': (counts.to_numpy() / max(len(series), 1) * 100).round(1)})
+
+    @staticmethod
+    def site_table(patients, aggregations):
+        """Per-site aggregates of patient columns that exist"""
+        aggregations = {name: spec for name, spec in aggregations.items() if spec[0] in patients.columns}
+        grouped = patients.groupby('site_id', observed=True).agg(**aggregations)
+        return grouped.round(1).reset_index()
+
+    @staticmethod
+    def executive_summary(patients, sites, queries):
+        """Headline KPIs plus status and risk breakdowns"""
+        total = len(patients)
+        clean = int((patients['clean_status'] == 'Clean').sum()) if 'clean_status' in patients.columns else 0
+        kpis = {
+            'Total Patients': total,
+            'Active Patients': int((patients['subject_status'] == 'Active').sum())
+            if 'subject_status' in patients.columns else 0,
+            'Clean Patients': clean,
+            'Clean Percentage': round(clean / total * 100, 1) if total else 0,
+            'Average DQI': round(patients['dqi_score'].mean(), 1) if total else 0,
+            'High Risk Patients': int((patients['risk_level'] == 'High').sum())
+            if 'risk_level' in patients.columns else 0,
+            'Open Queries': int(patients['open_queries'].sum()) if 'open_queries' in patients.columns else 0,
+            'Safety Issues': int(patients['safety_issues'].sum()) if 'safety_issues' in patients.columns else 0,
+            'Sites': len(sites),
+            'Queries Raised': len(queries),
+        }
+        sheets = [('Overview', pd.DataFrame({'metric': list(kpis), 'value': list(kpis.values())}))]
+        for column, name in [('subject_status', 'Patient Status'), ('risk_level', 'Risk Levels'),
+                             ('clean_status', 'Clean Status')]:
+            if column in patients.columns:
+                sheets.append((name, ReportBuilder.value_table(patients[column], column)))
+        return sheets
+
+    @staticmethod
+    def site_performance(patients, sites, queries):
+        """Site scorecards ranked by average DQI"""
+        site_stats = ReportBuilder.site_table(patients, {
+            'patients': ('patient_id', 'size'),
+            'avg_dqi': ('dqi_score', 'mean'),
+            'open_queries': ('open_queries', 'sum'),
+            'missing_visits': ('missing_visits', 'sum'),
+            'protocol_deviations': ('protocol_deviations', 'sum'),
+        })
+        sheets = [('Site Patients', site_stats.sort_values('avg_dqi', ascending=False))]
+        if len(sites) > 0:
+            site_columns = [column for column in ['site_id', 'site_name', 'region', 'cra_in_charge',
+                                                  'total_patients_enrolled', 'patients_active',
+                                                  'clean_percentage', 'avg_dqi', 'performance_status']
+                            if column in sites.columns]
+            scorecards = sites[site_columns]
+            if 'avg_dqi' in scorecards.columns:
+                scorecards = scorecards.sort_values('avg_dqi', ascending=False)
+            sheets.append(('Site Scorecards', scorecards))
+        return sheets
+
+    @staticmethod
+    def data_quality(patients, sites, queries):
+        """DQI distribution, per-site data quality and query status"""
+        bins = pd.cut(patients['dqi_score'], bins=[0, 60, 75, 90, 100.01], right=False,
+                      labels=['< 60', '60-75', '75-90', '90-100'])
+        sheets = [('DQI Distribution', ReportBuilder.value_table(bins, 'dqi_band'))]
+        sheets.append(('Site Data Quality', ReportBuilder.site_table(patients, {
+            'avg_dqi': ('dqi_score', 'mean'),
+            'min_dqi': ('dqi_score', 'min'),
+            'missing_pages': ('missing_pages', 'sum'),
+            'non_conformant_data': ('non_conformant_data', 'sum'),
+            'overdue_crfs': ('overdue_crfs', 'sum'),
+            'coding_backlog': ('coding_backlog', 'sum'),
+        }).sort_values('avg_dqi')))
+        if 'query_status' in queries.columns:
+            sheets.append(('Query Status', ReportBuilder.value_table(queries['query_status'], 'query_status')))
+        return sheets
+
+    @staticmethod
+    def safety_analysis(patients, sites, queries):
+        """Safety and adverse event counts by site and the patients involved"""
+        site_safety = ReportBuilder.site_table(patients, {
+            'patients': ('patient_id', 'size'),
+            'safety_issues': ('safety_issues', 'sum'),
+            'adverse_events': ('adverse_events', 'sum'),
+            'lab_issues': ('lab_issues', 'sum'),
+        })
+        event_columns = [column for column in ['safety_issues', 'adverse_events'] if column in patients.columns]
+        is_flagged = pd.Series(False, index=patients.index)
+        for column in event_columns:
+            is_flagged |= patients[column] > 0
+        patient_columns = [column for column in ['patient_id', 'site_id', 'subject_status', 'safety_issues',
+                                                 'adverse_events', 'lab_issues', 'risk_level']
+                           if column in patients.columns]
+        flagged = patients.loc[is_flagged, patient_columns]
+        if event_columns:
+            site_safety = site_safety.sort_values(event_columns[0], ascending=False)
+            flagged = flagged.sort_values(event_columns[0], ascending=False)
+        return [('Site Safety', site_safety), ('Flagged Patients', flagged)]
+
+    @staticmethod
+    def build(report_type, patients, sites, queries):
+        """Tables of one report type"""
+        builders = {
+            'Executive Summary': ReportBuilder.executive_summary,
+            'Site Performance': ReportBuilder.site_performance,
+            'Data Quality': ReportBuilder.data_quality,
+            'Safety Analysis': ReportBuilder.safety_analysis,
+        }
+        if report_type not in builders:
+            raise ValueError(f"Unknown report type: {report_type}")
+        return builders[report_type](patients, sites, queries)
+
+    @staticmethod
+    def write_excel(path, sheets, progress=None, chunksize=50000):
+        """Write tables to an Excel workbook, chunk by chunk
+
+        Tables longer than an Excel sheet continue on numbered sheets.
+        """
+        total_rows = max(sum(len(df) for _, df in sheets), 1)
+        written = 0
+        # The engine is named because jobs write to a temporary file name
+        with pd.ExcelWriter(path, engine='openpyxl') as writer:
+            for name, df in sheets:
+                if len(df) == 0:
+                    df.to_excel(writer, sheet_name=name[:31], index=False)
+                start = 0
+                while start < len(df):
+                    sheet_number, sheet_row = divmod(start, EXCEL_MAX_ROWS)
+                    stop = min(start + chunksize, len(df), (sheet_number + 1) * EXCEL_MAX_ROWS)
+                    sheet_name = name[:31] if sheet_number == 0 else f"{name[:27]} {sheet_number + 1}"
+                    # Later chunks go below the rows already written, after the header
+                    df.iloc[start:stop].to_excel(writer, sheet_name=sheet_name, index=False,
+                                                 header=(sheet_row == 0),
+                                                 startrow=sheet_row + (sheet_row > 0))
+                    written += stop - start
+                    start = stop
+                    if progress:
+                        progress(written / total_rows, f"Writing {name}")
+
+    @staticmethod
+    def write_html(path, title, sheets, progress=None):
+        """Write tables to a single HTML page"""
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(f"<html><head><meta charset='utf-8'><title>{html.escape(title)}</title></head>"
+                         f"<body style='font-family: Segoe UI, sans-serif'><h1>{html.escape(title)}</h1>")
+            for position, (name, df) in enumerate(sheets, start=1):
+                handle.write(f"<h2>{html.escape(name)}</h2>")
+                handle.write(df.head(HTML_MAX_ROWS).to_html(index=False, border=0))
+                if len(df) > HTML_MAX_ROWS:
+                    handle.write(f"<p><em>First {HTML_MAX_ROWS:,} of {len(df):,} rows - "
+                                 f"generate the Excel report for all of them.</em></p>")
+                if progress:
+                    progress(position / len(sheets), f"Writing {name}")
+            handle.write("</body></html>")
+
+    @staticmethod
+    def write_report(path, progress, report_type, format_name, patients, sites, queries):
+        """Background task: build a report and write it in the chosen format"""
+        progress(0.0, f"Building {report_type}")
+        sheets = ReportBuilder.build(report_type, patients, sites, queries)
+        if format_name == 'Excel':
+            ReportBuilder.write_excel(path, sheets, progress)
+        else:
+            ReportBuilder.write_html(path, report_type, sheets, progress)
+
+    @staticmethod
+    def export_patients_excel(path, progress, patients, positions, columns):
+        """Background task: write the selected patient rows (None = every row) to Excel"""
+        progress(0.0, "Selecting patients")
+        selected = patients if positions is None else patients.take(positions)
+        ReportBuilder.write_excel(path, [('Patients', selected[list(columns)])], progress)
@@ -0,0 +1,152 @@
+"""
+Canonical column types for the patient, site and query frames
+"""
+import numpy as np
+import pandas as pd
+
+# Column kinds:
+#   'category' - enumerations and repeated identifiers
+#   'int'      - counters, downcast to the smallest integer type that fits
+#   'bool'     - yes/no flags
+#   'datetime' - dates
+PATIENT_SCHEMA = {
+    'trial_id': 'category',
+    'disease': 'category',
+    'therapeutic_area': 'category',
+    'site_id': 'category',
+    'region': 'category',
+    'cra_assigned': 'category',
+    'subject_status': 'category',
+    'clean_status': 'category',
+    'risk_level': 'category',
+    'enrollment_date': 'datetime',
+    'last_visit_date': 'datetime',
+    'missing_visits': 'int',
+    'open_queries': 'int',
+    'safety_issues': 'int',
+    'adverse_events': 'int',
+    'serious_adverse_events': 'int',
+    'lab_issues': 'int',
+    'data_entry_errors': 'int',
+    'total_visits_expected': 'int',
+    'visits_completed': 'int',
+    'total_pages_expected': 'int',
+    'pages_completed': 'int',
+    'missing_pages': 'int',
+    'total_queries': 'int',
+    'queries_resolved': 'int',
+    'non_conformant_data': 'int',
+    'coding_backlog': 'int',
+    'overdue_crfs': 'int',
+    'protocol_deviations': 'int',
+    'forms_verified': 'bool',
+    'forms_signed': 'bool',
+    'sdv_completed': 'bool',
+    'frozen_locked': 'bool',
+    'screen_failure': 'bool',
+    'early_termination': 'bool',
+}
+
+SITE_SCHEMA = {
+    'trial_id': 'category',
+    'trial_name': 'category',
+    'disease': 'category',
+    'therapeutic_area': 'category',
+    'site_id': 'category',
+    'site_name': 'category',
+    'region': 'category',
+    'cra_in_charge': 'category',
+    'performance_status': 'category',
+    'site_initiation_date': 'datetime',
+    'total_patients_enrolled': 'int',
+    'patients_active': 'int',
+    'total_open_queries': 'int',
+    'total_safety_issues': 'int',
+    'total_adverse_events': 'int',
+    'monitoring_visits_completed': 'int',
+}
+
+QUERY_SCHEMA = {
+    'trial_id': 'category',
+    'patient_id': 'category',
+    'site_id': 'category',
+    'disease': 'category',
+    'query_type': 'category',
+    'query_description': 'category',
+    'query_priority': 'category',
+    'query_status': 'category',
+    'assigned_to': 'category',
+    'query_created_date': 'datetime',
+    'query_resolved_date': 'datetime',
+    'created_date': 'datetime',
+    'resolved_date': 'datetime',
+    'query_age_days': 'int',
+}
+
+BOOL_VALUES = {True, False, 0, 1}
+
+
+class DataSchema:
+    """Apply the canonical schemas and report the memory they save"""
+
+    @staticmethod
+    def convert_column(series, kind):
+        """Convert one column to its canonical type, leaving it unchanged if the values don't fit"""
+        if kind == 'category':
+            return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+
+        if kind == 'datetime':
+            return pd.to_datetime(series, errors='coerce')
+
+        if kind == 'bool':
+            if series.dtype == bool:
+                return series
+            # Only true yes/no columns; some demo data stores counts under flag names
+            if series.notna().all() and set(series.unique()) <= BOOL_VALUES:
+                return series.astype(bool)
+            return series
+
+        if kind == 'int':
+            if not pd.api.types.is_numeric_dtype(series) or series.isna().any():
+                return series
+            values = series.to_numpy()
+            if not np.array_equal(values, np.round(values)):
+                return series
+            return pd.to_numeric(series.astype(np.int64), downcast='integer')
+
+        raise ValueError(f"Unknown column kind in schema: {kind}")
+
+    @staticmethod
+    def apply(df, schema):
+        """Return a copy of df with every schema column converted"""
+        converted = df.copy()
+        for column, kind in schema.items():
+            if column in converted.columns:
+                converted[column] = DataSchema.convert_column(converted[column], kind)
+        return converted
+
+    @staticmethod
+    def memory_report(before, after):
+        """Compare the deep memory usage of two versions of a frame"""
+        before_bytes = int(before.memory_usage(deep=True).sum())
+        after_bytes = int(after.memory_usage(deep=True).sum())
+        return {
+            'before_mb': round(before_bytes / 1024 ** 2, 2),
+            'after_mb': round(after_bytes / 1024 ** 2, 2),
+            'reduction': round(before_bytes / after_bytes, 1) if after_bytes > 0 else 0
+        }
+
+    @staticmethod
+    def apply_all(patients, sites, queries, verbose=True):
+        """Apply the patient, site and query schemas, printing the memory saved"""
+        frames = []
+        for name, df, schema in [('patients', patients, PATIENT_SCHEMA),
+                                 ('sites', sites, SITE_SCHEMA),
+                                 ('queries', queries, QUERY_SCHEMA)]:
+            converted = DataSchema.apply(df, schema)
+            if verbose and len(df) > 0:
+                report = DataSchema.memory_report(df, converted)
+                print(f"📦 {name}: {report['before_mb']} MB → {report['after_mb']} MB "
+                      f"({report['reduction']}x smaller)")
+            frames.append(converted)
+        return tuple(frames)
@@ -0,0 +1,201 @@
+"""
+Inverted n-gram index for patient search
+
+Each searchable column is indexed by its distinct values: every lowercased
+value is split into byte trigrams, and each trigram points at the values that
+contain it. A query term looks up its trigrams, intersects the posting lists,
+confirms the substring on the few candidate values and maps them to rows.
+
+Queries are whitespace-separated terms that must all match. A plain term
+matches any searchable field; ``field:value`` restricts it to one field,
+e.g. ``site:Site_A active``. Quote values containing spaces:
+``cra:"Dr. Smith"``.
+"""
+import shlex
+import numpy as np
+import pandas as pd
+
+SEARCH_FIELDS = ['patient_id', 'site_id', 'subject_status', 'disease', 'cra_assigned']
+
+FIELD_ALIASES = {
+    'id': 'patient_id',
+    'patient': 'patient_id',
+    'site': 'site_id',
+    'status': 'subject_status',
+    'cra': 'cra_assigned',
+}
+
+NGRAM = 3
+# Merge incremental index segments once there are this many
+MAX_SEGMENTS = 4
+# Stop intersecting posting lists and check substrings directly below this many values
+MAX_VERIFY_CANDIDATES = 256
+
+
+class FieldIndex:
+    """Trigram index over the distinct values of one column, plus their rows"""
+
+    def __init__(self, series):
+        self.values = np.array([], dtype=object)
+        self._lowered = pd.Series([], dtype=object)
+        self._lookup = pd.Index([], dtype=object)
+        self._segments = []
+        self.set_rows(series)
+
+    @staticmethod
+    def value_grams(values, first_id):
+        """(trigram code, value id) pairs for values, sorted by trigram"""
+        encoded = pd.Series(values, dtype=object).str.lower().str.encode('utf-8').to_numpy()
+        if len(encoded) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        width = max(max(len(value) for value in encoded), NGRAM)
+        matrix = np.frombuffer(np.array(encoded, dtype=f'S{width}').tobytes(), dtype=np.uint8)
+        matrix = matrix.reshape(len(encoded), width).astype(np.int64)
+        lengths = np.array([len(value) for value in encoded])
+
+        grams = (matrix[:, :-2] << 16) | (matrix[:, 1:-1] << 8) | matrix[:, 2:]
+        starts = np.arange(width - NGRAM + 1)
+        valid = starts[None, :] <= (lengths[:, None] - NGRAM)
+        value_ids = np.broadcast_to(np.arange(first_id, first_id + len(encoded))[:, None], grams.shape)
+
+        grams, value_ids = grams[valid], value_ids[valid]
+        order = np.lexsort((value_ids, grams))
+        return grams[order], value_ids[order]
+
+    def set_rows(self, series):
+        """Point the index at a (new) version of the column
+
+        Only values not seen before are split into trigrams; rows are remapped
+        with one factorize of the column.
+        """
+        strings = series.astype(object).where(series.notna(), None)
+        codes, uniques = pd.factorize(strings, use_na_sentinel=True)
+        uniques = np.asarray(uniques, dtype=object).astype(str)
+
+        known = self._lookup.get_indexer(uniques) if len(self._lookup) else np.full(len(uniques), -1)
+        new_values = uniques[known == -1]
+        if len(new_values) > 0:
+            first_id = len(self.values)
+            self._segments.append(self.value_grams(new_values, first_id))
+            known[known == -1] = np.arange(first_id, first_id + len(new_values))
+            self.values = np.concatenate([self.values, new_values.astype(object)])
+            self._lowered = pd.Series(self.values, dtype=object).str.lower()
+            self._lookup = pd.Index(self.values)
+            if len(self._segments) > MAX_SEGMENTS:
+                grams = np.concatenate([segment[0] for segment in self._segments])
+                value_ids = np.concatenate([segment[1] for segment in self._segments])
+                order = np.lexsort((value_ids, grams))
+                self._segments = [(grams[order], value_ids[order])]
+
+        # Rows grouped by value id: rows of value v are order[offsets[v]:offsets[v + 1]]
+        row_values = np.where(codes >= 0, known[codes], len(self.values))
+        self._row_order = np.argsort(row_values, kind='stable')
+        self._offsets = np.searchsorted(row_values[self._row_order], np.arange(len(self.values) + 1))
+
+    def matching_values(self, term):
+        """Ids of the values containing term (case-insensitive)"""
+        term = term.lower()
+        encoded = term.encode('utf-8')
+        if len(encoded) < NGRAM:
+            # Too short for trigrams: check every distinct value
+            candidates = np.arange(len(self.values))
+        else:
+            grams = {(encoded[i] << 16) | (encoded[i + 1] << 8) | encoded[i + 2]
+                     for i in range(len(encoded) - NGRAM + 1)}
+            postings = sorted((self.postings(gram) for gram in grams), key=len)
+            # Rarest trigrams first; once few candidates remain the substring check is cheaper
+            candidates = np.unique(postings[0])
+            for posting in postings[1:]:
+                if len(candidates) <= MAX_VERIFY_CANDIDATES:
+                    break
+                candidates = np.intersect1d(candidates, posting)
+        if len(candidates) == 0:
+            return candidates
+        lowered = self._lowered.iloc[candidates]
+        return candidates[lowered.str.contains(term, regex=False).to_numpy(dtype=bool)]
+
+    def postings(self, gram):
+        """Ids of the values containing a trigram"""
+        if not self._segments:
+            return np.array([], dtype=np.int64)
+        return np.concatenate([
+            value_ids[np.searchsorted(segment_grams, gram, 'left'):np.searchsorted(segment_grams, gram, 'right')]
+            for segment_grams, value_ids in self._segments
+        ])
+
+    def rows(self, value_ids):
+        """Row positions holding any of the values"""
+        starts = self._offsets[value_ids]
+        lengths = self._offsets[value_ids + 1] - starts
+        if lengths.sum() == 0:
+            return np.array([], dtype=np.int64)
+        # Concatenate the slices order[start:start + length] without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self._row_order[offsets + np.arange(lengths.sum())]
+
+
+class PatientSearchIndex:
+    """Search patients by id, site, status, disease or CRA"""
+
+    def __init__(self, patients, fields=None):
+        self.num_rows = 0
+        self.fields = {}
+        self.refresh(patients, fields)
+
+    def refresh(self, patients, fields=None):
+        """Index a new version of the patient frame, reusing what is already indexed"""
+        for column in fields or SEARCH_FIELDS:
+            if column not in patients.columns:
+                continue
+            if column in self.fields:
+                self.fields[column].set_rows(patients[column])
+            else:
+                self.fields[column] = FieldIndex(patients[column])
+        self.fields = {column: index for column, index in self.fields.items() if column in patients.columns}
+        self.num_rows = len(patients)
+        return self
+
+    @staticmethod
+    def parse_query(query):
+        """Split a query into (field or None, term) pairs"""
+        try:
+            tokens = shlex.split(query)
+        except ValueError:
+            tokens = query.split()
+        terms = []
+        for token in tokens:
+            field, separator, value = token.partition(':')
+            if separator and value:
+                terms.append((FIELD_ALIASES.get(field.lower(), field.lower()), value))
+            else:
+                terms.append((None, token))
+        return terms
+
+    def term_rows(self, field, term):
+        """Rows where the field (or any field) contains the term"""
+        if field is not None:
+            if field not in self.fields:
+                return np.array([], dtype=np.int64)
+            index = self.fields[field]
+            return np.sort(index.rows(index.matching_values(term)))
+        matches = [index.rows(index.matching_values(term)) for index in self.fields.values()]
+        if sum(len(rows) for rows in matches) * 32 > self.num_rows:
+            # Large result: a row mask unions faster than sorting
+            selected = np.zeros(self.num_rows, dtype=bool)
+            for rows in matches:
+                selected[rows] = True
+            return np.flatnonzero(selected)
+        return np.unique(np.concatenate(matches)) if matches else np.array([], dtype=np.int64)
+
+    def search(self, query):
+        """Sorted row positions matching every term of the query, or None for an empty query"""
+        terms = self.parse_query(query or '')
+        if not terms:
+            return None
+        positions = None
+        for field, term in terms:
+            rows = self.term_rows(field, term)
+            positions = rows if positions is None else np.intersect1d(positions, rows, assume_unique=True)
+            if len(positions) == 0:
+                break
+        return positions
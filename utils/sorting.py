@@ -0,0 +1,56 @@
+"""
+Cached sort permutations for paging through the patient table
+
+Each column's sort order is computed once per dataset and kept as a rank per
+row. A page of any filtered selection is then picked with argpartition on
+the selection's ranks, so showing one page never sorts the whole frame.
+"""
+import numpy as np
+import pandas as pd
+
+
+class SortPermutationCache:
+    """Per-column sort orders of a patient frame, reused for every filter and page"""
+
+    def __init__(self, patients):
+        self.patients = patients
+        self.num_rows = len(patients)
+        self._orders = {}
+
+    def order(self, column, ascending=True):
+        """(rows in sorted order, rank of each row) for a column
+
+        Ties keep frame order and missing values sort last, in both directions.
+        """
+        key = (column, ascending)
+        if key not in self._orders:
+            codes, uniques = pd.factorize(self.patients[column], sort=True, use_na_sentinel=True)
+            keys = codes if ascending else (len(uniques) - 1) - codes
+            keys = np.where(codes < 0, len(uniques), keys)
+            order = np.argsort(keys, kind='stable')
+            ranks = np.empty(self.num_rows, dtype=np.int64)
+            ranks[order] = np.arange(self.num_rows)
+            self._orders[key] = (order, ranks)
+        return self._orders[key]
+
+    def page(self, column, ascending, start, stop, positions=None):
+        """Row positions of sorted rows start..stop-1 of a selection (None = every row)"""
+        order, ranks = self.order(column, ascending)
+        if positions is None:
+            return order[start:stop]
+
+        stop = min(stop, len(positions))
+        if start >= stop:
+            return np.array([], dtype=np.int64)
+        selected_ranks = ranks[positions]
+        # Partition around both page edges: the page's rows land in [start, stop), unsorted
+        window = np.argpartition(selected_ranks, sorted({start, stop - 1}))[start:stop]
+        window = window[np.argsort(selected_ranks[window])]
+        return positions[window]
+
+    def sorted_positions(self, column, ascending, positions=None):
+        """Every row of a selection in sorted order, for exports"""
+        order, ranks = self.order(column, ascending)
+        if positions is None:
+            return order
+        return positions[np.argsort(ranks[positions])]
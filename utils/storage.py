@@ -0,0 +1,130 @@
+"""
+Columnar storage for the data/ directory
+
+Tables are stored as compressed Parquet with the canonical schema from
+utils.schema, so reads skip type inference and can load only the columns
+they need. CSV stays supported for import and export.
+"""
+import os
+import pandas as pd
+from utils.schema import DataSchema, PATIENT_SCHEMA, SITE_SCHEMA, QUERY_SCHEMA
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet support is optional; fall back to CSV
+    pq = None
+
+TABLE_SCHEMAS = {
+    'patients': PATIENT_SCHEMA,
+    'sites': SITE_SCHEMA,
+    'queries': QUERY_SCHEMA,
+}
+
+
+class DataStore:
+    """Read and write the patient, site and query tables"""
+
+    @staticmethod
+    def parquet_available():
+        """Whether pyarrow is installed"""
+        return pq is not None
+
+    @staticmethod
+    def table_path(name, data_dir='data', file_format='parquet'):
+        """Path of a table file in the data directory"""
+        return os.path.join(data_dir, f'{name}.{file_format}')
+
+    @staticmethod
+    def write_table(df, name, data_dir='data', compression='zstd'):
+        """Write a table as Parquet with its canonical schema"""
+        if not DataStore.parquet_available():
+            print("⚠️ pyarrow not installed - skipping Parquet output")
+            return None
+        path = DataStore.table_path(name, data_dir)
+        typed = DataSchema.apply(df, TABLE_SCHEMAS[name])
+        typed.to_parquet(path, engine='pyarrow', compression=compression, index=False)
+        return path
+
+    @staticmethod
+    def parquet_is_stale(name, data_dir='data'):
+        """Whether the table's CSV has been modified since its Parquet was written"""
+        parquet_path = DataStore.table_path(name, data_dir)
+        csv_path = DataStore.table_path(name, data_dir, 'csv')
+        return (os.path.exists(parquet_path) and os.path.exists(csv_path)
+                and os.path.getmtime(csv_path) > os.path.getmtime(parquet_path))
+
+    @staticmethod
+    def source_path(name, data_dir='data'):
+        """The file read_table would load for a table
+
+        Parquet is preferred unless the CSV is newer (e.g. regenerated or
+        edited by hand), in which case the CSV is read until import_csv
+        brings the Parquet copy up to date.
+        """
+        parquet_path = DataStore.table_path(name, data_dir)
+        if (DataStore.parquet_available() and os.path.exists(parquet_path)
+                and not DataStore.parquet_is_stale(name, data_dir)):
+            return parquet_path
+        return DataStore.table_path(name, data_dir, 'csv')
+
+    @staticmethod
+    def _warn_if_stale(name, data_dir):
+        """Point at import_csv when a stale Parquet copy is being skipped"""
+        if DataStore.parquet_available() and DataStore.parquet_is_stale(name, data_dir):
+            print(f"⚠️ {name}.csv is newer than {name}.parquet - reading CSV "
+                  f"(run DataStore.import_csv to refresh the Parquet copy)")
+
+    @staticmethod
+    def read_table(name, columns=None, data_dir='data'):
+        """Read a table, preferring Parquet and falling back to CSV
+
+        columns limits the read to those columns; with Parquet only those
+        columns are read from disk.
+        """
+        path = DataStore.source_path(name, data_dir)
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path, engine='pyarrow', columns=columns)
+
+        DataStore._warn_if_stale(name, data_dir)
+        df = pd.read_csv(path, usecols=columns)
+        return DataSchema.apply(df, TABLE_SCHEMAS[name])
+
+    @staticmethod
+    def iter_table_chunks(name, chunksize, columns=None, data_dir='data'):
+        """Yield a table in chunks of at most chunksize rows"""
+        path = DataStore.source_path(name, data_dir)
+        if path.endswith('.parquet'):
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+            return
+
+        DataStore._warn_if_stale(name, data_dir)
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns):
+            yield chunk
+
+    @staticmethod
+    def write_all(patients, sites, queries, data_dir='data'):
+        """Write all three tables as Parquet"""
+        for name, df in [('patients', patients), ('sites', sites), ('queries', queries)]:
+            DataStore.write_table(df, name, data_dir)
+
+    @staticmethod
+    def import_csv(data_dir='data'):
+        """Convert the CSV tables in data_dir to Parquet"""
+        for name in TABLE_SCHEMAS:
+            csv_path = DataStore.table_path(name, data_dir, 'csv')
+            if os.path.exists(csv_path):
+                DataStore.write_table(pd.read_csv(csv_path), name, data_dir)
+
+    @staticmethod
+    def export_csv(data_dir='data'):
+        """Write every stored table back out as CSV"""
+        for name in TABLE_SCHEMAS:
+            source = DataStore.source_path(name, data_dir)
+            csv_path = DataStore.table_path(name, data_dir, 'csv')
+            DataStore.read_table(name, data_dir=data_dir).to_csv(csv_path, index=False)
+            # An exported copy is not newer than the Parquet it came from
+            if source.endswith('.parquet'):
+                source_mtime = os.stat(source).st_mtime_ns
+                os.utime(csv_path, ns=(source_mtime, source_mtime))
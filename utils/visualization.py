@@ -191,7 +191,7 @@ class DashboardVisualizer:
             return go.Figure()
         
         # Create risk matrix
-        risk_matrix = patient_data.groupby(['risk_level', 'clean_status']).size().unstack(fill_value=0)
+        risk_matrix = patient_data.groupby(['risk_level', 'clean_status'], observed=True).size().unstack(fill_value=0)
         
         # Generate hover text - FIXED VERSION
         hover_texts = []